@@ -192,6 +192,32 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 # Logging Configuration
+# core 日志级别；分类流程每封邮件输出多条 INFO 日志，积压处理时可设为 WARNING
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+# 记录每条 SQL 语句（django.db.backends，仅 DEBUG=True 时 Django 才会输出），默认关闭
+LOG_SQL = config('LOG_SQL', default=False, cast=bool)
+# 日志在后台线程中写入（QueueHandler/QueueListener），调用方线程不做文件 I/O
+LOG_ASYNC = config('LOG_ASYNC', default=True, cast=bool)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+# 重复的 INFO 及以下日志（如逐封邮件的处理日志）按模板采样和限速：
+# 每个模板保留 1/LOG_SAMPLE_RATE 条中的一条，且每秒最多 LOG_RATE_LIMIT 条（突发 LOG_RATE_BURST 条），0 表示不限速
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=1.0, cast=float)
+LOG_RATE_LIMIT = config('LOG_RATE_LIMIT', default=20, cast=float)
+LOG_RATE_BURST = config('LOG_RATE_BURST', default=100, cast=int)
+
+_CORE_LOG_FILTERS = ['sample_repeated', 'rate_limit_repeated']
+
+# 访问日志（core.middleware.RequestLoggingMiddleware，每行一条 JSON，写入 logs/access_*.log）
+# 模式: 'off'、'errors'（只记录错误和慢请求）、'sampled'（错误和慢请求全部记录，其余按比例采样）、'full'
+ACCESS_LOG_MODE = config('ACCESS_LOG_MODE', default='sampled')
+ACCESS_LOG_SAMPLE_RATE = config('ACCESS_LOG_SAMPLE_RATE', default=0.1, cast=float)
+# 超过该耗时（毫秒）的请求视为慢请求，总是记录
+ACCESS_LOG_SLOW_MS = config('ACCESS_LOG_SLOW_MS', default=1000, cast=float)
+# 请求体/响应体最多记录的字节数，0 表示不记录正文
+ACCESS_LOG_BODY_BYTES = config('ACCESS_LOG_BODY_BYTES', default=2048, cast=int)
+# 超过该字节数的正文不读取、不解析，只记录长度
+ACCESS_LOG_PARSE_MAX_BYTES = config('ACCESS_LOG_PARSE_MAX_BYTES', default=64 * 1024, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -208,11 +234,23 @@ LOGGING = {
             'format': '[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s',
             'datefmt': '%d/%b/%Y %H:%M:%S'
         },
+        'json': {
+            '()': 'core.log_handlers.JsonFormatter',
+        },
     },
     'filters': {
         'require_debug_true': {
             '()': 'django.utils.log.RequireDebugTrue',
         },
+        'sample_repeated': {
+            '()': 'core.log_handlers.SamplingFilter',
+            'sample_rate': LOG_SAMPLE_RATE,
+        },
+        'rate_limit_repeated': {
+            '()': 'core.log_handlers.RateLimitFilter',
+            'rate': LOG_RATE_LIMIT,
+            'burst': LOG_RATE_BURST,
+        },
     },
     'handlers': {
         'console': {
@@ -228,6 +266,8 @@ LOGGING = {
             'formatter': 'verbose',
             'delay': True,
             'encoding': 'utf-8',
+            # 异步写入时已在 queue_app 中过滤
+            'filters': [] if LOG_ASYNC else _CORE_LOG_FILTERS,
         },
         'file_error': {
             'class': 'logging.handlers.RotatingFileHandler',
@@ -247,6 +287,26 @@ LOGGING = {
             'delay': True,
             'encoding': 'utf-8',
         },
+        'file_access': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(LOGS_DIR, f'access_{datetime.now().strftime("%Y%m%d")}.log'),
+            'maxBytes': 1024 * 1024 * 20,  # 20 MB
+            'backupCount': 5,
+            'formatter': 'json',
+            'delay': True,
+            'encoding': 'utf-8',
+        },
+        'queue_access': {  # 在后台线程中序列化并写入 file_access
+            '()': 'core.log_handlers.AsyncQueueHandler',
+            'handlers': ['cfg://handlers.file_access'],
+            'queue_size': LOG_QUEUE_SIZE,
+        },
+        'queue_app': {  # 在后台线程中写入 console 和 file_app（名称需排在两者之后）
+            '()': 'core.log_handlers.AsyncQueueHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file_app'],
+            'queue_size': LOG_QUEUE_SIZE,
+            'filters': _CORE_LOG_FILTERS,
+        },
     },
     'loggers': {
         '': {  # Root logger
@@ -255,15 +315,20 @@ LOGGING = {
             'propagate': True,
         },
         'core': {  # 应用日志
-            'handlers': ['console', 'file_app'],
-            'level': 'DEBUG',
+            'handlers': ['queue_app'] if LOG_ASYNC else ['console', 'file_app'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
-        'django.db.backends': {  # 数据库日志
-            'handlers': ['file_db'],
-            'level': 'DEBUG',
+        'core.access': {  # 访问日志
+            'handlers': ['queue_access'] if LOG_ASYNC else ['file_access'],
+            'level': 'INFO',
             'propagate': False,
         },
+        'django.db.backends': {  # 数据库日志
+            'handlers': ['file_db'] if LOG_SQL else [],
+            'level': 'DEBUG' if LOG_SQL else 'INFO',
+            'propagate': not LOG_SQL,
+        },
         'django.request': {  # 请求日志
             'handlers': ['file_error'],
             'level': 'ERROR',
@@ -325,4 +390,84 @@ SINGLE_MODEL_CHOICE = 'bert'
 
 # 当 MODEL_EXECUTION_STRATEGY 为 'parallel' 时，是否要求两个模型都超过阈值
 # 如果为 False，则任一模型超过阈值即可
-PARALLEL_REQUIRE_BOTH = True
\ No newline at end of file
+PARALLEL_REQUIRE_BOTH = True
+# 编译后分类规则集的缓存时间（秒）
+# 本进程内的规则修改会通过信号立即失效；该时间用于感知其他进程对规则的修改，设为 0 表示永不过期
+CLASSIFY_RULES_CACHE_TTL = 300
+
+# 规则命中统计：记录每条规则的评估次数、命中次数和评估耗时，并按间隔（秒）写入 cc_rule_hit_stat 表
+RULE_STATS_ENABLED = True
+RULE_STATS_FLUSH_INTERVAL = 60
+
+# 是否将优先级相同的规则按历史命中率从高到低排列；不同优先级之间的顺序不变，
+# 同优先级的多条规则同时匹配同一封邮件时，由命中率高的规则（而不是 id 小的规则）胜出
+RULE_ADAPTIVE_ORDER = False
+
+# 是否输出规则匹配的逐条件调试详情（同时需要 DEBUG 日志级别）
+RULE_DEBUG_TRACE = False
+
+# BERT 批量推理时每次前向计算的邮件数（按 token 数排序分桶，桶内动态填充）
+BERT_BATCH_SIZE = 16
+# BERT 输入的截断长度（token 数）
+BERT_MAX_LENGTH = 512
+
+# MODEL_EXECUTION_STRATEGY 为 'parallel' 时并发执行模型推理的线程数
+PARALLEL_MODEL_WORKERS = 4
+
+# 异步分类（EmailClassifier.aclassify_emails）的并发上限
+# LLM 调用受网络延迟限制，可以较高；FastText/BERT 推理受 CPU 限制
+ASYNC_LLM_CONCURRENCY = 8
+ASYNC_MODEL_CONCURRENCY = 2
+
+# 流式分类（EmailClassifier.iter_classify_emails）每批分类的邮件数，
+# classify_emails 命令未指定 --chunk-size 时同时以此作为每块（每次提交）的邮件数
+CLASSIFY_STREAM_BATCH_SIZE = 100
+
+# Prometheus 指标端点（/api/metrics）；设置 METRICS_TOKEN 后抓取时需要 Authorization: Bearer <token>。
+# 未设置 METRICS_TOKEN 时只允许来自 METRICS_ALLOWED_NETWORKS（默认为本机和内网地址）的请求。
+# 指标中包含分类名称和流量信息，部署在反向代理之后时 REMOTE_ADDR 是代理的地址，应设置 METRICS_TOKEN。
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_NETWORKS = config(
+    'METRICS_ALLOWED_NETWORKS',
+    default='127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16',
+    cast=lambda value: [network.strip() for network in value.split(',') if network.strip()],
+)
+
+# 批量保存分类结果（EmailClassifier.persist_results）时每条 UPDATE 语句更新的邮件数
+CLASSIFY_PERSIST_BATCH_SIZE = 200
+
+# 分类任务队列（classify_worker 命令）：每次认领的任务数、租约秒数、最大尝试次数和重试基础延迟秒数
+CLASSIFY_QUEUE_BATCH_SIZE = 50
+CLASSIFY_QUEUE_LEASE_SECONDS = 300
+CLASSIFY_QUEUE_MAX_ATTEMPTS = 3
+CLASSIFY_QUEUE_RETRY_DELAY = 60
+
+# 模型分类结果缓存：内容相同的邮件直接复用 FastText/BERT/LLM 的分类结果
+# 后端可选值: 'local'（进程内 LRU）, 'django'（使用 CACHES 中的 CLASSIFICATION_CACHE_ALIAS）, 'db'（cc_classification_cache 表）, 'none'
+CLASSIFICATION_CACHE_BACKEND = 'local'
+CLASSIFICATION_CACHE_ALIAS = 'default'
+CLASSIFICATION_CACHE_TTL = 86400
+CLASSIFICATION_CACHE_MAX_ENTRIES = 10000
+
+# 从 HTML 正文中最多提取的字符数（0 表示不限制），达到后不再解析剩余的 HTML
+EMAIL_TEXT_MAX_CHARS = 20000
+
+# 首次分类时将去除 HTML 后的正文保存到 CCEmail.normalized_text，重新分类时不再解析 HTML
+EMAIL_NORMALIZED_TEXT_PERSIST = True
+
+# 各分类方法的模型版本，更换模型或提示词后修改对应版本号即可使缓存的旧结果失效
+CLASSIFICATION_MODEL_VERSIONS = {
+    'fasttext': '1',
+    'bert': '1',
+    'llm': '1',
+}
+
+# 近似重复检测：未被规则解决的邮件按主题和清洗后正文的 SimHash 聚类，每个簇只有代表邮件进入模型阶段
+NEAR_DUPLICATE_ENABLED = True
+# 相似度阈值（1 - 指纹汉明距离 / 64），0.90 即最多 6 位不同
+NEAR_DUPLICATE_THRESHOLD = 0.90
+# 最近分类邮件的指纹索引大小（LRU），命中的邮件直接继承之前的结果
+NEAR_DUPLICATE_INDEX_SIZE = 5000
+# 词数少于该值的邮件不参与检测
+NEAR_DUPLICATE_MIN_TOKENS = 10
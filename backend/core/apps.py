@@ -15,3 +15,6 @@ class CoreConfig(AppConfig):
         # Register providers
         LLMFactory.register_provider('bert', BertProvider)
         LLMFactory.register_provider('fasttext', FastTextProvider)
+
+        # Connect signal handlers
+        from . import signals  # noqa: F401
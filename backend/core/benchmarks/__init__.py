@@ -0,0 +1,6 @@
+"""
+分类流水线的性能基准
+
+基准只使用合成数据，所有写入数据库的内容都在事务中回滚。
+通过 ``python manage.py benchmark_classifier`` 运行。
+"""
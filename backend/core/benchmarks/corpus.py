@@ -0,0 +1,190 @@
+import random
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+from django.utils import timezone
+from ..models import CCEmail, CCEmailClassifyRule
+from .html import generate_html_email
+
+# 各分类的主题模板和正文关键句，模拟模型看到的内容
+TEMPLATES: Dict[str, Dict[str, List[str]]] = {
+    'purchase': {
+        'subjects': [
+            "Order #{n} confirmation", "Invoice {n} from {company}", "Quote request for {item}",
+            "Payment received for order {n}", "Your {company} purchase has shipped", "PO-{n} approval needed",
+        ],
+        'sentences': [
+            "Please find attached the invoice for order {n}.", "The total amount due is {amount} EUR.",
+            "We would like to request a quote for {qty} units of {item}.", "Your order has been dispatched.",
+        ],
+    },
+    'techsupport': {
+        'subjects': [
+            "Ticket #{n}: {item} not working", "Cannot login to the portal", "Server srv-{n} is down",
+            "Error {code} when exporting reports", "Urgent: VPN connection drops", "Re: ticket #{n} update",
+        ],
+        'sentences': [
+            "Since this morning we get error {code} when opening the application.",
+            "The server srv-{n} stopped responding after the last update.",
+            "Please reset my password, the login page keeps failing.", "Attached is a screenshot of the crash.",
+        ],
+    },
+    'festival': {
+        'subjects': [
+            "Happy New Year from {company}", "Season's greetings", "Invitation: {company} summer party",
+            "Happy holidays!", "Mid-autumn festival wishes",
+        ],
+        'sentences': [
+            "Wishing you and your team a wonderful holiday season.", "Join us for the annual party on Friday.",
+            "Thank you for a great year of cooperation.",
+        ],
+    },
+    'other': {
+        'subjects': [
+            "Weekly newsletter #{n}", "Meeting notes {date}", "Re: project update", "FYI: new office hours",
+            "Your account statement is ready", "Webinar: {item} best practices",
+        ],
+        'sentences': [
+            "Here are the notes from today's meeting.", "Our new office hours start next Monday.",
+            "Read the latest news from {company} in this issue.", "Let me know if you have any questions.",
+        ],
+    },
+}
+# 分类的出现比例
+CATEGORY_WEIGHTS = {'purchase': 0.35, 'techsupport': 0.3, 'festival': 0.05, 'other': 0.3}
+
+COMPANIES = ["Contoso", "Fabrikam", "Northwind", "Tailspin", "Wingtip", "Litware", "Adventure Works"]
+ITEMS = ["laptops", "monitors", "licenses", "toner", "docking stations", "the CRM", "the ERP", "headsets"]
+
+# 发件人：少数高频的系统通知地址加上大量低频的个人地址（近似 Zipf 分布）
+NOTIFICATION_SENDERS = {
+    'purchase': ["orders@shop.contoso.com", "billing@fabrikam.com", "noreply@northwind-store.com"],
+    'techsupport': ["alerts@monitoring.tailspin.io", "helpdesk@wingtip.com"],
+    'festival': ["marketing@litware.com"],
+    'other': ["newsletter@adventure-works.com", "noreply@calendar.example.org"],
+}
+PERSONAL_DOMAINS = ["gmail.com", "outlook.com", "example.org"] + [f"partner{i}.com" for i in range(60)]
+
+ATTACHMENT_TYPES = {
+    'purchase': [("invoice_{n}.pdf", "application/pdf"), ("quote_{n}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")],
+    'techsupport': [("screenshot_{n}.png", "image/png"), ("error_{n}.log", "text/plain")],
+    'festival': [("card.jpg", "image/jpeg")],
+    'other': [("notes_{n}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"), ("agenda.pdf", "application/pdf")],
+}
+
+# 正文规模（字节）：短通知、普通邮件、营销邮件、带长引用的转发邮件
+SIZE_PROFILE: List[Tuple[float, int]] = [(0.5, 2 * 1024), (0.35, 12 * 1024), (0.12, 60 * 1024), (0.03, 400 * 1024)]
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        n=rng.randint(1000, 99999), company=rng.choice(COMPANIES), item=rng.choice(ITEMS),
+        code=rng.choice([401, 403, 500, 502, 504, 1603]), amount=rng.randint(50, 20000),
+        qty=rng.randint(1, 500), date=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    )
+
+
+def _sender(category: str, rng: random.Random) -> str:
+    """约 60% 的邮件来自少数系统通知地址，其余来自长尾的个人地址"""
+    if rng.random() < 0.6:
+        senders = NOTIFICATION_SENDERS[category]
+        # 同一分类内按 1/rank 的权重选择
+        return rng.choices(senders, weights=[1 / (rank + 1) for rank in range(len(senders))])[0]
+    return f"user{int(rng.paretovariate(1.2)) % 5000}@{rng.choice(PERSONAL_DOMAINS)}"
+
+
+def _attachments(category: str, rng: random.Random) -> List[Dict[str, Any]]:
+    """约四分之一的邮件带附件，大小近似对数正态分布"""
+    if rng.random() >= 0.25:
+        return []
+    return [
+        {
+            'name': _fill(name, rng),
+            'size': int(rng.lognormvariate(11, 1.5)),
+            'contentType': content_type,
+            'id': f"att-{rng.getrandbits(32):08x}",
+        }
+        for name, content_type in (rng.choice(ATTACHMENT_TYPES[category]) for _ in range(rng.randint(1, 4)))
+    ]
+
+
+def _body(category: str, rng: random.Random, html_ratio: float) -> str:
+    sentences = " ".join(_fill(sentence, rng) for sentence in rng.sample(
+        TEMPLATES[category]['sentences'], k=min(2, len(TEMPLATES[category]['sentences']))
+    ))
+    if rng.random() >= html_ratio:
+        return sentences
+    weights = [weight for weight, _ in SIZE_PROFILE]
+    size = int(rng.choices([size for _, size in SIZE_PROFILE], weights)[0] * rng.uniform(0.5, 1.5))
+    html = generate_html_email(size, seed=rng.getrandbits(32))
+    # 正文关键句放在正文开头，后面是样式、表格和引用的历史邮件
+    return html.replace("<tr><td>", f"<tr><td><p>{sentences}</p>", 1)
+
+
+def generate_corpus(count: int, seed: int = 0, html_ratio: float = 0.8) -> List[CCEmail]:
+    """
+    生成合成邮件语料（未保存）
+
+    按 CATEGORY_WEIGHTS 的比例生成各分类的邮件：主题来自分类模板，正文为接近真实结构的 HTML
+    （样式、表格、引用历史，规模按 SIZE_PROFILE 分布）或纯文本；发件人集中在少数系统通知地址，
+    其余为长尾的个人地址；约四分之一的邮件带附件元数据。相同 seed 生成的语料完全相同。
+
+    Args:
+        count: 邮件数量
+        seed: 随机种子
+        html_ratio: HTML 正文的比例
+
+    Returns:
+        邮件列表，期望的分类记录在 email.expected_category 上
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    start = timezone.now() - timedelta(days=1)
+    emails = []
+    for i in range(count):
+        category = rng.choices(categories, weights)[0]
+        attachments = _attachments(category, rng)
+        email = CCEmail(
+            message_id=f"bench-{seed}-{i}",
+            subject=_fill(rng.choice(TEMPLATES[category]['subjects']), rng),
+            sender=_sender(category, rng),
+            received_time=start + timedelta(seconds=i * 7),
+            content=_body(category, rng, html_ratio),
+            categories='',
+        )
+        email.update_attachment_info(attachments)
+        email.expected_category = category
+        emails.append(email)
+    return emails
+
+
+def generate_rules() -> List[CCEmailClassifyRule]:
+    """
+    生成与语料对应的分类规则（未保存）
+
+    规则只覆盖部分模板（系统通知发件人域名和明显的主题关键词），其余邮件需要模型分类，
+    与实际部署中规则和模型的分工相近。
+    """
+    return [
+        CCEmailClassifyRule(
+            name="bench-purchase-senders", description="benchmark", classification='purchase', priority=10,
+            sender_domains=["shop.contoso.com", "fabrikam.com"], subject_keywords=[], body_keywords=[],
+        ),
+        CCEmailClassifyRule(
+            name="bench-purchase-invoice", description="benchmark", classification='purchase', priority=9,
+            sender_domains=[], subject_keywords=["invoice", "po-"], body_keywords=[],
+        ),
+        CCEmailClassifyRule(
+            name="bench-techsupport-alerts", description="benchmark", classification='techsupport', priority=8,
+            sender_domains=["monitoring.tailspin.io"], subject_keywords=["ticket #"], body_keywords=[],
+        ),
+        CCEmailClassifyRule(
+            name="bench-festival", description="benchmark", classification='festival', priority=7,
+            sender_domains=[], subject_keywords=["happy", "greetings"], body_keywords=[],
+        ),
+        CCEmailClassifyRule(
+            name="bench-other-newsletter", description="benchmark", classification='other', priority=6,
+            sender_domains=["adventure-works.com"], subject_keywords=["newsletter"], body_keywords=[],
+        ),
+    ]
+
@@ -0,0 +1,131 @@
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List
+from ..services.email_normalizer import extract_text_from_html
+from .rules import WORDS
+
+# 邮件正文规模（字节）：通知类短邮件、营销邮件、带长引用的转发邮件、内联图片/大表格的超大邮件
+CORPUS_PROFILE = [
+    (0.45, 8 * 1024),
+    (0.35, 80 * 1024),
+    (0.15, 400 * 1024),
+    (0.05, 3 * 1024 * 1024),
+]
+
+_STYLE_RULE = ".c{n} {{ font-family: Arial, sans-serif; color: #33{n:04x}; margin: 0 {m}px; }}\n"
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choices(WORDS, k=words))
+    return f"<p style=\"margin:0;padding:4px;font-size:14px\">{text} &amp; more &nbsp;&ndash; &#8364;{rng.randint(1, 999)}</p>\n"
+
+
+def generate_html_email(size: int, seed: int = 0) -> str:
+    """
+    生成接近真实结构的 HTML 邮件
+
+    包含 <head> 中的大段 <style>、追踪脚本、表格布局和内联样式、字符实体、
+    Outlook 条件注释以及逐层嵌套的引用历史邮件，正文文本只占 HTML 的一小部分。
+    """
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Newsletter</title><style type=\"text/css\">\n",
+        "".join(_STYLE_RULE.format(n=n, m=n % 20) for n in range(max(20, size // 2000))),
+        "</style><script>window.dataLayer=[];function track(){return '<p>not content</p>';}</script>",
+        "<!--[if mso]><xml><o:OfficeDocumentSettings><o:AllowPNG/></o:OfficeDocumentSettings></xml><![endif]-->",
+        "</head><body><table width=\"100%\" cellpadding=\"0\" cellspacing=\"0\"><tr><td>",
+    ]
+    length = sum(len(part) for part in parts)
+    depth = 0
+    while length < size:
+        if rng.random() < 0.1:
+            chunk = "<blockquote style=\"border-left:1px solid #ccc;padding-left:8px\"><div>From: someone&lt;a@b.com&gt;</div>"
+            depth += 1
+        elif rng.random() < 0.2:
+            chunk = "<table><tr>" + "".join(
+                f"<td class=\"c{i}\" style=\"padding:2px\">{rng.choice(WORDS)}</td>" for i in range(8)
+            ) + "</tr></table>\n"
+        else:
+            chunk = _paragraph(rng, rng.randint(10, 60))
+        parts.append(chunk)
+        length += len(chunk)
+    parts.append("</blockquote>" * depth)
+    parts.append("<img src=\"https://t.example.com/open.gif\" width=\"1\" height=\"1\"></td></tr></table></body></html>")
+    return "".join(parts)
+
+
+def generate_html_corpus(count: int, seed: int = 0) -> List[str]:
+    """按 CORPUS_PROFILE 的比例生成 HTML 邮件语料"""
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in CORPUS_PROFILE]
+    sizes = [size for _, size in CORPUS_PROFILE]
+    return [
+        generate_html_email(int(rng.choices(sizes, weights)[0] * rng.uniform(0.5, 1.5)), seed=seed + i)
+        for i in range(count)
+    ]
+
+
+def _regex_extract_text(html_content: str) -> str:
+    """优化前的实现：对整个正文依次执行多次正则和字符串替换"""
+    if not html_content:
+        return ""
+    text = re.sub(r'<[^>]+>', ' ', html_content)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.replace('\\r', ' ').replace('\\n', ' ').replace('\\t', ' ')
+    text = text.replace('"', '').replace("'", "")
+    return text.strip()
+
+
+def _measure(extract: Callable[[str], str], corpus: List[str]) -> Dict[str, Any]:
+    latencies = []
+    output_chars = 0
+    for html in corpus:
+        start = time.perf_counter()
+        output_chars += len(extract(html))
+        latencies.append((time.perf_counter() - start) * 1000)
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'total_ms': round(total, 2),
+        'mean_ms': round(total / len(latencies), 3),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        'max_ms': round(latencies[-1], 3),
+        'mb_per_sec': round(sum(len(html) for html in corpus) / 1024 / 1024 / (total / 1000), 2) if total else None,
+        'output_chars': output_chars,
+    }
+
+
+def run_html_benchmark(email_count: int = 200, max_chars: int = 20000) -> Dict[str, Any]:
+    """
+    对比正则实现与流式提取器在 HTML 邮件语料上的耗时
+
+    Args:
+        email_count: 语料中的邮件数量
+        max_chars: 流式提取器的字符预算
+
+    Returns:
+        语料规模和各实现的耗时统计
+    """
+    corpus = generate_html_corpus(email_count)
+    sizes = sorted(len(html) for html in corpus)
+
+    regex = _measure(_regex_extract_text, corpus)
+    streaming_full = _measure(lambda html: extract_text_from_html(html, max_chars=0), corpus)
+    streaming = _measure(lambda html: extract_text_from_html(html, max_chars=max_chars), corpus)
+
+    # 不限预算时，流式提取器不应输出 <style>/<script> 中的内容
+    leaked = sum(1 for html in corpus[:20] if 'font-family' in extract_text_from_html(html, max_chars=0))
+
+    return {
+        'suite': 'html',
+        'emails': email_count,
+        'corpus_mb': round(sum(sizes) / 1024 / 1024, 2),
+        'size_bytes': {'p50': sizes[len(sizes) // 2], 'max': sizes[-1]},
+        'max_chars': max_chars,
+        'regex': regex,
+        'streaming_unbounded': streaming_full,
+        'streaming': streaming,
+        'speedup': round(regex['total_ms'] / streaming['total_ms'], 2) if streaming['total_ms'] else None,
+        'style_leaks': leaked,
+    }
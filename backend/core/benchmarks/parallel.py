@@ -0,0 +1,94 @@
+import time
+from typing import Any, Dict, List
+from django.test import override_settings
+from ..models import CCEmail
+from ..services.ai_classifier import ClassifierFactory
+from ..services.classification_context import ClassificationContext
+from ..services.email_classifier import EmailClassifier
+from .rules import generate_emails
+from .stubs import SimulatedModelTool
+
+
+def _sequential_parallel_strategy(email: CCEmail, context: ClassificationContext) -> Dict[str, Any]:
+    """优化前的 'parallel' 策略：FastText 和 BERT 依次执行，都完成后才决定是否调用 LLM"""
+    require_both = context.require_both
+    fasttext_result = EmailClassifier._classify_by_ai_agent(email, 'fasttext', context)
+    bert_result = EmailClassifier._classify_by_ai_agent(email, 'bert', context)
+    fasttext_passed = context.passes(fasttext_result, 'fasttext')
+    bert_passed = context.passes(bert_result, 'bert')
+
+    if require_both and fasttext_passed and bert_passed:
+        return fasttext_result if fasttext_result['confidence'] >= bert_result['confidence'] else bert_result
+    if not require_both and (fasttext_passed or bert_passed):
+        return fasttext_result if fasttext_passed else bert_result
+    return EmailClassifier._classify_by_ai_agent(email, 'llm', context)
+
+
+def _measure(classify, emails: List[CCEmail], context: ClassificationContext) -> Dict[str, Any]:
+    latencies = []
+    classifications = []
+    for email in emails:
+        start = time.perf_counter()
+        classifications.append(classify(email, context)['classification'])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'classifications': classifications,
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(latencies[len(latencies) // 2], 2),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+    }
+
+
+def run_parallel_benchmark(email_count: int = 50, fasttext_ms: float = 20, bert_ms: float = 80,
+                           llm_ms: float = 300, pass_rate: float = 0.6) -> Dict[str, Any]:
+    """
+    对比 'parallel' 策略顺序执行与并发执行的单封邮件延迟
+
+    使用模拟延迟的分类工具替换工厂中的分类器，不加载真实模型、不调用 LLM。
+
+    Args:
+        email_count: 合成邮件数量
+        fasttext_ms: 模拟的 FastText 推理延迟（毫秒）
+        bert_ms: 模拟的 BERT 推理延迟（毫秒）
+        llm_ms: 模拟的 LLM 调用延迟（毫秒）
+        pass_rate: 每个模型通过阈值的邮件比例
+
+    Returns:
+        两种 PARALLEL_REQUIRE_BOTH 设置下前后的延迟统计
+    """
+    emails = generate_emails(email_count, body_size=200)
+    factory = ClassifierFactory.get_instance()
+    saved = dict(factory._classifiers)
+    factory._classifiers.update({
+        'fasttext': SimulatedModelTool('fasttext', fasttext_ms, pass_rate, seed=1),
+        'bert': SimulatedModelTool('bert', bert_ms, pass_rate, seed=2),
+        'llm': SimulatedModelTool('llm', llm_ms, 1.0, seed=3),
+    })
+
+    results = {}
+    try:
+        for require_both in (True, False):
+            # 关闭分类结果缓存，保证每次都执行（模拟的）模型推理
+            with override_settings(PARALLEL_REQUIRE_BOTH=require_both, CLASSIFICATION_CACHE_BACKEND='none'):
+                context = ClassificationContext.build('stepgo')
+                before = _measure(_sequential_parallel_strategy, emails, context)
+                after = _measure(EmailClassifier._parallel_model_classification, emails, context)
+            results['require_both' if require_both else 'require_any'] = {
+                'mismatches': sum(1 for old, new in zip(before.pop('classifications'), after.pop('classifications'))
+                                  if old != new),
+                'before': before,
+                'after': after,
+                'speedup': round(before['mean_ms'] / after['mean_ms'], 2) if after['mean_ms'] else None,
+            }
+    finally:
+        factory._classifiers.clear()
+        factory._classifiers.update(saved)
+
+    return {
+        'suite': 'parallel',
+        'emails': email_count,
+        'latency_ms': {'fasttext': fasttext_ms, 'bert': bert_ms, 'llm': llm_ms},
+        'pass_rate': pass_rate,
+        **results,
+    }
@@ -0,0 +1,129 @@
+import random
+import time
+from typing import Dict, Any, List
+from django.db import transaction
+from django.utils import timezone
+from ..models import CCEmail, CCEmailClassifyRule
+from ..services.rule_engine import RuleSetCache
+
+CATEGORIES = ["purchase", "techsupport", "festival", "other"]
+WORDS = [
+    "order", "invoice", "quote", "price", "delivery", "support", "error", "ticket",
+    "crash", "login", "holiday", "greetings", "festival", "party", "meeting", "report",
+    "update", "newsletter", "offer", "account", "payment", "refund", "server", "license",
+]
+DOMAINS = [f"vendor{i}.com" for i in range(40)] + ["gmail.com", "outlook.com", "example.org"]
+
+
+def generate_rules(count: int, seed: int = 0) -> List[CCEmailClassifyRule]:
+    """生成合成分类规则（未保存）"""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        rules.append(CCEmailClassifyRule(
+            name=f"bench-rule-{i}",
+            description=f"benchmark rule {i}",
+            sender_domains=rng.sample(DOMAINS[:40], 2) if i % 3 == 0 else [],
+            subject_keywords=[f"{w}-{i}" for w in rng.sample(WORDS, 3)],
+            body_keywords=[f"{w}-{i}" for w in rng.sample(WORDS, 4)] if i % 2 == 0 else [],
+            min_attachments=5 if i % 7 == 0 else 0,
+            max_attachments=None,
+            classification=CATEGORIES[i % len(CATEGORIES)],
+            priority=i,
+            is_active=True,
+        ))
+    return rules
+
+
+def generate_emails(count: int, body_size: int = 4000, seed: int = 0) -> List[CCEmail]:
+    """生成合成邮件（未保存），大部分邮件不会匹配任何规则"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    emails = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=max(1, body_size // 8))
+        body = "<html><body><p>" + " ".join(words) + "</p></body></html>"
+        emails.append(CCEmail(
+            message_id=f"bench-{i}",
+            subject=" ".join(rng.choices(WORDS, k=6)),
+            sender=f"user{i}@{rng.choice(DOMAINS)}",
+            received_time=now,
+            content=body,
+            attachment_count=rng.randint(0, 3),
+            total_attachment_size=rng.randint(0, 5_000_000),
+        ))
+    return emails
+
+
+def _legacy_decision_tree(email: CCEmail):
+    """优化前的实现：每封邮件查询一次规则，并逐条规则、逐个关键词处理原始文本"""
+    rules = CCEmailClassifyRule.objects.filter(is_active=True).order_by('priority')
+    for rule in rules:
+        if rule.sender_domains and email.sender.split('@')[-1].lower() in rule.sender_domains:
+            return rule
+        if rule.subject_keywords and any(k.lower() in email.subject.lower() for k in rule.subject_keywords):
+            return rule
+        if rule.body_keywords and any(k.lower() in email.content.lower() for k in rule.body_keywords):
+            return rule
+        if rule.min_attachments > 0 or rule.max_attachments:
+            if email.attachment_count >= rule.min_attachments and not (
+                    rule.max_attachments and email.attachment_count > rule.max_attachments):
+                return rule
+    return None
+
+
+def _rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds > 0 else float('inf')
+
+
+def run_rule_benchmark(email_count: int = 5000, rule_count: int = 50, body_size: int = 4000) -> Dict[str, Any]:
+    """
+    对比规则阶段优化前后的吞吐量
+
+    Args:
+        email_count: 合成邮件数量
+        rule_count: 合成规则数量
+        body_size: 正文近似长度（字符）
+
+    Returns:
+        包含前后吞吐量（封/秒）的字典
+    """
+    emails = generate_emails(email_count, body_size=body_size)
+
+    with transaction.atomic():
+        # 只在本次事务中启用合成规则，结束后回滚
+        CCEmailClassifyRule.objects.filter(is_active=True).update(is_active=False)
+        CCEmailClassifyRule.objects.bulk_create(generate_rules(rule_count))
+        RuleSetCache.invalidate()
+
+        start = time.perf_counter()
+        before = [_legacy_decision_tree(email) for email in emails]
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rule_set = RuleSetCache.get_rule_set()
+        after = [rule_set.first_match(email) for email in emails]
+        compiled_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = rule_set.first_match_batch(emails)
+        batch_seconds = time.perf_counter() - start
+
+        mismatches = sum(
+            1 for old, new, batch in zip(before, after, batched)
+            if not ((old.name if old else None) == (new.name if new else None) == (batch.name if batch else None))
+        )
+        transaction.set_rollback(True)
+
+    RuleSetCache.invalidate()
+    return {
+        'suite': 'rules',
+        'emails': email_count,
+        'rules': rule_count,
+        'matched': sum(1 for rule in after if rule is not None),
+        'mismatches': mismatches,
+        'before_emails_per_sec': round(_rate(email_count, legacy_seconds), 1),
+        'after_emails_per_sec': round(_rate(email_count, compiled_seconds), 1),
+        'after_batch_emails_per_sec': round(_rate(email_count, batch_seconds), 1),
+        'speedup': round(legacy_seconds / compiled_seconds, 2) if compiled_seconds > 0 else None,
+    }
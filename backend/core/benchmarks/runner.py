@@ -0,0 +1,224 @@
+import json
+import platform
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from django.conf import settings
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from ..metrics import EMAILS_CLASSIFIED
+from ..models import CCEmail, CCEmailClassifyRule, CCForwardingAddress, CCForwardingRule
+from ..services.email_classifier import EmailClassifier
+from ..services.email_forwarding import EmailForwardingService
+from ..services.near_duplicate import NearDuplicateDetector
+from ..services.rule_engine import RuleSetCache
+from .corpus import generate_corpus, generate_rules
+from .stubs import FakeGraphService, stub_backends
+
+METHODS = ('decision_tree', 'sequence', 'fasttext', 'bert', 'llm', 'stepgo')
+STRATEGIES = ('sequential', 'parallel', 'single')
+# 比较结果时吞吐量下降或延迟上升超过该比例视为退化
+REGRESSION_TOLERANCE = 0.1
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """已排序数据的最近秩百分位数"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+        return output.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _install_forwarding_rules() -> None:
+    """在当前事务中为 EMAIL_TYPE_MAPPING 的每个邮件类型创建一条直接转发规则"""
+    CCForwardingRule.objects.filter(is_active=True).update(is_active=False)
+    email_types = {email_type for types in settings.EMAIL_TYPE_MAPPING.values() for email_type in types}
+    for email_type in sorted(email_types):
+        rule = CCForwardingRule.objects.create(
+            name=f"bench-{email_type}", rule_type='B', email_type=email_type,
+            description='benchmark', forward_message='benchmark',
+        )
+        CCForwardingAddress.objects.create(rule=rule, email=f"{email_type}@example.com", name=email_type)
+
+
+def _run(method: str, emails: List[CCEmail], batch_size: int, graph_service: Optional[FakeGraphService]) -> Dict[str, Any]:
+    """
+    分类一次语料并统计吞吐量和延迟
+
+    单封邮件的延迟为从其所在批次开始处理到其结果产出（及转发完成）的时间，
+    即流式分类中一封邮件实际等待的时间；批次在上一批最后一封产出后开始。
+    """
+    NearDuplicateDetector.clear()
+    latencies: List[float] = []
+    categories: Dict[str, int] = {}
+    correct = 0
+    classified_before = EMAILS_CLASSIFIED.values()
+
+    start = batch_start = time.perf_counter()
+    for position, data in enumerate(EmailClassifier.iter_classify_emails(emails, method=method, batch_size=batch_size)):
+        if graph_service is not None:
+            EmailForwardingService.forward_classified_email(data['classification'], data, graph_service)
+        now = time.perf_counter()
+        latencies.append((now - batch_start) * 1000)
+        if (position + 1) % batch_size == 0:
+            batch_start = now
+
+        categories[data['classification']] = categories.get(data['classification'], 0) + 1
+        correct += data['classification'] == data['email'].expected_category
+    seconds = time.perf_counter() - start
+
+    # 各阶段得出的结果数取自分类指标的增量
+    stages: Dict[str, int] = {}
+    for (stage, category), value in EMAILS_CLASSIFIED.values().items():
+        count = int(value - classified_before.get((stage, category), 0))
+        if count:
+            stages[stage] = stages.get(stage, 0) + count
+
+    latencies.sort()
+    return {
+        'emails': len(emails),
+        'seconds': round(seconds, 3),
+        'emails_per_sec': round(len(emails) / seconds, 1) if seconds > 0 else None,
+        'p50_ms': round(_percentile(latencies, 0.50), 2),
+        'p95_ms': round(_percentile(latencies, 0.95), 2),
+        'p99_ms': round(_percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'accuracy': round(correct / len(emails), 3) if emails else None,
+        'categories': dict(sorted(categories.items())),
+        'stages': dict(sorted(stages.items())),
+    }
+
+
+def run_pipeline_benchmark(email_count: int = 1000, methods: Sequence[str] = METHODS,
+                           strategies: Sequence[str] = STRATEGIES, batch_size: int = 100, seed: int = 0,
+                           llm_ms: float = 300, fasttext_ms: float = 20, bert_ms: float = 80,
+                           graph_ms: Optional[float] = None, real_models: bool = False) -> Dict[str, Any]:
+    """
+    端到端分类流水线基准
+
+    在合成语料上依次运行每种分类方法（stepgo 对每种 MODEL_EXECUTION_STRATEGY 各运行一次），
+    统计吞吐量（封/秒）和单封延迟的 p50/p95/p99。LLM 提供者和 Graph API 使用固定延迟的替身，
+    FastText/BERT 默认也使用替身，结果只与代码路径有关，可在不同提交之间比较。
+    合成规则和转发规则只在本次事务中生效，结束后回滚；每次运行前关闭分类缓存并清空近似重复索引，
+    各次运行互不影响。
+
+    Args:
+        email_count: 合成邮件数量
+        methods: 要运行的分类方法
+        strategies: stepgo 要运行的模型执行策略
+        batch_size: 流式分类的批大小
+        seed: 语料随机种子
+        llm_ms: 模拟的 LLM 调用延迟（毫秒）
+        fasttext_ms: 模拟的 FastText 单封推理延迟（毫秒）
+        bert_ms: 模拟的 BERT 单封推理延迟（毫秒）
+        graph_ms: 模拟的 Graph 转发延迟（毫秒），为 None 时不转发
+        real_models: FastText/BERT 是否使用真实模型
+
+    Returns:
+        包含运行环境、配置和每次运行统计的字典，可用 write_results 保存
+    """
+    config = {
+        'emails': email_count,
+        'batch_size': batch_size,
+        'seed': seed,
+        'latency_ms': {'llm': llm_ms, 'fasttext': None if real_models else fasttext_ms,
+                       'bert': None if real_models else bert_ms, 'graph': graph_ms},
+        'real_models': real_models,
+    }
+    runs: Dict[str, Dict[str, Any]] = {}
+
+    with transaction.atomic():
+        # 只在本次事务中启用合成规则，结束后回滚
+        CCEmailClassifyRule.objects.filter(is_active=True).update(is_active=False)
+        CCEmailClassifyRule.objects.bulk_create(generate_rules())
+        RuleSetCache.invalidate()
+        if graph_ms is not None:
+            _install_forwarding_rules()
+
+        with stub_backends(llm_ms=llm_ms, fasttext_ms=fasttext_ms, bert_ms=bert_ms, real_models=real_models) as tools:
+            for method in methods:
+                for strategy in (strategies if method == 'stepgo' else (None,)):
+                    name = f"{method}:{strategy}" if strategy else method
+                    graph_service = FakeGraphService(graph_ms) if graph_ms is not None else None
+                    llm_calls = tools['llm'].llm_provider.calls
+                    # 每次运行重新生成语料，邮件对象上缓存的提取文本不会跨运行复用
+                    emails = generate_corpus(email_count, seed=seed)
+                    overrides = {'CLASSIFICATION_CACHE_BACKEND': 'none'}
+                    if strategy:
+                        overrides['MODEL_EXECUTION_STRATEGY'] = strategy
+                    with override_settings(**overrides):
+                        runs[name] = _run(method, emails, batch_size, graph_service)
+                    runs[name]['llm_calls'] = tools['llm'].llm_provider.calls - llm_calls
+                    if graph_service is not None:
+                        runs[name]['forwarded'] = graph_service.forwarded
+
+        transaction.set_rollback(True)
+
+    RuleSetCache.invalidate()
+    return {
+        'suite': 'pipeline',
+        'commit': _git_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'config': config,
+        'runs': runs,
+    }
+
+
+def write_results(results: Dict[str, Any], path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    tolerance: float = REGRESSION_TOLERANCE) -> Dict[str, Any]:
+    """
+    比较两次基准结果（如两个提交）中同名运行的吞吐量和 p95 延迟
+
+    配置不同（邮件数、批大小、模拟延迟）的结果不可比较，会在 config_mismatch 中列出差异。
+
+    Returns:
+        每次运行的变化比例，以及吞吐量下降或 p95 上升超过 tolerance 的运行列表
+    """
+    mismatch = {
+        key: {'baseline': baseline['config'].get(key), 'current': value}
+        for key, value in current['config'].items()
+        if baseline['config'].get(key) != value
+    }
+    changes = {}
+    regressions = []
+    for name, run in current['runs'].items():
+        base = baseline['runs'].get(name)
+        if not base or not base.get('emails_per_sec') or not run.get('emails_per_sec'):
+            continue
+        throughput = run['emails_per_sec'] / base['emails_per_sec'] - 1
+        p95 = run['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        changes[name] = {
+            'emails_per_sec': {'baseline': base['emails_per_sec'], 'current': run['emails_per_sec'],
+                               'change': round(throughput, 3)},
+            'p95_ms': {'baseline': base['p95_ms'], 'current': run['p95_ms'], 'change': round(p95, 3)},
+        }
+        if throughput < -tolerance or p95 > tolerance:
+            regressions.append(name)
+    return {
+        'baseline_commit': baseline.get('commit'),
+        'current_commit': current.get('commit'),
+        'config_mismatch': mismatch,
+        'changes': changes,
+        'regressions': regressions,
+    }
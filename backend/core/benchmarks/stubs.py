@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from ..services.ai_classifier import ClassifierFactory, EmailClassificationTool, LLMClassificationTool
+
+# 模拟模型按主题中的关键词猜测分类，猜不到时为 other
+KEYWORDS = {
+    'purchase': ("order", "invoice", "quote", "payment", "purchase", "po-"),
+    'techsupport': ("ticket", "error", "server", "login", "vpn", "down"),
+    'festival': ("happy", "greetings", "holiday", "festival", "party"),
+}
+
+
+def guess_category(text: str) -> str:
+    text = text.lower()
+    for category, keywords in KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return category
+    return 'other'
+
+
+class SimulatedModelTool(EmailClassificationTool):
+    """
+    模拟模型推理的分类工具
+
+    用 time.sleep 模拟推理延迟（与 torch/fastText 推理一样会释放 GIL），
+    置信度由邮件主题的哈希确定，相同的邮件在不同实现下得到相同的结果。
+    批量推理每批只等待一次 batch_latency_ms，模拟批量前向计算的摊销。
+    """
+
+    def __init__(self, name: str, latency_ms: float, pass_rate: float, seed: int,
+                 batch_latency_ms: Optional[float] = None):
+        super().__init__(name=name, description=f"simulated {name}")
+        self.latency = latency_ms / 1000
+        self.batch_latency = (latency_ms if batch_latency_ms is None else batch_latency_ms) / 1000
+        self.pass_rate = pass_rate
+        self.seed = seed
+
+    def setup(self) -> None:
+        pass
+
+    def _result(self, email) -> Dict[str, Any]:
+        bucket = zlib.crc32(f"{self.seed}:{email.subject}".encode()) % 1000 / 1000
+        return {
+            'classification': guess_category(email.subject or ''),
+            'confidence': 0.999 if bucket < self.pass_rate else 0.1,
+            'explanation': f"simulated {self.name}",
+        }
+
+    def forward(self, email) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return self._result(email)
+
+    def forward_batch(self, emails) -> List[Dict[str, Any]]:
+        time.sleep(self.batch_latency)
+        return [self._result(email) for email in emails]
+
+
+class FakeLLMProvider:
+    """
+    固定延迟的 LLM 提供者，替换 LLMClassificationTool.llm_provider
+
+    提示词构建、正文提取和 JSON 解析仍走真实代码，只有网络调用被替换。
+    """
+
+    def __init__(self, latency_ms: float = 300):
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def chat(self, messages: Sequence[Dict[str, str]]) -> str:
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        content = messages[-1]['content']
+        return json.dumps({
+            'classification': guess_category(content),
+            'confidence': 0.9,
+            'explanation': 'fake llm',
+        })
+
+
+class FakeGraphService:
+    """固定延迟的 Graph API 服务，只实现转发"""
+
+    def __init__(self, latency_ms: float = 100):
+        self.latency = latency_ms / 1000
+        self.forwarded = 0
+
+    def forward_email(self, email_id: str, to_recipients: List[Dict[str, str]], forward_comment: str = "") -> Dict[str, Any]:
+        time.sleep(self.latency)
+        self.forwarded += 1
+        return {'success': True, 'message': 'fake forward'}
+
+
+@contextmanager
+def stub_backends(llm_ms: float = 300, fasttext_ms: float = 20, bert_ms: float = 80,
+                  pass_rate: float = 0.6, real_models: bool = False,
+                  batch_fraction: float = 0.25) -> Iterator[Dict[str, EmailClassificationTool]]:
+    """
+    在工厂中用固定延迟的实现替换分类器，退出时恢复原来的分类器
+
+    LLM 始终使用 FakeLLMProvider；real_models 为 True 时 FastText/BERT 使用真实模型（需要模型文件），
+    否则使用 SimulatedModelTool，批量推理的延迟为单封延迟乘以 batch_fraction。
+
+    Yields:
+        替换后的分类器
+    """
+    factory = ClassifierFactory.get_instance()
+    saved = dict(factory._classifiers)
+
+    llm = LLMClassificationTool()
+    llm.llm_provider = FakeLLMProvider(llm_ms)
+    tools: Dict[str, EmailClassificationTool] = {'llm': llm}
+    if not real_models:
+        tools['fasttext'] = SimulatedModelTool('fasttext', fasttext_ms, pass_rate, seed=1,
+                                               batch_latency_ms=fasttext_ms * batch_fraction)
+        tools['bert'] = SimulatedModelTool('bert', bert_ms, pass_rate, seed=2,
+                                           batch_latency_ms=bert_ms * batch_fraction)
+    factory._classifiers.update(tools)
+    try:
+        yield tools
+    finally:
+        factory._classifiers.clear()
+        factory._classifiers.update(saved)
@@ -42,7 +42,7 @@ class ChatService:
         try:
             # Parse model string to get provider and instance id
             provider, instance_id = self._parse_model_string(model or '')
-            logger.info(f"Using LLM provider: {provider}, instance: {instance_id}")
+            logger.info("Using LLM provider: %s, instance: %s", provider, instance_id)
 
             # Get LLM instance
             llm = LLMFactory.get_instance_by_id(provider, instance_id)
@@ -67,7 +67,7 @@ class ChatService:
             }
 
         except Exception as e:
-            logger.error(f"Error processing chat message: {str(e)}")
+            logger.error("Error processing chat message: %s", e)
             return {
                 'status': 'error',
                 'message': f'Error processing message: {str(e)}'
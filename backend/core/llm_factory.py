@@ -19,7 +19,7 @@ class AzureOpenAIProvider(LLMProvider):
             logger.info("Initialized Azure OpenAI client")
             return True
         except Exception as e:
-            logger.error(f"Failed to initialize Azure OpenAI: {str(e)}")
+            logger.error("Failed to initialize Azure OpenAI: %s", e)
             return False
 
     def chat(self, messages: list, **kwargs) -> Optional[str]:
@@ -32,7 +32,7 @@ class AzureOpenAIProvider(LLMProvider):
             )
             return response.choices[0].message.content
         except Exception as e:
-            logger.error(f"Chat error with Azure OpenAI: {str(e)}")
+            logger.error("Chat error with Azure OpenAI: %s", e)
             return None
 
 class OpenAIProvider(LLMProvider):
@@ -47,7 +47,7 @@ class OpenAIProvider(LLMProvider):
             logger.info("Initialized OpenAI client")
             return True
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI: {str(e)}")
+            logger.error("Failed to initialize OpenAI: %s", e)
             return False
 
     def chat(self, messages: list, **kwargs) -> Optional[str]:
@@ -60,7 +60,7 @@ class OpenAIProvider(LLMProvider):
             )
             return response.choices[0].message.content
         except Exception as e:
-            logger.error(f"Chat error with OpenAI: {str(e)}")
+            logger.error("Chat error with OpenAI: %s", e)
             return None
 
 class LLMFactory:
@@ -75,7 +75,7 @@ class LLMFactory:
     def register_provider(cls, name: str, provider_class: Type[LLMProvider]) -> None:
         """注册LLM提供者"""
         cls._providers[name.lower()] = provider_class
-        logger.info(f"Registered provider: {name}")
+        logger.info("Registered provider: %s", name)
 
     @classmethod
     def get_provider(cls, name: str) -> Optional[Type[LLMProvider]]:
@@ -92,7 +92,7 @@ class LLMFactory:
         """创建LLM实例"""
         provider_class = cls.get_provider(name)
         if not provider_class:
-            logger.error(f"Unknown provider: {name}")
+            logger.error("Unknown provider: %s", name)
             return None
 
         try:
@@ -100,10 +100,10 @@ class LLMFactory:
             kwargs.pop('name', None)
             provider = provider_class(kwargs)
             provider.initialize()
-            logger.info(f"Successfully created {name} instance")
+            logger.info("Successfully created %s instance", name)
             return provider
         except Exception as e:
-            logger.error(f"Failed to create {name} instance: {str(e)}")
+            logger.error("Failed to create %s instance: %s", name, e)
             return None
 
     @classmethod
@@ -116,13 +116,13 @@ class LLMFactory:
         # 对于其他提供者，从数据库获取配置
         model_class = cls.get_model_class(provider)
         if not model_class:
-            logger.error(f"Unknown LLM provider: {provider}")
+            logger.error("Unknown LLM provider: %s", provider)
             return None
 
         try:
-            logger.debug(f"Attempting to fetch {provider} instance with ID: {instance_id}")
+            logger.debug("Attempting to fetch %s instance with ID: %s", provider, instance_id)
             instance = model_class.objects.get(id=instance_id, is_active=True)
-            logger.debug(f"Found instance: {instance.name} (ID: {instance.id})")
+            logger.debug("Found instance: %s (ID: %s)", instance.name, instance.id)
 
             # 构建基础配置
             config = {
@@ -145,13 +145,13 @@ class LLMFactory:
                     'organization_id': instance.organization_id,
                 })
 
-            logger.debug(f"Creating {provider} instance with config: {config}")
+            logger.debug("Creating %s instance with config: %s", provider, config)
             return cls.create_instance(name=provider, **config)
         except model_class.DoesNotExist:
-            logger.error(f"LLM instance not found: {provider} {instance_id}")
+            logger.error("LLM instance not found: %s %s", provider, instance_id)
             return None
         except Exception as e:
-            logger.error(f"Error getting LLM instance: {str(e)}")
+            logger.error("Error getting LLM instance: %s", e)
             logger.exception("Detailed error:")
             return None
 
@@ -0,0 +1,181 @@
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from typing import Mapping, Optional, Sequence, Tuple
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    将日志记录放入内存队列，由后台线程的 QueueListener 格式化并写入目标处理器
+
+    调用方线程只做过滤和消息合并，文件写入和完整格式化都在后台线程中进行。
+    后台线程在第一次输出时启动，fork 出的子进程（如 gunicorn worker）第一次输出时重新启动。
+    队列满时丢弃 WARNING 以下的记录并计数（dropped），不阻塞分类流程；WARNING 及以上的记录等待入队。
+
+    在 LOGGING 中用 'cfg://handlers.<名称>' 引用目标处理器。dictConfig 按名称顺序创建处理器，
+    目标处理器的名称需要排在本处理器之前。
+
+    Args:
+        handlers: 目标处理器
+        queue_size: 队列容量
+    """
+
+    def __init__(self, handlers: Sequence[logging.Handler], queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.listener: Optional[QueueListener] = None
+        self.dropped = 0
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        # dictConfig 传入的列表按下标访问时才解析 cfg:// 引用
+        self.targets = [handlers[i] for i in range(len(handlers))]
+        for target in self.targets:
+            if not isinstance(target, logging.Handler):
+                raise ValueError(f"目标处理器尚未创建: {target}")
+
+    def _ensure_listener(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # 父进程的后台线程不会出现在子进程中，换一个新队列重新启动
+                self.queue = queue.Queue(self.queue_size)
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 结构化记录（消息为字典）不在调用方线程格式化，由目标处理器的 JsonFormatter 序列化
+        if isinstance(record.msg, Mapping) and not record.args and not record.exc_info:
+            return copy.copy(record)
+        return super().prepare(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._ensure_listener()
+        super().emit(record)
+
+    def close(self) -> None:
+        """停止后台线程，队列中剩余的记录写完后返回（logging.shutdown 在进程退出时调用）"""
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._pid = None
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对重复的低级别日志采样
+
+    按日志模板（logger 名称和未格式化的消息）计数，每个模板每 1/sample_rate 条保留一条，
+    第一条总是保留。逐封邮件输出的消息（模板相同、参数不同）会被采样，只出现一次的消息不受影响；
+    高于 max_level 的记录全部保留。依赖 %-风格的延迟格式化：f-string 生成的消息每条都是不同的模板。
+    最多记录 max_keys 个模板的计数，超过时淘汰最久未出现的模板。
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_level: str = 'INFO', max_keys: int = 10000):
+        super().__init__()
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self.max_keys = max_keys
+        self._counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        key = (record.name, str(record.msg))
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+            self._counts.move_to_end(key)
+            if len(self._counts) > self.max_keys:
+                self._counts.popitem(last=False)
+        return count % self.every == 0
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    限制每个日志模板的输出速率
+
+    每个模板一个令牌桶：每秒补充 rate 个，最多积累 burst 个。被限制的记录丢弃，
+    之后第一条放行的记录在消息末尾注明省略的条数。高于 max_level 的记录不受限制。
+    最多保留 max_keys 个令牌桶，超过时淘汰最久未使用的桶（闲置的桶早已补满，淘汰后重建的结果相同）。
+    """
+
+    def __init__(self, rate: float = 20, burst: int = 100, max_level: str = 'INFO', max_keys: int = 10000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self.max_keys = max_keys
+        # 模板 -> [可用令牌, 上次补充时间, 已省略条数]
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [已省略 {suppressed} 条同类日志]"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    将日志记录格式化为一行 JSON
+
+    消息为字典的记录（结构化记录）展开为 JSON 的字段，其他记录输出为 message 字段。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        if isinstance(record.msg, Mapping) and not record.args:
+            data.update(record.msg)
+        else:
+            data['message'] = record.getMessage()
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import glob
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = '汇总访问日志（logs/access_*.log）中的慢请求：按路由统计耗时分布，并列出最慢的请求'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            help='访问日志文件（默认 LOGS_DIR 下的 access_*.log 及其轮转文件）'
+        )
+        parser.add_argument(
+            '--slow-ms',
+            type=float,
+            default=None,
+            help='慢请求阈值（毫秒，默认 ACCESS_LOG_SLOW_MS）'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='列出的最慢请求数'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            default=False,
+            help='以 JSON 输出'
+        )
+
+    def handle(self, *args, **options):
+        files = options['files'] or sorted(glob.glob(os.path.join(settings.LOGS_DIR, 'access_*.log*')))
+        slow_ms = options['slow_ms'] if options['slow_ms'] is not None else getattr(settings, 'ACCESS_LOG_SLOW_MS', 1000)
+
+        records = []
+        for path in files:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'duration_ms' in record:
+                        records.append(record)
+        logger.info("Loaded %s access records from %s files", len(records), len(files))
+
+        report = self._build_report(records, slow_ms, options['top'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"{report['records']} requests logged, {report['slow']} slower than {slow_ms:g} ms")
+        self.stdout.write(f"{'route':<50} {'count':>7} {'slow':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for row in report['routes']:
+            self.stdout.write(
+                f"{row['route'][:50]:<50} {row['count']:>7} {row['slow']:>6} "
+                f"{row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f} {row['max_ms']:>10.1f}"
+            )
+        self.stdout.write('')
+        self.stdout.write(f"Slowest {len(report['slowest'])} requests:")
+        for record in report['slowest']:
+            self.stdout.write(
+                f"  {record['duration_ms']:>10.1f} ms  {record['response_status']}  "
+                f"{record['request_method']} {record['request_path']}  ({record['timestamp']})"
+            )
+
+    def _build_report(self, records, slow_ms, top):
+        """
+        按路由汇总耗时
+
+        采样记录的请求只是一部分，count 和分位数反映日志中的记录；慢请求和错误请求总是被记录，slow 是完整的。
+        """
+        by_route = {}
+        for record in records:
+            route = f"{record.get('request_method')} {record.get('route') or record.get('request_path')}"
+            by_route.setdefault(route, []).append(record['duration_ms'])
+
+        routes = []
+        for route, durations in by_route.items():
+            durations.sort()
+            routes.append({
+                'route': route,
+                'count': len(durations),
+                'slow': sum(1 for duration in durations if duration >= slow_ms),
+                'p50_ms': durations[len(durations) // 2],
+                'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                'max_ms': durations[-1],
+            })
+        routes.sort(key=lambda row: (row['slow'], row['p95_ms']), reverse=True)
+
+        slowest = sorted(records, key=lambda record: record['duration_ms'], reverse=True)[:top]
+        return {
+            'records': len(records),
+            'slow': sum(row['slow'] for row in routes),
+            'slow_ms': slow_ms,
+            'routes': routes,
+            'slowest': [
+                {key: record.get(key) for key in ('timestamp', 'request_method', 'request_path', 'response_status', 'duration_ms')}
+                for record in slowest
+            ],
+        }
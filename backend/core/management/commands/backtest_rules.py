@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+import json
+import logging
+
+from core.services.rule_backtest import RuleBacktestService
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '在已存储的邮件上回测候选规则集（只读，不调用 Graph 或任何模型）'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            '--rules-json',
+            type=str,
+            help='候选规则 JSON 文件路径（规则对象列表，字段同 CCEmailClassifyRule）'
+        )
+        source.add_argument(
+            '--inactive',
+            action='store_true',
+            help='使用未激活的规则作为候选规则集'
+        )
+        parser.add_argument(
+            '--include-active',
+            action='store_true',
+            default=False,
+            help='与 --inactive 一起使用，候选规则集同时包含当前活动规则'
+        )
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=None,
+            help='只回测指定小时数内接收的邮件'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='最多回测的邮件数量'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='每批读取和评估的邮件数量'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='工作进程数，默认为 CPU 核数；1 表示在当前进程中评估'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['rules_json']:
+                candidate_rules = RuleBacktestService.load_rules_json(options['rules_json'])
+            else:
+                candidate_rules = RuleBacktestService.load_inactive_rules(options['include_active'])
+        except Exception as e:
+            raise CommandError(f"加载候选规则失败: {str(e)}")
+
+        if not candidate_rules:
+            raise CommandError("候选规则集为空")
+
+        received_after = None
+        if options['hours']:
+            received_after = timezone.now() - timedelta(hours=options['hours'])
+
+        report = RuleBacktestService.run(
+            candidate_rules,
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            received_after=received_after,
+            limit=options['limit'],
+        )
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
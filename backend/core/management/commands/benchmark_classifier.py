@@ -0,0 +1,158 @@
+from django.core.management.base import BaseCommand
+import json
+import logging
+
+from core.benchmarks import html, parallel, rules, runner
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '在合成数据上运行分类流水线性能基准'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suite',
+            nargs='?',
+            default='rules',
+            choices=['rules', 'parallel', 'html', 'pipeline'],
+            help='要运行的基准 (rules, parallel, html, pipeline)'
+        )
+        parser.add_argument(
+            '--emails',
+            type=int,
+            default=None,
+            help='合成邮件数量（pipeline 基准默认 1000）'
+        )
+        parser.add_argument(
+            '--rules',
+            type=int,
+            default=50,
+            help='合成规则数量'
+        )
+        parser.add_argument(
+            '--body-size',
+            type=int,
+            default=4000,
+            help='合成邮件正文的近似长度（字符）'
+        )
+        parser.add_argument(
+            '--fasttext-ms',
+            type=float,
+            default=20,
+            help='parallel 和 pipeline 基准中模拟的 FastText 推理延迟（毫秒）'
+        )
+        parser.add_argument(
+            '--bert-ms',
+            type=float,
+            default=80,
+            help='parallel 和 pipeline 基准中模拟的 BERT 推理延迟（毫秒）'
+        )
+        parser.add_argument(
+            '--llm-ms',
+            type=float,
+            default=300,
+            help='parallel 和 pipeline 基准中模拟的 LLM 调用延迟（毫秒）'
+        )
+        parser.add_argument(
+            '--graph-ms',
+            type=float,
+            default=None,
+            help='pipeline 基准中模拟的 Graph 转发延迟（毫秒），不指定时不转发'
+        )
+        parser.add_argument(
+            '--methods',
+            type=str,
+            default=','.join(runner.METHODS),
+            help='pipeline 基准要运行的分类方法，逗号分隔'
+        )
+        parser.add_argument(
+            '--strategies',
+            type=str,
+            default=','.join(runner.STRATEGIES),
+            help='pipeline 基准中 stepgo 要运行的模型执行策略，逗号分隔'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='pipeline 基准中流式分类的批大小'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='pipeline 基准的语料随机种子'
+        )
+        parser.add_argument(
+            '--real-models',
+            action='store_true',
+            default=False,
+            help='pipeline 基准中 FastText/BERT 使用真实模型（LLM 和 Graph 始终使用替身）'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='将结果写入 JSON 文件'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            default=None,
+            help='与之前保存的 JSON 结果比较（如上一个提交的结果）'
+        )
+        parser.add_argument(
+            '--max-chars',
+            type=int,
+            default=20000,
+            help='html 基准中正文提取的字符预算'
+        )
+
+    def handle(self, *args, **options):
+        suite = options['suite']
+        logger.info("Running benchmark suite: %s", suite)
+
+        email_count = options['emails']
+        if suite == 'rules':
+            result = rules.run_rule_benchmark(
+                email_count=email_count or 5000,
+                rule_count=options['rules'],
+                body_size=options['body_size'],
+            )
+        elif suite == 'parallel':
+            result = parallel.run_parallel_benchmark(
+                email_count=min(email_count or 5000, 200),
+                fasttext_ms=options['fasttext_ms'],
+                bert_ms=options['bert_ms'],
+                llm_ms=options['llm_ms'],
+            )
+        elif suite == 'html':
+            result = html.run_html_benchmark(
+                email_count=min(email_count or 5000, 500),
+                max_chars=options['max_chars'],
+            )
+        elif suite == 'pipeline':
+            result = runner.run_pipeline_benchmark(
+                email_count=email_count or 1000,
+                methods=[method.strip() for method in options['methods'].split(',') if method.strip()],
+                strategies=[strategy.strip() for strategy in options['strategies'].split(',') if strategy.strip()],
+                batch_size=options['batch_size'],
+                seed=options['seed'],
+                llm_ms=options['llm_ms'],
+                fasttext_ms=options['fasttext_ms'],
+                bert_ms=options['bert_ms'],
+                graph_ms=options['graph_ms'],
+                real_models=options['real_models'],
+            )
+
+        if options['output']:
+            runner.write_results(result, options['output'])
+            logger.info("Benchmark results written to %s", options['output'])
+        if options['compare']:
+            result = {
+                'result': result,
+                'comparison': runner.compare_results(runner.load_results(options['compare']), result),
+            }
+
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
+import asyncio
 import logging
 import sys
 import os
@@ -8,7 +11,7 @@ import os
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
 
-from core.models import CCEmail, CCUserMailInfo
+from core.models import CCClassificationCheckpoint, CCEmail
 from core.services.email_classifier import EmailClassifier
 
 logger = logging.getLogger(__name__)
@@ -41,145 +44,233 @@ class Command(BaseCommand):
             dest='enable_forwarding',
             help='禁用邮件转发功能'
         )
+        parser.add_argument(
+            '--sql-pushdown',
+            action='store_true',
+            default=False,
+            help='先将活动规则编译为一条 UPDATE 语句在 PostgreSQL 中分类积压邮件，'
+                 '剩余邮件再进入模型分类（下推分类的邮件不会被转发）'
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='use_async',
+            default=False,
+            help='使用异步流水线并发分类邮件（并发数见 ASYNC_LLM_CONCURRENCY / ASYNC_MODEL_CONCURRENCY）'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='每块处理的邮件数，每块提交一次并记录检查点（默认 CLASSIFY_STREAM_BATCH_SIZE）'
+        )
+        parser.add_argument(
+            '--max-emails',
+            type=int,
+            default=None,
+            help='本次运行最多处理的邮件数，剩余邮件在下次运行时从检查点继续'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            default='classify_emails',
+            help='检查点名称，同时运行的不同任务应使用不同的名称'
+        )
+        parser.add_argument(
+            '--reset-checkpoint',
+            action='store_true',
+            default=False,
+            help='忽略已有检查点，从头开始处理'
+        )
+
+    def _load_checkpoint(self, options) -> CCClassificationCheckpoint:
+        """
+        获取本次运行的检查点
+
+        上次运行已完成或指定了 --reset-checkpoint 时从头开始，否则从上次提交的位置继续
+        """
+        checkpoint, created = CCClassificationCheckpoint.objects.get_or_create(
+            name=options['checkpoint'],
+            defaults={'method': options['method']}
+        )
+        if options['reset_checkpoint'] or checkpoint.completed:
+            checkpoint.last_email_id = 0
+            checkpoint.processed_count = 0
+            checkpoint.completed = False
+            checkpoint.method = options['method']
+            checkpoint.save()
+        elif not created and checkpoint.last_email_id:
+            if checkpoint.method != options['method']:
+                logger.warning(
+                    "Checkpoint '%s' was created with method '%s', resuming with '%s'",
+                    checkpoint.name, checkpoint.method, options['method']
+                )
+            logger.info("Resuming from checkpoint '%s' after email ID %s", checkpoint.name, checkpoint.last_email_id)
+            self.stdout.write(
+                f"Resuming from checkpoint '{checkpoint.name}' after email ID {checkpoint.last_email_id} "
+                f"({checkpoint.processed_count} emails already processed)"
+            )
+        return checkpoint
+
+    def _classify_chunk(self, email_ids, options) -> list:
+        """分类一块邮件，返回按邮件 ID 排列的结果字典列表"""
+        emails = CCEmail.objects.filter(id__in=email_ids).select_related('user_mail').order_by('id')
+        if options['use_async']:
+            results = asyncio.run(EmailClassifier.aclassify_emails(list(emails), method=options['method']))
+            return sorted(
+                (data for emails_data in results.values() for data in emails_data),
+                key=lambda data: data['email'].id
+            )
+        return list(EmailClassifier.iter_classify_emails(
+            emails.iterator(chunk_size=len(email_ids)),
+            method=options['method'],
+            batch_size=len(email_ids)
+        ))
+
+    def _report_result(self, data, method) -> None:
+        """输出单封邮件的分类结果"""
+        email = data['email']
+        logger.debug("Updated email %s category to '%s' with method '%s'", email.id, data['classification'], method)
+        self.stdout.write(
+            f"- {email.subject} ({email.sender})\n"
+            f"  Method: {method}\n"
+            f"  Rule/Model: {data['rule_name']}\n"
+            f"  Reason: {data['explanation']}"
+        )
+
+    def _forward_email(self, data, graph_services) -> int:
+        """
+        转发单封已分类的邮件
+
+        Args:
+            data: 分类结果字典
+            graph_services: 用户邮箱 ID -> GraphService，同一邮箱的邮件共用一个服务
+
+        Returns:
+            转发的数量
+        """
+        if data['classification'] in ('error', 'unclassified'):
+            return 0
+
+        email = data['email']
+        graph_service = graph_services.get(email.user_mail_id)
+        if graph_service is None:
+            # 创建 Graph API 服务
+            from core.services.graph_service import GraphService
+            graph_service = graph_services[email.user_mail_id] = GraphService(email.user_mail)
+
+        from core.services.email_forwarding import EmailForwardingService
+        forwarding_results = EmailForwardingService.forward_classified_email(
+            data['classification'], data, graph_service
+        )
+
+        # 输出转发结果
+        for result in forwarding_results:
+            self.stdout.write(
+                f"- Forwarded: {result['title']}\n"
+                f"  Classification: {result['classification']}\n"
+                f"  Email Type: {result['email_type']}\n"
+                f"  Recipients: {result['forwarding_recipient']}"
+            )
+        return len(forwarding_results)
 
     def handle(self, *args, **options):
         try:
             logger.info("Starting email classification command")
-            logger.info(f"Classification method: {options['method']}")
-            logger.info(f"Enable forwarding: {options['enable_forwarding']}")
+            logger.info("Classification method: %s", options['method'])
+            logger.info("Enable forwarding: %s", options['enable_forwarding'])
             
             # 构建查询条件
             query = {}
             if options['hours']:
                 time_threshold = timezone.now() - timedelta(hours=options['hours'])
                 query['received_time__gte'] = time_threshold
-                logger.info(f"Processing emails from the last {options['hours']} hours")
+                logger.info("Processing emails from the last %s hours", options['hours'])
 
-            # 获取未分类的邮件
-            emails = list(CCEmail.objects.filter(
+            # 规则下推：在数据库中一次性分类所有能被规则匹配的邮件
+            if options['sql_pushdown']:
+                from core.services.rule_engine import RuleSetCache
+                from core.services.rule_pushdown import RulePushdownService
+                try:
+                    pushed = RulePushdownService.classify_backlog(
+                        RuleSetCache.get_rule_set(),
+                        method=options['method'],
+                        received_after=query.get('received_time__gte')
+                    )
+                    logger.info("SQL pushdown classified %s emails", pushed)
+                    self.stdout.write(f"SQL pushdown classified {pushed} emails")
+                except NotImplementedError as e:
+                    logger.warning("SQL pushdown skipped: %s", e)
+                    self.stdout.write(self.style.WARNING(f"SQL pushdown skipped: {str(e)}"))
+
+            # 未分类的邮件按 ID 升序分块处理（键集分页），每块提交后记录检查点，中断后从检查点继续
+            queryset = CCEmail.objects.filter(
                 categories='',
                 **query
-            ).order_by('-received_time'))
+            )
+            chunk_size = options['chunk_size'] or getattr(settings, 'CLASSIFY_STREAM_BATCH_SIZE', 100)
+            max_emails = options['max_emails']
+            checkpoint = self._load_checkpoint(options)
+            email_count = queryset.filter(id__gt=checkpoint.last_email_id).count()
 
-            logger.info(f"Found {len(emails)} unclassified emails")
+            logger.info("Found %s unclassified emails", email_count)
             
-            if not emails:
+            if not email_count:
                 logger.info("No emails to classify")
                 self.stdout.write("No emails to classify")
+                checkpoint.completed = True
+                checkpoint.save(update_fields=['completed', 'updated_at'])
                 return
 
-            # 进行分类
-            logger.debug("Starting classification process")
-            results = EmailClassifier.classify_emails(emails, method=options['method'])
+            if options['enable_forwarding']:
+                logger.info("Starting email forwarding process")
+                self.stdout.write("Starting email forwarding process...")
 
-            # 输出分类结果
+            # 逐块分类、保存结果并转发
+            logger.debug("Starting classification process")
             total_processed = 0
-            for classification, emails_data in results.items():
-                logger.info(f"Classification '{classification}': {len(emails_data)} emails")
-                total_processed += len(emails_data)
-                
-                for data in emails_data:
-                    email = data['email']
-                    logger.debug(
-                        f"Classifying email: ID={email.id}, "
-                        f"Subject='{email.subject}', "
-                        f"Sender='{email.sender}'"
-                    )
-                    
-                    # 更新邮件分类
-                    try:
-                        email.categories = classification
-                        
-                        # 保存分类详情
-                        email.classification_method = options['method']
-                        
-                        # 保存置信度（如果有）
-                        if 'confidence' in data:
-                            email.classification_confidence = data['confidence']
-                        
-                        # 保存分类理由
-                        if 'explanation' in data:
-                            email.classification_reason = data['explanation']
-                        
-                        # 保存匹配规则（如果有）
-                        if 'rule_name' in data:
-                            email.classification_rule = data['rule_name']
-                        
-                        # 更新字段列表
-                        update_fields = [
-                            'categories', 
-                            'classification_method', 
-                            'classification_confidence', 
-                            'classification_reason', 
-                            'classification_rule'
-                        ]
-                        
-                        email.save(update_fields=update_fields)
-                        logger.debug(f"Successfully updated email {email.id} category to '{classification}' with method '{options['method']}'")
-                    except Exception as e:
-                        logger.error(f"Failed to update email {email.id} category: {str(e)}")
-                        continue
-                    
-                    self.stdout.write(
-                        f"- {email.subject} ({email.sender})\n"
-                        f"  Method: {options['method']}\n"
-                        f"  Rule/Model: {data['rule_name']}\n"
-                        f"  Reason: {data['explanation']}"
-                    )
+            forwarded_count = 0
+            classification_counts = {}
+            graph_services = {}
+            while max_emails is None or total_processed < max_emails:
+                limit = chunk_size if max_emails is None else min(chunk_size, max_emails - total_processed)
+                email_ids = list(
+                    queryset.filter(id__gt=checkpoint.last_email_id)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:limit]
+                )
+                if not email_ids:
+                    checkpoint.completed = True
+                    checkpoint.save(update_fields=['completed', 'updated_at'])
+                    break
 
-            logger.info(f"Classification completed. Total processed: {total_processed} emails")
+                results = self._classify_chunk(email_ids, options)
+
+                # 本块的分类结果（批量 UPDATE）和检查点在同一事务中提交
+                with transaction.atomic():
+                    EmailClassifier.persist_results(results, options['method'])
+                    checkpoint.last_email_id = email_ids[-1]
+                    checkpoint.processed_count += len(results)
+                    checkpoint.save(update_fields=['last_email_id', 'processed_count', 'updated_at'])
+                total_processed += len(results)
+                for data in results:
+                    classification = data['classification']
+                    classification_counts[classification] = classification_counts.get(classification, 0) + 1
+                    self._report_result(data, options['method'])
+                logger.info("Chunk committed: %s emails, checkpoint at email ID %s", len(results), checkpoint.last_email_id)
+
+                # 处理邮件转发：转发无法回滚，在本块提交后进行
+                if options['enable_forwarding']:
+                    for data in results:
+                        forwarded_count += self._forward_email(data, graph_services)
+
+            for classification, count in classification_counts.items():
+                logger.info("Classification '%s': %s emails", classification, count)
+            logger.info("Classification completed. Total processed: %s emails", total_processed)
             self.stdout.write(self.style.SUCCESS(f'Successfully classified {total_processed} emails'))
             
-            # 处理邮件转发
             if options['enable_forwarding'] and total_processed > 0:
-                logger.info("Starting email forwarding process")
-                self.stdout.write("Starting email forwarding process...")
-                
-                # 获取所有邮件的用户邮箱配置
-                user_mail_ids = set(email.user_mail.id for email in emails)
-                user_mails = {
-                    um.id: um for um in CCUserMailInfo.objects.filter(id__in=user_mail_ids)
-                }
-                
-                # 按用户邮箱分组处理
-                forwarded_count = 0
-                for user_mail_id, user_mail in user_mails.items():
-                    # 过滤出当前用户的邮件
-                    user_results = {}
-                    for classification, emails_data in results.items():
-                        user_emails_data = [
-                            data for data in emails_data 
-                            if data['email'].user_mail.id == user_mail_id
-                        ]
-                        if user_emails_data:
-                            user_results[classification] = user_emails_data
-                    
-                    if not user_results:
-                        continue
-                    
-                    # 创建 Graph API 服务
-                    from core.services.graph_service import GraphService
-                    graph_service = GraphService(user_mail)
-                    
-                    # 处理邮件转发
-                    from core.services.email_forwarding import EmailForwardingService
-                    forwarding_results = EmailForwardingService.process_classified_emails(
-                        classification_results=user_results,
-                        graph_service=graph_service
-                    )
-                    
-                    forwarded_count += len(forwarding_results)
-                    
-                    # 输出转发结果
-                    for result in forwarding_results:
-                        self.stdout.write(
-                            f"- Forwarded: {result['title']}\n"
-                            f"  Classification: {result['classification']}\n"
-                            f"  Email Type: {result['email_type']}\n"
-                            f"  Recipients: {result['forwarding_recipient']}"
-                        )
-                
-                logger.info(f"Forwarding completed. Total forwarded: {forwarded_count} emails")
+                logger.info("Forwarding completed. Total forwarded: %s emails", forwarded_count)
                 self.stdout.write(
                     self.style.SUCCESS(f'Successfully forwarded {forwarded_count} emails')
                 )
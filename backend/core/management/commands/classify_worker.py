@@ -0,0 +1,219 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import json
+import logging
+import signal
+import time
+
+from core.services.classification_queue import ClassificationQueue, LeaseHeartbeat, default_worker_id
+from core.services.email_classifier import EmailClassifier
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = '分类任务工作进程：从 cc_classification_job 认领任务并分类，可在多个节点上同时运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            default=False,
+            help='开始前为未分类且没有等待中或执行中任务的邮件创建任务'
+        )
+        parser.add_argument(
+            '--method',
+            type=str,
+            default='stepgo',
+            help='--enqueue 创建的任务使用的分类方法 (decision_tree, llm, bert, fasttext, sequence, stepgo)'
+        )
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=None,
+            help='--enqueue 只为指定小时数内的邮件创建任务'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='每次认领的任务数（默认 CLASSIFY_QUEUE_BATCH_SIZE）'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=None,
+            help='任务租约时长，处理期间每隔三分之一租约续约一次（默认 CLASSIFY_QUEUE_LEASE_SECONDS）'
+        )
+        parser.add_argument(
+            '--worker-id',
+            type=str,
+            default=None,
+            help='工作进程标识（默认 主机名:进程号）'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='没有可执行的任务时退出，而不是等待新任务'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='处理指定批数后退出'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=5.0,
+            help='没有可执行的任务时的等待秒数'
+        )
+        parser.add_argument(
+            '--disable-forwarding',
+            action='store_false',
+            dest='enable_forwarding',
+            default=True,
+            help='禁用邮件转发功能'
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            default=False,
+            help='只输出任务队列统计（JSON）'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(ClassificationQueue.stats(), indent=2))
+            return
+
+        worker_id = options['worker_id'] or default_worker_id()
+        lease_seconds = options['lease_seconds'] or ClassificationQueue.lease_seconds()
+        batch_size = options['batch_size'] or getattr(settings, 'CLASSIFY_QUEUE_BATCH_SIZE', 50)
+
+        if options['enqueue']:
+            received_after = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+            created = ClassificationQueue.enqueue(method=options['method'], received_after=received_after)
+            self.stdout.write(f"Enqueued {created} classification jobs")
+
+        # 收到 SIGTERM/SIGINT 后处理完当前批次再退出，未完成的任务不会等到租约过期才被重新认领
+        self._stopping = False
+        def stop(signum, frame):
+            logger.info("Worker %s received signal %s, stopping after current batch", worker_id, signum)
+            self._stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        logger.info("Classification worker %s started (batch size %s, lease %ss)", worker_id, batch_size, lease_seconds)
+        self._graph_services = {}
+        batches = processed = failed = 0
+        while not self._stopping:
+            if options['max_batches'] and batches >= options['max_batches']:
+                break
+
+            jobs = ClassificationQueue.claim(worker_id, batch_size=batch_size, lease_seconds=lease_seconds)
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['idle_sleep'])
+                continue
+
+            with LeaseHeartbeat(worker_id, [job.id for job in jobs], lease_seconds):
+                done, errors = self._process_jobs(worker_id, jobs, options['enable_forwarding'])
+            batches += 1
+            processed += done
+            failed += errors
+
+        logger.info("Worker %s stopped. Batches: %s, completed: %s, failed: %s", worker_id, batches, processed, failed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Worker {worker_id} completed {processed} jobs in {batches} batches ({failed} failed attempts)'
+        ))
+
+    def _process_jobs(self, worker_id, jobs, enable_forwarding):
+        """
+        分类一批已认领的任务
+
+        Returns:
+            (完成的任务数, 失败的任务数)
+        """
+        failed = 0
+
+        # 已被其他途径分类的邮件（如 classify_emails 命令或重试前已保存结果）直接完成
+        pending = []
+        already_classified = []
+        for job in jobs:
+            if job.email.categories:
+                already_classified.append(job.id)
+            else:
+                pending.append(job)
+        completed = ClassificationQueue.complete(worker_id, already_classified)
+
+        by_method = {}
+        for job in pending:
+            by_method.setdefault(job.method, []).append(job)
+
+        for method, method_jobs in by_method.items():
+            jobs_by_email = {job.email_id: job for job in method_jobs}
+            try:
+                classified = []
+                for data in EmailClassifier.iter_classify_emails(
+                    [job.email for job in method_jobs], method=method, batch_size=len(method_jobs)
+                ):
+                    if data['classification'] == 'error':
+                        ClassificationQueue.fail(worker_id, jobs_by_email.pop(data['email'].id), data['explanation'])
+                        failed += 1
+                    else:
+                        classified.append(data)
+
+                # 租约可能已在处理期间失效并被其他进程重新认领：在同一事务中锁定仍持有的任务、
+                # 只保存这些任务的结果并完成任务，失去租约的邮件不保存也不转发
+                with transaction.atomic():
+                    owned = set(ClassificationQueue.lock_owned(
+                        worker_id, [jobs_by_email[data['email'].id].id for data in classified]
+                    ))
+                    kept = [data for data in classified if jobs_by_email[data['email'].id].id in owned]
+                    EmailClassifier.persist_results(kept, method)
+                    ClassificationQueue.complete(worker_id, list(owned))
+                for data in classified:
+                    jobs_by_email.pop(data['email'].id)
+                if len(kept) < len(classified):
+                    logger.warning(
+                        "Worker %s lost the lease on %s jobs, their results were discarded",
+                        worker_id, len(classified) - len(kept)
+                    )
+
+                completed += len(kept)
+                for data in kept:
+                    self.stdout.write(f"- {data['subject']} ({data['sender']}): {data['classification']}")
+
+                    if enable_forwarding:
+                        self._forward_email(data)
+            except Exception as e:
+                logger.error("Error processing jobs with method %s", method, exc_info=True)
+                for job in jobs_by_email.values():
+                    ClassificationQueue.fail(worker_id, job, str(e))
+                    failed += 1
+
+        return completed, failed
+
+    def _forward_email(self, data):
+        """转发单封已分类的邮件，同一邮箱的邮件共用一个 GraphService"""
+        if data['classification'] in ('error', 'unclassified'):
+            return
+
+        email = data['email']
+        try:
+            graph_service = self._graph_services.get(email.user_mail_id)
+            if graph_service is None:
+                from core.services.graph_service import GraphService
+                graph_service = self._graph_services[email.user_mail_id] = GraphService(email.user_mail)
+
+            from core.services.email_forwarding import EmailForwardingService
+            for result in EmailForwardingService.forward_classified_email(data['classification'], data, graph_service):
+                self.stdout.write(f"  Forwarded to {result['forwarding_recipient']} ({result['email_type']})")
+        except Exception as e:
+            # 转发失败不影响分类结果，任务仍然完成
+            logger.error("Failed to forward email %s: %s", email.id, e, exc_info=True)
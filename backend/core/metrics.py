@@ -0,0 +1,291 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# 覆盖规则匹配（亚毫秒）到 LLM 调用和 Graph 请求（秒级）的延迟
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """获取标签值对应的子项，首次使用时创建"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，传入了 {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """各标签值当前的计数"""
+        return {values: child.value for values, child in list(self._children.items())}
+
+    def samples(self) -> Iterator[str]:
+        for values, child in sorted(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """记录代码块的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """延迟直方图，桶为累计计数"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ('le', _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric(_Metric):
+    """抓取时调用回调函数取值的指标，用于输出已在其他地方统计的数据（如分类缓存的命中次数）"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Mapping[Tuple[str, ...], float]], type_name: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type_name = type_name
+
+    def samples(self) -> Iterator[str]:
+        for values, value in sorted(self.callback().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(float(value))}"
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表，以 Prometheus 文本格式（0.0.4）在 /metrics 输出
+
+    不依赖 prometheus_client。计数器和直方图按标签值缓存子项，记录一次的开销是一次字典查找、
+    一次加锁和一次二分查找。多进程部署（如多个 gunicorn worker）时每个进程各自统计。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Mapping[Tuple[str, ...], float]], type_name: str = 'gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, type_name))
+
+    def metrics(self) -> Iterable[_Metric]:
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标"""
+        lines: List[str] = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        """清空所有计数（用于测试和基准测试）"""
+        for metric in self.metrics():
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+# 分类流水线各阶段的耗时：rules、fasttext、bert、llm 为一次调用（单封或一个批次），
+# graph_fetch 为一次邮件列表请求，graph_forward 为一次转发请求
+STAGE_LATENCY = REGISTRY.histogram(
+    'mailclassify_stage_duration_seconds',
+    'Duration of one classification pipeline stage call in seconds.',
+    ['stage'],
+)
+STAGE_EMAILS = REGISTRY.counter(
+    'mailclassify_stage_emails_total',
+    'Emails processed by each classification pipeline stage.',
+    ['stage'],
+)
+EMAILS_CLASSIFIED = REGISTRY.counter(
+    'mailclassify_emails_classified_total',
+    'Emails classified, by the stage that resolved them and the resulting category.',
+    ['stage', 'category'],
+)
+MODEL_CALLS = REGISTRY.counter(
+    'mailclassify_model_calls_total',
+    'Emails sent to a model (cache misses only).',
+    ['model'],
+)
+MODEL_ERRORS = REGISTRY.counter(
+    'mailclassify_model_errors_total',
+    'Model classifications that failed with an error.',
+    ['model'],
+)
+GRAPH_REQUESTS = REGISTRY.counter(
+    'mailclassify_graph_requests_total',
+    'Microsoft Graph API requests, by operation and outcome.',
+    ['operation', 'outcome'],
+)
+
+
+def _cache_requests() -> Dict[Tuple[str, ...], float]:
+    from .services.classification_cache import ClassificationCache
+    samples = {}
+    for method, counts in ClassificationCache.stats()['methods'].items():
+        samples[(method, 'hit')] = counts['hits']
+        samples[(method, 'miss')] = counts['misses']
+    return samples
+
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    from .services.classification_cache import ClassificationCache
+    return {
+        (method,): counts['hits'] / (counts['hits'] + counts['misses'])
+        for method, counts in ClassificationCache.stats()['methods'].items()
+        if counts['hits'] + counts['misses']
+    }
+
+
+REGISTRY.callback(
+    'mailclassify_cache_requests_total',
+    'Classification cache lookups, by method and result.',
+    ['method', 'result'],
+    _cache_requests,
+    type_name='counter',
+)
+REGISTRY.callback(
+    'mailclassify_cache_hit_ratio',
+    'Classification cache hit ratio since process start, by method.',
+    ['method'],
+    _cache_hit_ratio,
+)
+
+
+def resolved_stage(result: Mapping) -> str:
+    """分类结果由哪个阶段得出：rules、fasttext、bert、llm、near_duplicate，未解决时为 none"""
+    if result.get('classification') in (None, 'unclassified', 'error'):
+        return 'none'
+    if result.get('inherited_from'):
+        return 'near_duplicate'
+    return result.get('stage') or 'unknown'
+
+
+def record_classified(result: Mapping) -> None:
+    """记录一封邮件的最终分类结果"""
+    EMAILS_CLASSIFIED.labels(resolved_stage(result), result.get('classification') or 'unknown').inc()
@@ -1,75 +1,145 @@
 import logging
 import json
+import random
 import time
+from typing import Any, Dict, Optional, Tuple
 from django.conf import settings
 
 logger = logging.getLogger('core')
+access_logger = logging.getLogger('core.access')
+
+ACCESS_LOG_MODES = ('off', 'errors', 'sampled', 'full')
+
 
 class RequestLoggingMiddleware:
+    """
+    访问日志中间件
+
+    每个请求在响应后输出一条结构化记录（字典，由 core.access 的处理器在后台线程中序列化为 JSON）。
+    ACCESS_LOG_MODE 控制输出哪些请求：
+        off      不输出
+        errors   只输出错误（状态码 >= 400）和慢请求（超过 ACCESS_LOG_SLOW_MS）
+        sampled  错误和慢请求全部输出，其余请求按 ACCESS_LOG_SAMPLE_RATE 采样
+        full     输出所有请求
+    请求体和响应体（仅 DEBUG 模式）最多记录 ACCESS_LOG_BODY_BYTES 字节；超过 ACCESS_LOG_PARSE_MAX_BYTES
+    的正文不读取、不解析，只记录长度。只有确定输出的记录才解码和解析正文。
+    耗时用 perf_counter_ns 计量，可用 access_log_report 命令汇总慢请求。
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
+        mode = getattr(settings, 'ACCESS_LOG_MODE', 'sampled')
+        if mode == 'off':
+            return self.get_response(request)
+
         # 开始时间
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
 
-        # 记录请求信息
-        self.log_request(request)
+        # 视图可能读取请求流，正文需要在调用视图之前取出（只保留记录所需的部分）
+        request_body = self.capture_request_body(request)
 
         # 获取响应
         response = self.get_response(request)
 
         # 计算处理时间
-        duration = time.time() - start_time
+        duration_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
 
-        # 记录响应信息
-        self.log_response(request, response, duration)
+        # 记录请求和响应信息
+        reason = self.log_reason(mode, response.status_code, duration_ms)
+        if reason:
+            self.log_access(request, response, request_body, duration_ms, reason)
 
         return response
 
-    def log_request(self, request):
-        """记录请求信息"""
+    @staticmethod
+    def log_reason(mode: str, status_code: int, duration_ms: float) -> Optional[str]:
+        """
+        判断是否输出该请求的记录
+
+        Returns:
+            输出原因（error、slow、sampled、full），不输出时为 None
+        """
+        if status_code >= 400:
+            return 'error'
+        if duration_ms >= getattr(settings, 'ACCESS_LOG_SLOW_MS', 1000):
+            return 'slow'
+        if mode == 'full':
+            return 'full'
+        if mode == 'sampled' and random.random() < getattr(settings, 'ACCESS_LOG_SAMPLE_RATE', 0.1):
+            return 'sampled'
+        return None
+
+    @staticmethod
+    def capture_request_body(request) -> Tuple[Optional[bytes], int]:
+        """
+        取出请求体中需要记录的部分
+
+        Returns:
+            (正文的前 ACCESS_LOG_BODY_BYTES 字节, 正文长度)；超过解析阈值的正文不读取，返回 (None, 长度)
+        """
         try:
-            # 获取请求体（如果有）
-            body = None
-            if request.body:
-                try:
-                    body = json.loads(request.body)
-                except json.JSONDecodeError:
-                    body = request.body.decode('utf-8')
-
-            log_data = {
-                'remote_address': request.META.get('REMOTE_ADDR'),
-                'server_hostname': request.META.get('SERVER_NAME'),
-                'request_method': request.method,
-                'request_path': request.get_full_path(),
-                'request_body': body,
-                'user': str(request.user),
-            }
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        limit = getattr(settings, 'ACCESS_LOG_BODY_BYTES', 2048)
+        if not length or not limit or length > getattr(settings, 'ACCESS_LOG_PARSE_MAX_BYTES', 64 * 1024):
+            return None, length
+        try:
+            body = request.body
+        except Exception:
+            # 正文已被读取为流（如文件上传），不再记录
+            return None, length
+        return body[:limit], len(body)
 
-            logger.info(f"Request: {json.dumps(log_data, ensure_ascii=False)}")
-        except Exception as e:
-            logger.error(f"Error logging request: {str(e)}")
+    @staticmethod
+    def format_body(body: Optional[bytes], length: int) -> Any:
+        """将截取的正文转换为日志中的值：完整的 JSON 正文解析为对象，其余解码为文本"""
+        if body is None:
+            return None
+        if len(body) == length:
+            try:
+                return json.loads(body)
+            except ValueError:
+                pass
+        text = body.decode('utf-8', errors='replace')
+        return text if len(body) == length else f"{text}...(truncated, {length} bytes)"
 
-    def log_response(self, request, response, duration):
-        """记录响应信息"""
+    def log_access(self, request, response, request_body: Tuple[Optional[bytes], int],
+                   duration_ms: float, reason: str) -> None:
+        """输出一条结构化访问记录"""
         try:
-            # 获取响应体（如果可能）
-            response_body = None
-            if hasattr(response, 'content'):
-                try:
-                    response_body = json.loads(response.content)
-                except:
-                    response_body = response.content.decode('utf-8')
-
-            log_data = {
+            streaming = getattr(response, 'streaming', False)
+            content_length = 0 if streaming else len(response.content)
+            resolver_match = getattr(request, 'resolver_match', None)
+
+            log_data: Dict[str, Any] = {
+                'reason': reason,
+                'remote_address': request.META.get('REMOTE_ADDR'),
+                'server_hostname': request.META.get('SERVER_NAME'),
+                'request_method': request.method,
                 'request_path': request.get_full_path(),
+                'route': resolver_match.route if resolver_match else None,
+                'request_body': self.format_body(*request_body),
+                'request_length': request_body[1],
+                'user': str(getattr(request, 'user', None)),
                 'response_status': response.status_code,
-                'duration': f"{duration:.2f}s",
-                'content_length': len(response.content) if hasattr(response, 'content') else 0,
-                'response_body': response_body if settings.DEBUG else None,  # 只在DEBUG模式记录响应体
+                'duration_ms': round(duration_ms, 3),
+                'content_length': content_length,
             }
+            if reason == 'sampled':
+                log_data['sample_rate'] = getattr(settings, 'ACCESS_LOG_SAMPLE_RATE', 0.1)
+            # 只在DEBUG模式记录响应体，超过解析阈值的响应体不读取
+            if settings.DEBUG and not streaming and content_length <= getattr(settings, 'ACCESS_LOG_PARSE_MAX_BYTES', 64 * 1024):
+                limit = getattr(settings, 'ACCESS_LOG_BODY_BYTES', 2048)
+                log_data['response_body'] = self.format_body(response.content[:limit], content_length)
 
-            logger.info(f"Response: {json.dumps(log_data, ensure_ascii=False)}")
+            if reason == 'error' and response.status_code >= 500:
+                access_logger.error(log_data)
+            elif reason in ('error', 'slow'):
+                access_logger.warning(log_data)
+            else:
+                access_logger.info(log_data)
         except Exception as e:
-            logger.error(f"Error logging response: {str(e)}") 
\ No newline at end of file
+            logger.error("Error logging request: %s", e)
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-16 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_auto_20250309_1407"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ccemailclassifyrule",
+            name="match_subdomains",
+            field=models.BooleanField(
+                default=False,
+                help_text="启用后 sender_domains 中的域名同时匹配其子域名，如 vendor.com 匹配 mail.vendor.com",
+                verbose_name="匹配子域名",
+            ),
+        ),
+    ]
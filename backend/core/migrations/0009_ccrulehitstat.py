@@ -0,0 +1,63 @@
+# Generated by Django 5.0.2 on 2026-10-16 20:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_ccemailclassifyrule_match_subdomains"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CCRuleHitStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "evaluations",
+                    models.BigIntegerField(default=0, verbose_name="评估次数"),
+                ),
+                ("hits", models.BigIntegerField(default=0, verbose_name="命中次数")),
+                (
+                    "total_eval_time_ms",
+                    models.FloatField(default=0.0, verbose_name="累计评估耗时(毫秒)"),
+                ),
+                (
+                    "last_hit_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="最后命中时间"
+                    ),
+                ),
+                (
+                    "rule",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hit_stat",
+                        to="core.ccemailclassifyrule",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "规则命中统计",
+                "verbose_name_plural": "规则命中统计",
+                "db_table": "cc_rule_hit_stat",
+            },
+        ),
+    ]
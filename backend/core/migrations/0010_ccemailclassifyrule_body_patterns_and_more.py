@@ -0,0 +1,46 @@
+# Generated by Django 5.0.2 on 2026-10-16 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_ccrulehitstat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ccemailclassifyrule",
+            name="body_patterns",
+            field=models.JSONField(
+                blank=True, default=list, verbose_name="正文匹配模式列表"
+            ),
+        ),
+        migrations.AddField(
+            model_name="ccemailclassifyrule",
+            name="pattern_syntax",
+            field=models.CharField(
+                choices=[("regex", "正则表达式"), ("glob", "通配符")],
+                default="regex",
+                max_length=10,
+                verbose_name="模式语法",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ccemailclassifyrule",
+            name="sender_patterns",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="匹配完整的发件人地址，如 glob 模式 *@*.vendor.com",
+                verbose_name="发件人匹配模式列表",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ccemailclassifyrule",
+            name="subject_patterns",
+            field=models.JSONField(
+                blank=True, default=list, verbose_name="主题匹配模式列表"
+            ),
+        ),
+    ]
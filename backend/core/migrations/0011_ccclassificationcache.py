@@ -0,0 +1,50 @@
+# Generated by Django 5.0.2 on 2026-10-16 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0010_ccemailclassifyrule_body_patterns_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CCClassificationCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "key",
+                    models.CharField(max_length=64, unique=True, verbose_name="缓存键"),
+                ),
+                ("method", models.CharField(max_length=50, verbose_name="分类方法")),
+                ("result", models.JSONField(verbose_name="分类结果")),
+                ("hit_count", models.IntegerField(default=0, verbose_name="命中次数")),
+                (
+                    "last_used_at",
+                    models.DateTimeField(db_index=True, verbose_name="最后使用时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "分类结果缓存",
+                "verbose_name_plural": "分类结果缓存",
+                "db_table": "cc_classification_cache",
+            },
+        ),
+    ]
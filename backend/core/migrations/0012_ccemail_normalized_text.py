@@ -0,0 +1,22 @@
+# Generated by Django 5.0.2 on 2026-10-16 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0011_ccclassificationcache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ccemail",
+            name="normalized_text",
+            field=models.TextField(
+                blank=True,
+                help_text="去除 HTML 后的正文，首次分类时提取并保存，重新分类时不再解析 HTML",
+                null=True,
+                verbose_name="正文纯文本",
+            ),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.0.2 on 2026-10-16 21:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_ccemail_normalized_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CCClassificationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        default="stepgo", max_length=50, verbose_name="分类方法"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "等待"),
+                            ("running", "执行中"),
+                            ("done", "完成"),
+                            ("failed", "失败"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="状态",
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0, verbose_name="尝试次数")),
+                (
+                    "max_attempts",
+                    models.IntegerField(default=3, verbose_name="最大尝试次数"),
+                ),
+                (
+                    "available_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="可认领时间"
+                    ),
+                ),
+                (
+                    "worker_id",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="认领进程"
+                    ),
+                ),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="租约到期时间"
+                    ),
+                ),
+                (
+                    "heartbeat_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="最后心跳时间"
+                    ),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="最后错误")),
+                (
+                    "email",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="classification_job",
+                        to="core.ccemail",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "邮件分类任务",
+                "verbose_name_plural": "邮件分类任务",
+                "db_table": "cc_classification_job",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "available_at"],
+                        name="cc_job_status_available_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "lease_expires_at"],
+                        name="cc_job_status_lease_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.2 on 2026-10-16 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0013_ccclassificationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CCClassificationCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=100, unique=True, verbose_name="检查点名称"
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        blank=True, max_length=50, verbose_name="分类方法"
+                    ),
+                ),
+                (
+                    "last_email_id",
+                    models.BigIntegerField(
+                        default=0, verbose_name="已处理的最大邮件ID"
+                    ),
+                ),
+                (
+                    "processed_count",
+                    models.BigIntegerField(default=0, verbose_name="已处理邮件数"),
+                ),
+                (
+                    "completed",
+                    models.BooleanField(default=False, verbose_name="是否已完成"),
+                ),
+            ],
+            options={
+                "verbose_name": "分类运行检查点",
+                "verbose_name_plural": "分类运行检查点",
+                "db_table": "cc_classification_checkpoint",
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-16 22:40
+
+from django.core.management.color import no_style
+from django.db import migrations
+
+
+def reset_forwarding_log_sequence(apps, schema_editor):
+    """
+    转发日志以前按 MAX(id)+1 显式指定主键插入，自增序列没有前进；
+    改用自增主键后需要把序列移到现有最大 id 之后，否则第一次插入会主键冲突
+    """
+    connection = schema_editor.connection
+    model = apps.get_model("core", "CCEmailForwardingLog")
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0014_ccclassificationcheckpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_forwarding_log_sequence, migrations.RunPython.noop),
+    ]
@@ -33,8 +33,8 @@ class BertProvider(LLMProvider):
             #     model_path = self._download_from_azure(model_path)
             #     tokenizer_path = os.path.dirname(model_path)
 
-            logger.info(f"Loading BERT model from {model_path}")
-            logger.info(f"Using tokenizer from {tokenizer_path}")
+            logger.info("Loading BERT model from %s", model_path)
+            logger.info("Using tokenizer from %s", tokenizer_path)
 
             # 加载分词器和模型
             self.tokenizer = BertTokenizer.from_pretrained(tokenizer_path)
@@ -58,7 +58,7 @@ class BertProvider(LLMProvider):
             logger.info("BERT model loaded successfully")
             return True
         except Exception as e:
-            logger.error(f"Error loading BERT model: {str(e)}")
+            logger.error("Error loading BERT model: %s", e)
             return False
 
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> Optional[str]:
@@ -84,40 +84,16 @@ class BertProvider(LLMProvider):
             
             # 确保没有换行符，处理文本
             user_message = user_message.replace('\n', ' ').replace('\r', ' ')
-            logger.debug(f"处理后的消息: {user_message[:100]}...")
+            logger.debug("处理后的消息: %.100s...", user_message)
             
-            # 使用模型进行预测
+            # 使用模型进行预测（与批量推理相同，只填充到文本实际的 token 数）
             try:
-                # 对文本进行分词
-                inputs = self.tokenizer(
-                    user_message,
-                    padding='max_length',
-                    truncation=True,
-                    max_length=512,
-                    return_tensors='pt'
-                )
-                
-                # 进行预测
-                with torch.no_grad():
-                    outputs = self.model(inputs['input_ids'], inputs['attention_mask'])
-                    # BertClassifier 直接返回线性层输出，不是包含 logits 属性的对象
-                    predictions = torch.softmax(outputs, dim=1)
-                    predicted_class_idx = torch.argmax(predictions, dim=1).item()
-                    confidence = predictions[0, predicted_class_idx].item()
-                
-                # 获取分类标签 - 使用 settings 中定义的映射
-                predicted_class_str = str(predicted_class_idx)
-                if hasattr(settings, 'BERT_LABEL_MAP') and predicted_class_idx in settings.BERT_LABEL_MAP:
-                    predicted_label = settings.BERT_LABEL_MAP[predicted_class_idx]
-                else:
-                    # 尝试使用模型自带的标签映射
-                    predicted_label = self.labels_reverse.get(predicted_class_idx, "unknown")
-                    # 如果没有找到映射，使用原始类别索引
-                    if predicted_label == "unknown":
-                        predicted_label = predicted_class_str
+                prediction = self.predict_batch([user_message])[0]
+                predicted_label = prediction['classification']
+                confidence = prediction['confidence']
                 
             except Exception as e:
-                logger.error(f"Error during BERT prediction: {str(e)}")
+                logger.error("Error during BERT prediction: %s", e)
                 predicted_label = "unknown"
                 confidence = 0.0
             
@@ -131,9 +107,76 @@ class BertProvider(LLMProvider):
             return json.dumps(result)
             
         except Exception as e:
-            logger.error(f"Error in BERT chat: {str(e)}")
+            logger.error("Error in BERT chat: %s", e)
             return None
 
+    def _label_for(self, class_idx: int) -> str:
+        """将类别下标转换为分类标签，优先使用 settings.BERT_LABEL_MAP，其次使用模型自带的标签映射"""
+        if hasattr(settings, 'BERT_LABEL_MAP') and class_idx in settings.BERT_LABEL_MAP:
+            return settings.BERT_LABEL_MAP[class_idx]
+        label = self.labels_reverse.get(class_idx, "unknown")
+        # 如果没有找到映射，使用原始类别索引
+        return str(class_idx) if label == "unknown" else label
+
+    def predict_batch(self, texts: List[str], batch_size: Optional[int] = None,
+                      max_length: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        批量分类文本
+
+        先对全部文本分词（截断但不填充），按 token 数排序后每 batch_size 条组成一个桶，
+        桶内只填充到该桶中最长的文本（动态填充），每个桶在 torch.inference_mode() 下执行一次前向计算。
+        长度相近的文本分在同一桶中，填充 token 很少；主题加 1000 字符正文的输入通常远短于 512 个 token，
+        不再按 max_length 填充可以省去大部分计算。
+
+        Args:
+            texts: 待分类的文本列表
+            batch_size: 每个桶（每次前向计算）的文本数，默认为 settings.BERT_BATCH_SIZE
+            max_length: 截断长度（token 数），默认为 settings.BERT_MAX_LENGTH
+
+        Returns:
+            与 texts 一一对应的分类结果字典列表，包含 classification、confidence、
+            probabilities（按类别下标排列的完整概率向量）和 explanation
+        """
+        if not hasattr(self, 'model') or self.model is None:
+            raise RuntimeError("BERT model not initialized")
+        if not texts:
+            return []
+
+        batch_size = batch_size or getattr(settings, 'BERT_BATCH_SIZE', 16)
+        max_length = max_length or getattr(settings, 'BERT_MAX_LENGTH', 512)
+        encodings = self.tokenizer(
+            [text.replace('\n', ' ').replace('\r', ' ') for text in texts],
+            truncation=True,
+            max_length=max_length,
+            padding=False,
+        )['input_ids']
+        order = sorted(range(len(texts)), key=lambda position: len(encodings[position]))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                bucket = order[start:start + batch_size]
+                inputs = self.tokenizer.pad(
+                    {'input_ids': [encodings[position] for position in bucket]},
+                    padding='longest',
+                    return_tensors='pt'
+                )
+                # BertClassifier 直接返回线性层输出，不是包含 logits 属性的对象
+                outputs = self.model(inputs['input_ids'], inputs['attention_mask'])
+                probabilities = torch.softmax(outputs, dim=1).tolist()
+
+                for position, row in zip(bucket, probabilities):
+                    class_idx = max(range(len(row)), key=row.__getitem__)
+                    confidence = row[class_idx]
+                    label = self._label_for(class_idx)
+                    results[position] = {
+                        "classification": label,
+                        "confidence": confidence,
+                        "probabilities": row,
+                        "explanation": f"BERT classified as '{label}' with confidence {confidence:.2f}"
+                    }
+        return results
+
     def _download_from_azure(self, model_path: str) -> str:
         """从Azure存储下载模型"""
         try:
@@ -161,11 +204,11 @@ class BertProvider(LLMProvider):
                 blob_data = container_client.download_blob(blob_name)
                 blob_data.readinto(file)
             
-            logger.info(f"Downloaded model from Azure: {blob_name}")
+            logger.info("Downloaded model from Azure: %s", blob_name)
             return local_file_path
             
         except Exception as e:
-            logger.error(f"Error downloading model from Azure: {str(e)}")
+            logger.error("Error downloading model from Azure: %s", e)
             raise
 
 class FastTextProvider(LLMProvider):
@@ -181,7 +224,7 @@ class FastTextProvider(LLMProvider):
             # if settings.AZURE_STORAGE_CONNECTION_STRING:
             #     model_path = self._download_from_azure(model_path)
 
-            logger.info(f"Loading FastText model from {model_path}")
+            logger.info("Loading FastText model from %s", model_path)
             
             # 加载模型
             self.model = fasttext.load_model(model_path)
@@ -189,7 +232,7 @@ class FastTextProvider(LLMProvider):
             logger.info("FastText model loaded successfully")
             return True
         except Exception as e:
-            logger.error(f"Error loading FastText model: {str(e)}")
+            logger.error("Error loading FastText model: %s", e)
             return False
 
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> Optional[str]:
@@ -215,7 +258,7 @@ class FastTextProvider(LLMProvider):
             
             # 确保没有换行符，FastText 不能处理换行符
             user_message = user_message.replace('\n', ' ').replace('\r', ' ')
-            logger.debug(f"处理后的消息: {user_message[:100]}...")
+            logger.debug("处理后的消息: %.100s...", user_message)
             
             # 使用模型进行预测
             try:
@@ -226,16 +269,13 @@ class FastTextProvider(LLMProvider):
                     confidence = float(predictions[1][0])
                     
                     # 使用 settings 中定义的映射转换标签
-                    if hasattr(settings, 'FASTTEXT_LABEL_MAP') and raw_label in settings.FASTTEXT_LABEL_MAP:
-                        predicted_class = settings.FASTTEXT_LABEL_MAP[raw_label]
-                    else:
-                        predicted_class = raw_label
+                    predicted_class = self._label_for(raw_label)
                 else:
-                    logger.warning(f"Unexpected prediction format: {predictions}")
+                    logger.warning("Unexpected prediction format: %s", predictions)
                     predicted_class = "unknown"
                     confidence = 0.0
             except Exception as e:
-                logger.error(f"Error during FastText prediction: {str(e)}")
+                logger.error("Error during FastText prediction: %s", e)
                 predicted_class = "unknown"
                 confidence = 0.0
             
@@ -249,9 +289,48 @@ class FastTextProvider(LLMProvider):
             return json.dumps(result)
             
         except Exception as e:
-            logger.error(f"Error in FastText chat: {str(e)}")
+            logger.error("Error in FastText chat: %s", e)
             return None
 
+    @staticmethod
+    def _label_for(raw_label: str) -> str:
+        """使用 settings.FASTTEXT_LABEL_MAP 转换标签"""
+        if hasattr(settings, 'FASTTEXT_LABEL_MAP') and raw_label in settings.FASTTEXT_LABEL_MAP:
+            return settings.FASTTEXT_LABEL_MAP[raw_label]
+        return raw_label
+
+    def predict_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        批量分类文本，整个批次一次调用 model.predict
+
+        Args:
+            texts: 待分类的文本列表
+
+        Returns:
+            与 texts 一一对应的分类结果字典列表
+        """
+        if not hasattr(self, 'model') or self.model is None:
+            raise RuntimeError("FastText model not initialized")
+
+        # FastText 不能处理换行符
+        lines = [text.replace('\n', ' ').replace('\r', ' ') for text in texts]
+        labels, probabilities = self.model.predict(lines)
+
+        results = []
+        for label, probability in zip(labels, probabilities):
+            if len(label):
+                predicted_class = self._label_for(label[0].replace('__label__', ''))
+                confidence = float(probability[0])
+            else:
+                predicted_class = "unknown"
+                confidence = 0.0
+            results.append({
+                "classification": predicted_class,
+                "confidence": confidence,
+                "explanation": f"FastText classified as '{predicted_class}' with confidence {confidence:.2f}"
+            })
+        return results
+
     def _download_from_azure(self, model_path: str) -> str:
         """从Azure存储下载模型"""
         try:
@@ -279,9 +358,9 @@ class FastTextProvider(LLMProvider):
                 blob_data = container_client.download_blob(blob_name)
                 blob_data.readinto(file)
             
-            logger.info(f"Downloaded model from Azure: {blob_name}")
+            logger.info("Downloaded model from Azure: %s", blob_name)
             return local_file_path
             
         except Exception as e:
-            logger.error(f"Error downloading model from Azure: {str(e)}")
+            logger.error("Error downloading model from Azure: %s", e)
             raise 
\ No newline at end of file
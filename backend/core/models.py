@@ -1,8 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import logging
 from typing import Optional
 
+from .services.pattern_matcher import PATTERN_SYNTAX_GLOB, PATTERN_SYNTAX_REGEX, validate_pattern
+
 logger = logging.getLogger('core')
 
 class CCBaseModel(models.Model):
@@ -91,7 +95,7 @@ class CCUserMailInfo(CCBaseModel):
         return str(self.email)
 
     def save(self, *args, **kwargs):
-        logger.info(f"{'Creating' if not self.pk else 'Updating'} mail info for: {self.email}")
+        logger.info("%s mail info for: %s", 'Creating' if not self.pk else 'Updating', self.email)
         super().save(*args, **kwargs)
 
 class CCEmailClassifyRule(CCBaseModel):
@@ -101,6 +105,8 @@ class CCEmailClassifyRule(CCBaseModel):
     name = models.CharField(_('规则名称'), max_length=100)
     description = models.TextField(_('规则描述'))
     sender_domains = models.JSONField(_('发件人域名列表'))
+    match_subdomains = models.BooleanField(_('匹配子域名'), default=False,
+                                           help_text=_('启用后 sender_domains 中的域名同时匹配其子域名，如 vendor.com 匹配 mail.vendor.com'))
     subject_keywords = models.JSONField(_('主题关键词列表'))
     body_keywords = models.JSONField(_('正文关键词列表'))
     min_attachments = models.IntegerField(_('最小附件数'), default=0)
@@ -110,6 +116,16 @@ class CCEmailClassifyRule(CCBaseModel):
     classification = models.CharField(_('分类'), max_length=100)
     priority = models.IntegerField(_('优先级'), default=0)
     is_active = models.BooleanField(_('是否激活'), default=True)
+    subject_patterns = models.JSONField(_('主题匹配模式列表'), default=list, blank=True)
+    body_patterns = models.JSONField(_('正文匹配模式列表'), default=list, blank=True)
+    sender_patterns = models.JSONField(_('发件人匹配模式列表'), default=list, blank=True,
+                                       help_text=_('匹配完整的发件人地址，如 glob 模式 *@*.vendor.com'))
+    pattern_syntax = models.CharField(_('模式语法'), max_length=10, default=PATTERN_SYNTAX_REGEX, choices=[
+        (PATTERN_SYNTAX_REGEX, _('正则表达式')),
+        (PATTERN_SYNTAX_GLOB, _('通配符')),
+    ])
+
+    PATTERN_FIELDS = ('subject_patterns', 'body_patterns', 'sender_patterns')
 
     class Meta:
         db_table = 'cc_emailclassifyrule'
@@ -120,6 +136,77 @@ class CCEmailClassifyRule(CCBaseModel):
     def __str__(self):
         return f"{self.name} ({self.classification})"
 
+    def clean(self):
+        super().clean()
+        self.validate_patterns()
+
+    def validate_patterns(self):
+        """校验正则/通配符模式，拒绝无效或存在灾难性回溯风险的模式"""
+        errors = {}
+        for field in self.PATTERN_FIELDS:
+            patterns = getattr(self, field) or []
+            if not isinstance(patterns, list):
+                errors[field] = _('必须是模式字符串列表')
+                continue
+            messages = []
+            for pattern in patterns:
+                try:
+                    validate_pattern(pattern, self.pattern_syntax)
+                except ValueError as e:
+                    messages.append(str(e))
+            if messages:
+                errors[field] = messages
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, *args, **kwargs):
+        # 模式在分类时会被编译并对每封邮件执行，必须在保存前拦截危险模式
+        self.validate_patterns()
+        super().save(*args, **kwargs)
+
+class CCRuleHitStat(CCBaseModel):
+    """
+    分类规则命中统计表
+    记录每条规则被评估的次数、命中次数和累计评估耗时
+    """
+    rule = models.OneToOneField(CCEmailClassifyRule, on_delete=models.CASCADE, related_name='hit_stat')
+    evaluations = models.BigIntegerField(_('评估次数'), default=0)
+    hits = models.BigIntegerField(_('命中次数'), default=0)
+    total_eval_time_ms = models.FloatField(_('累计评估耗时(毫秒)'), default=0.0)
+    last_hit_at = models.DateTimeField(_('最后命中时间'), null=True, blank=True)
+
+    class Meta:
+        db_table = 'cc_rule_hit_stat'
+        verbose_name = _('规则命中统计')
+        verbose_name_plural = _('规则命中统计')
+
+    def __str__(self):
+        return f"{self.rule_id}: {self.hits}/{self.evaluations}"
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率"""
+        return self.hits / self.evaluations if self.evaluations else 0.0
+
+class CCClassificationCache(CCBaseModel):
+    """
+    模型分类结果缓存表
+    以邮件内容哈希（含分类方法和模型版本）为键，供 CLASSIFICATION_CACHE_BACKEND = 'db' 时使用
+    """
+    key = models.CharField(_('缓存键'), max_length=64, unique=True)
+    method = models.CharField(_('分类方法'), max_length=50)
+    result = models.JSONField(_('分类结果'))
+    hit_count = models.IntegerField(_('命中次数'), default=0)
+    last_used_at = models.DateTimeField(_('最后使用时间'), db_index=True)
+
+    class Meta:
+        db_table = 'cc_classification_cache'
+        verbose_name = _('分类结果缓存')
+        verbose_name_plural = _('分类结果缓存')
+
+    def __str__(self):
+        return f"{self.method}: {self.key}"
+
 class CCEmail(CCBaseModel):
     """
     邮件内容表
@@ -148,6 +235,8 @@ class CCEmail(CCBaseModel):
                                            help_text=_('分类的详细理由或依据'))
     classification_rule = models.CharField(_('匹配规则'), max_length=255, blank=True, null=True,
                                          help_text=_('匹配的规则名称，适用于决策树分类'))
+    normalized_text = models.TextField(_('正文纯文本'), blank=True, null=True,
+                                       help_text=_('去除 HTML 后的正文，首次分类时提取并保存，重新分类时不再解析 HTML'))
 
     class Meta:
         db_table = 'cc_email'
@@ -178,6 +267,66 @@ class CCEmail(CCBaseModel):
             for a in attachments
         ]
 
+class CCClassificationJob(CCBaseModel):
+    """
+    邮件分类任务表
+    classify_worker 进程通过 SELECT ... FOR UPDATE SKIP LOCKED 认领任务，认领后在租约期内
+    定期续约（心跳）；租约过期的任务可被其他进程重新认领，失败的任务按重试次数延迟重试
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('等待')),
+        (STATUS_RUNNING, _('执行中')),
+        (STATUS_DONE, _('完成')),
+        (STATUS_FAILED, _('失败')),
+    ]
+
+    email = models.OneToOneField(CCEmail, on_delete=models.CASCADE, related_name='classification_job')
+    method = models.CharField(_('分类方法'), max_length=50, default='stepgo')
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(_('尝试次数'), default=0)
+    max_attempts = models.IntegerField(_('最大尝试次数'), default=3)
+    available_at = models.DateTimeField(_('可认领时间'), default=timezone.now)
+    worker_id = models.CharField(_('认领进程'), max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(_('租约到期时间'), null=True, blank=True)
+    heartbeat_at = models.DateTimeField(_('最后心跳时间'), null=True, blank=True)
+    last_error = models.TextField(_('最后错误'), blank=True)
+
+    class Meta:
+        db_table = 'cc_classification_job'
+        verbose_name = _('邮件分类任务')
+        verbose_name_plural = _('邮件分类任务')
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='cc_job_status_available_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='cc_job_status_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email_id}: {self.status} ({self.attempts}/{self.max_attempts})"
+
+class CCClassificationCheckpoint(CCBaseModel):
+    """
+    分类运行检查点表
+    classify_emails 命令按邮件 ID 分块处理积压邮件，每块提交后记录已处理到的最大 ID，
+    中断的运行再次执行时从该位置继续
+    """
+    name = models.CharField(_('检查点名称'), max_length=100, unique=True)
+    method = models.CharField(_('分类方法'), max_length=50, blank=True)
+    last_email_id = models.BigIntegerField(_('已处理的最大邮件ID'), default=0)
+    processed_count = models.BigIntegerField(_('已处理邮件数'), default=0)
+    completed = models.BooleanField(_('是否已完成'), default=False)
+
+    class Meta:
+        db_table = 'cc_classification_checkpoint'
+        verbose_name = _('分类运行检查点')
+        verbose_name_plural = _('分类运行检查点')
+
+    def __str__(self):
+        return f"{self.name}: {self.last_email_id} ({self.processed_count})"
+
 class CCForwardingRule(CCBaseModel):
     """
     邮件转发规则表
@@ -59,11 +59,11 @@ class CCUserMailInfoSerializer(serializers.ModelSerializer):
         }
 
     def create(self, validated_data):
-        logger.info(f"Creating new mail info for: {validated_data.get('email')}")
+        logger.info("Creating new mail info for: %s", validated_data.get('email'))
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
-        logger.info(f"Updating mail info for: {instance.email}")
+        logger.info("Updating mail info for: %s", instance.email)
         return super().update(instance, validated_data)
 
 class CCAzureOpenAISerializer(serializers.ModelSerializer):
@@ -82,11 +82,11 @@ class CCAzureOpenAISerializer(serializers.ModelSerializer):
         }
 
     def create(self, validated_data):
-        logger.info(f"Creating new Azure OpenAI config: {validated_data.get('name')}")
+        logger.info("Creating new Azure OpenAI config: %s", validated_data.get('name'))
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
-        logger.info(f"Updating Azure OpenAI config: {instance.name}")
+        logger.info("Updating Azure OpenAI config: %s", instance.name)
         return super().update(instance, validated_data)
 
 class CCOpenAISerializer(serializers.ModelSerializer):
@@ -104,9 +104,9 @@ class CCOpenAISerializer(serializers.ModelSerializer):
         }
 
     def create(self, validated_data):
-        logger.info(f"Creating new OpenAI config: {validated_data.get('name')}")
+        logger.info("Creating new OpenAI config: %s", validated_data.get('name'))
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
-        logger.info(f"Updating OpenAI config: {instance.name}")
+        logger.info("Updating OpenAI config: %s", instance.name)
         return super().update(instance, validated_data) 
\ No newline at end of file
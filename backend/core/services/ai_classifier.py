@@ -1,8 +1,8 @@
 import json
 import logging
 import os
-import re
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Mapping, Optional, Sequence
 from smolagents import Tool
 from django.conf import settings
 from django.apps import apps
@@ -15,39 +15,12 @@ CCEmail = apps.get_model('core', 'CCEmail')
 # Import from core package
 from core.llm_factory import LLMFactory
 from core.model_providers import BertProvider, FastTextProvider
+from core.services.classification_cache import ClassificationCache
+from core.services.email_normalizer import NormalizedEmail
+from core.metrics import MODEL_CALLS, MODEL_ERRORS, STAGE_EMAILS, STAGE_LATENCY
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_html(html_content: str) -> str:
-    """
-    从 HTML 内容中提取纯文本
-    
-    Args:
-        html_content: HTML 格式的内容
-        
-    Returns:
-        提取的纯文本
-    """
-    if not html_content:
-        return ""
-        
-    # 移除 HTML 标签
-    text = re.sub(r'<[^>]+>', ' ', html_content)
-    
-    # 移除多余的空白字符
-    text = re.sub(r'\s+', ' ', text)
-    
-    # 移除特殊字符和转义序列
-    text = text.replace('\\r', ' ').replace('\\n', ' ').replace('\\t', ' ')
-    
-    # 移除引号
-    text = text.replace('"', '').replace("'", "")
-    
-    # 移除多余的空格
-    text = text.strip()
-    
-    return text
-
 class EmailClassificationTool(Tool):
     """Base class for email classification tools"""
     def __init__(self, name: str, description: str):
@@ -64,12 +37,12 @@ class EmailClassificationTool(Tool):
         self.output_type = "object"
         self.available_categories: List[str] = []  # Will be set by the agent
         super().__init__(name=name, description=description)
-        logger.debug(f"Initialized EmailClassificationTool: {name}")
+        logger.debug("Initialized EmailClassificationTool: %s", name)
 
     def set_categories(self, categories: List[str]) -> None:
-        """Set available categories for classification"""
+        """Set default categories used by forward()"""
         self.available_categories = categories
-        logger.debug(f"Set categories: {categories}")
+        logger.debug("Set categories: %s", categories)
         
     def forward(self, email) -> Dict[str, Any]:
         """
@@ -77,6 +50,34 @@ class EmailClassificationTool(Tool):
         """
         raise NotImplementedError("Subclasses must implement this method")
 
+    def forward_batch(self, emails) -> List[Dict[str, Any]]:
+        """
+        批量分类邮件，默认逐封调用 forward；支持批量推理的子类应覆盖此方法
+        """
+        return [self.forward(email) for email in emails]
+
+    def classify(self, email, categories: Sequence[str]) -> Dict[str, Any]:
+        """
+        使用指定的分类类别分类邮件，不修改工具的共享状态，可在多个线程中并发调用
+
+        默认调用 forward；分类类别会影响结果的子类（如 LLM 的提示词）应覆盖此方法
+        """
+        return self.forward(email)
+
+    def classify_batch(self, emails, categories: Sequence[str]) -> List[Dict[str, Any]]:
+        """classify 的批量版本，默认调用 forward_batch"""
+        return self.forward_batch(emails)
+
+    def _error_result(self, error: Exception, categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """分类出错时的默认结果"""
+        categories = self.available_categories if categories is None else categories
+        return {
+            "classification": categories[0] if categories else "unknown",
+            "confidence": 0.0,
+            "explanation": f"Error: {str(error)}",
+            "error": True
+        }
+
 class LLMClassificationTool(EmailClassificationTool):
     """Tool for classifying emails using LLM"""
     def __init__(self):
@@ -89,7 +90,7 @@ class LLMClassificationTool(EmailClassificationTool):
 
     def setup(self, provider_name: str = "azure", instance_id: int = 1) -> None:
         """Setup LLM provider"""
-        logger.info(f"Setting up LLM provider: {provider_name}, instance: {instance_id}")
+        logger.info("Setting up LLM provider: %s, instance: %s", provider_name, instance_id)
         self.llm_provider = LLMFactory.get_instance_by_id(provider_name, instance_id)
         if self.llm_provider:
             logger.info("LLM provider initialized successfully")
@@ -98,23 +99,29 @@ class LLMClassificationTool(EmailClassificationTool):
 
     def forward(self, email) -> Dict[str, Any]:
         """Classify email using LLM"""
+        return self.classify(email, self.available_categories)
+
+    def classify_batch(self, emails, categories: Sequence[str]) -> List[Dict[str, Any]]:
+        """Classify emails one by one with the given categories (the prompt depends on them)"""
+        return [self.classify(email, categories) for email in emails]
+
+    def classify(self, email, categories: Sequence[str]) -> Dict[str, Any]:
+        """Classify email using LLM with the given categories"""
         try:
             if not self.llm_provider:
                 raise ValueError("LLM provider not initialized")
 
-            # 提取邮件内容
-            subject = email.subject or ""
-            content = email.content or ""  # 使用 content 而不是 body
-            sender = email.sender or ""
-            
-            # 提取纯文本内容
-            clean_content = extract_text_from_html(content)
-            logger.debug(f"提取的纯文本内容: {clean_content[:100]}...")
+            # 提取邮件内容，纯文本在预处理阶段只提取一次
+            normalized = NormalizedEmail.of(email)
+            subject = normalized.subject
+            sender = normalized.sender
+            clean_content = normalized.clean_text
+            logger.debug("提取的纯文本内容: %.100s...", clean_content)
             
             # 构建系统消息和用户消息
             system_message = {
                 "role": "system",
-                "content": f"你是一个邮件分类助手。请将邮件分类到以下类别之一：{', '.join(self.available_categories)}。请以JSON格式返回结果，包含以下字段：classification（分类结果）、confidence（置信度，0-1之间的数值）和explanation（分类理由的简短解释）。"
+                "content": f"你是一个邮件分类助手。请将邮件分类到以下类别之一：{', '.join(categories)}。请以JSON格式返回结果，包含以下字段：classification（分类结果）、confidence（置信度，0-1之间的数值）和explanation（分类理由的简短解释）。"
             }
             
             user_message = {
@@ -124,7 +131,8 @@ class LLMClassificationTool(EmailClassificationTool):
             
             # 发送消息到 LLM
             messages = [system_message, user_message]
-            logger.info(f"Sending messages to LLM: {messages}")
+            # 不记录提示词全文（包含邮件正文），只记录长度
+            logger.debug("Sending %d messages to LLM (%d chars)", len(messages), sum(len(m["content"]) for m in messages))
             
             # 获取LLM响应
             response = self.llm_provider.chat(messages)
@@ -134,23 +142,20 @@ class LLMClassificationTool(EmailClassificationTool):
             # 解析响应
             try:
                 result = json.loads(response)
-                logger.info(f"LLM classification result: {result}")
+                logger.debug("LLM classification result: %s", result)
                 return result
             except json.JSONDecodeError:
-                logger.error(f"Failed to parse LLM response as JSON: {response}")
+                logger.error("Failed to parse LLM response as JSON: %.200s", response)
                 return {
-                    "classification": self.available_categories[0] if self.available_categories else "unknown",
+                    "classification": categories[0] if categories else "unknown",
                     "confidence": 0.5,
-                    "explanation": f"Error parsing LLM response: {response[:100]}..."
+                    "explanation": f"Error parsing LLM response: {response[:100]}...",
+                    "error": True
                 }
                 
         except Exception as e:
-            logger.error(f"Error in LLM classification: {str(e)}")
-            return {
-                "classification": self.available_categories[0] if self.available_categories else "unknown",
-                "confidence": 0.0,
-                "explanation": f"Error: {str(e)}"
-            }
+            logger.error("Error in LLM classification: %s", e)
+            return self._error_result(e, categories)
 
 class BertClassificationTool(EmailClassificationTool):
     """Tool for classifying emails using BERT"""
@@ -169,7 +174,7 @@ class BertClassificationTool(EmailClassificationTool):
             
             # 检查路径是否存在且可访问
             if not os.path.exists(bert_model_path):
-                logger.error(f"BERT model path does not exist: {bert_model_path}")
+                logger.error("BERT model path does not exist: %s", bert_model_path)
                 return
                 
             # 检查权限
@@ -178,11 +183,11 @@ class BertClassificationTool(EmailClassificationTool):
                     f.write('test')
                 os.remove(os.path.join(bert_model_path, 'test_access.tmp'))
             except PermissionError:
-                logger.error(f"Permission denied for BERT model path: {bert_model_path}")
+                logger.error("Permission denied for BERT model path: %s", bert_model_path)
                 logger.error("Please check file permissions or run the application with appropriate privileges")
                 return
             except Exception as e:
-                logger.warning(f"Could not verify write permissions: {str(e)}")
+                logger.warning("Could not verify write permissions: %s", e)
             
             # 创建配置字典
             config_dict = {
@@ -190,59 +195,33 @@ class BertClassificationTool(EmailClassificationTool):
                 'model_path': bert_model_path  # 使用同一路径，让 BertProvider 自己处理文件名
             }
             
-            logger.info(f"Using BERT model path: {bert_model_path}")
+            logger.info("Using BERT model path: %s", bert_model_path)
             self.model_provider = BertProvider(config_dict)
             self.model_provider.initialize()
             logger.info("BERT model initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize BERT model: {str(e)}")
+            logger.error("Failed to initialize BERT model: %s", e)
 
     def forward(self, email) -> Dict[str, Any]:
         """Classify email using BERT"""
+        return self.forward_batch([email])[0]
+
+    def _model_input(self, email) -> str:
+        """构建 BERT 的输入文本"""
+        normalized = NormalizedEmail.of(email)
+        return f"Subject: {normalized.subject}\n\nBody: {normalized.clean_text[:1000]}"
+
+    def forward_batch(self, emails) -> List[Dict[str, Any]]:
+        """批量分类邮件，按长度分桶、每桶（BERT_BATCH_SIZE 封）执行一次动态填充的前向计算"""
         try:
             if not self.model_provider:
                 raise ValueError("BERT model not initialized")
-
-            # 提取邮件内容
-            subject = email.subject or ""
-            content = email.content or ""  # 使用 content 而不是 body
-            
-            # 提取纯文本内容
-            clean_content = extract_text_from_html(content)
-            logger.debug(f"提取的纯文本内容: {clean_content[:100]}...")
-            
-            # 构建消息
-            message = [{
-                "role": "user",
-                "content": f"Subject: {subject}\n\nBody: {clean_content[:1000]}"
-            }]
-            
-            # 获取分类结果
-            response = self.model_provider.chat(message)
-            if not response:
-                raise ValueError("No response from BERT model")
-            
-            # 解析响应
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError:
-                # 如果不是有效的JSON，创建一个默认结果
-                result = {
-                    "classification": self.available_categories[0] if self.available_categories else "unknown",
-                    "confidence": 0.5,
-                    "explanation": f"Failed to parse response: {response[:100]}..."
-                }
-                
-            logger.info(f"BERT classification result: {result}")
-            return result
-            
+            results = self.model_provider.predict_batch([self._model_input(email) for email in emails])
+            logger.info("BERT batch classification finished for %s emails", len(results))
+            return results
         except Exception as e:
-            logger.error(f"Error in BERT classification: {str(e)}")
-            return {
-                "classification": self.available_categories[0] if self.available_categories else "unknown",
-                "confidence": 0.0,
-                "explanation": f"Error: {str(e)}"
-            }
+            logger.error("Error in BERT batch classification: %s", e)
+            return [self._error_result(e) for _ in emails]
 
 class FastTextClassificationTool(EmailClassificationTool):
     """Tool for classifying emails using FastText"""
@@ -261,7 +240,7 @@ class FastTextClassificationTool(EmailClassificationTool):
             
             # 检查文件是否存在
             if not os.path.isfile(fasttext_model_path):
-                logger.error(f"FastText model file does not exist: {fasttext_model_path}")
+                logger.error("FastText model file does not exist: %s", fasttext_model_path)
                 return
                 
             # 检查权限
@@ -270,23 +249,23 @@ class FastTextClassificationTool(EmailClassificationTool):
                     # 只读取一小部分来测试访问权限
                     _ = f.read(10)
             except PermissionError:
-                logger.error(f"Permission denied for FastText model file: {fasttext_model_path}")
+                logger.error("Permission denied for FastText model file: %s", fasttext_model_path)
                 logger.error("Please check file permissions or run the application with appropriate privileges")
                 return
             except Exception as e:
-                logger.warning(f"Could not verify read permissions: {str(e)}")
+                logger.warning("Could not verify read permissions: %s", e)
             
             # 创建配置字典
             config_dict = {
                 'model_path': fasttext_model_path
             }
             
-            logger.info(f"Using FastText model path: {fasttext_model_path}")
+            logger.info("Using FastText model path: %s", fasttext_model_path)
             self.model_provider = FastTextProvider(config_dict)
             self.model_provider.initialize()
             logger.info("FastText model initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize FastText model: {str(e)}")
+            logger.error("Failed to initialize FastText model: %s", e)
 
     def forward(self, email) -> Dict[str, Any]:
         """Classify email using FastText"""
@@ -294,19 +273,10 @@ class FastTextClassificationTool(EmailClassificationTool):
             if not self.model_provider:
                 raise ValueError("FastText model not initialized")
 
-            # 提取邮件内容
-            subject = email.subject or ""
-            content = email.content or ""  # 使用 content 而不是 body
-            
-            # 提取纯文本内容
-            clean_content = extract_text_from_html(content)
-            logger.debug(f"提取的纯文本内容: {clean_content[:100]}...")
-            
             # 构建消息 - 确保没有换行符
-            clean_text = f"Subject: {subject} Body: {clean_content}".replace('\n', ' ').replace('\r', ' ')
             message = [{
                 "role": "user",
-                "content": clean_text
+                "content": self._model_input(email)
             }]
             
             # 获取分类结果
@@ -322,25 +292,40 @@ class FastTextClassificationTool(EmailClassificationTool):
                 result = {
                     "classification": self.available_categories[0] if self.available_categories else "unknown",
                     "confidence": 0.5,
-                    "explanation": f"Failed to parse response: {response[:100]}..."
+                    "explanation": f"Failed to parse response: {response[:100]}...",
+                    "error": True
                 }
                 
-            logger.info(f"FastText classification result: {result}")
+            logger.info("FastText classification result: %s", result)
             return result
             
         except Exception as e:
-            logger.error(f"Error in FastText classification: {str(e)}")
-            return {
-                "classification": self.available_categories[0] if self.available_categories else "unknown",
-                "confidence": 0.0,
-                "explanation": f"Error: {str(e)}"
-            }
+            logger.error("Error in FastText classification: %s", e)
+            return self._error_result(e)
+
+    def _model_input(self, email) -> str:
+        """构建 FastText 的输入文本（单行）"""
+        normalized = NormalizedEmail.of(email)
+        return f"Subject: {normalized.subject} Body: {normalized.clean_text}".replace('\n', ' ').replace('\r', ' ')
+
+    def forward_batch(self, emails) -> List[Dict[str, Any]]:
+        """批量分类邮件，整个批次一次调用 FastText"""
+        try:
+            if not self.model_provider:
+                raise ValueError("FastText model not initialized")
+            results = self.model_provider.predict_batch([self._model_input(email) for email in emails])
+            logger.info("FastText batch classification finished for %s emails", len(results))
+            return results
+        except Exception as e:
+            logger.error("Error in FastText batch classification: %s", e)
+            return [self._error_result(e) for _ in emails]
 
 class ClassifierFactory:
     """分类器工厂，用于创建和管理不同类型的分类器"""
     
     _instance = None
     _classifiers = {}
+    _lock = threading.Lock()
     
     @classmethod
     def get_instance(cls):
@@ -349,45 +334,52 @@ class ClassifierFactory:
             cls._instance = ClassifierFactory()
         return cls._instance
     
-    def get_classifier(self, method: str, categories: List[str]):
+    def get_classifier(self, method: str, categories: Optional[List[str]] = None):
         """
         获取指定类型的分类器
         
+        已创建的分类器直接返回，不修改其状态；分类类别在调用 classify 时传入。
+        
         Args:
             method: 分类方法 ('llm', 'bert', 'fasttext')
-            categories: 可用的分类类别
+            categories: 新建分类器时 forward 使用的默认分类类别
             
         Returns:
             分类器实例
         """
         # 如果分类器已经存在，直接返回
-        if method in self._classifiers:
-            # 更新分类类别
-            self._classifiers[method].set_categories(categories)
-            return self._classifiers[method]
+        classifier = self._classifiers.get(method)
+        if classifier is not None:
+            return classifier
         
-        # 创建新的分类器
-        if method == 'llm':
-            classifier = LLMClassificationTool()
-        elif method == 'bert':
-            classifier = BertClassificationTool()
-        elif method == 'fasttext':
-            classifier = FastTextClassificationTool()
-        else:
-            raise ValueError(f"Unknown classification method: {method}")
-        
-        # 设置分类类别
-        classifier.set_categories(categories)
-        
-        # 初始化分类器
-        classifier.setup()
-        
-        # 缓存分类器
-        self._classifiers[method] = classifier
+        with self._lock:
+            if method in self._classifiers:
+                return self._classifiers[method]
+            
+            # 创建新的分类器
+            if method == 'llm':
+                classifier = LLMClassificationTool()
+            elif method == 'bert':
+                classifier = BertClassificationTool()
+            elif method == 'fasttext':
+                classifier = FastTextClassificationTool()
+            else:
+                raise ValueError(f"Unknown classification method: {method}")
+            
+            # 设置默认分类类别
+            if categories:
+                classifier.set_categories(categories)
+            
+            # 初始化分类器
+            classifier.setup()
+            
+            # 缓存分类器
+            self._classifiers[method] = classifier
         
         return classifier
     
-    def classify_email(self, email, method: str, categories: List[str]) -> Dict[str, Any]:
+    def classify_email(self, email, method: str, categories: Sequence[str],
+                       classifier: Optional[EmailClassificationTool] = None) -> Dict[str, Any]:
         """
         使用指定方法对邮件进行分类
         
@@ -395,42 +387,126 @@ class ClassifierFactory:
             email: 要分类的邮件
             method: 分类方法 ('llm', 'bert', 'fasttext')
             categories: 可用的分类类别
+            classifier: 已解析的分类器（如 ClassificationContext 中的工具），未传入时从工厂获取
             
         Returns:
             分类结果字典
         """
         try:
+            # 内容相同的邮件直接使用缓存的结果
+            cache_key = ClassificationCache.make_key(email, method, categories)
+            cached = ClassificationCache.get(cache_key, method)
+            if cached is not None:
+                logger.info("邮件 '%.50s...' 命中 %s 分类缓存: '%s'", email.subject, method, cached['classification'])
+                return cached
+            
             # 获取分类器
-            classifier = self.get_classifier(method, categories)
+            classifier = classifier or self.get_classifier(method)
             
             # 使用分类器进行分类
-            result = classifier.forward(email)
+            MODEL_CALLS.labels(method).inc()
+            STAGE_EMAILS.labels(method).inc()
+            with STAGE_LATENCY.labels(method).time():
+                result = classifier.classify(email, categories)
+            if self._is_error(result):
+                MODEL_ERRORS.labels(method).inc()
             
             # 获取分类结果
             classification = result.get('classification', 'unclassified')
             confidence = result.get('confidence', 0.0)  # 获取置信度，如果没有则默认为0
-            logger.info(f"邮件 '{email.subject[:50]}...' 被 {method} 分类为 '{classification}'，置信度: {confidence}")
+            logger.info("邮件 '%.50s...' 被 %s 分类为 '%s'，置信度: %s", email.subject, method, classification, confidence)
             
-            return {
-                'classification': classification,
-                'confidence': confidence,  # 添加置信度到返回值
-                'rule_name': f"{method.upper()} Classification",
-                'explanation': result.get('explanation', 'No explanation provided')
-            }
+            formatted = self._format_result(result, method)
+            if ClassificationCache.is_cacheable(formatted):
+                ClassificationCache.set(cache_key, method, formatted)
+            return formatted
             
         except Exception as e:
-            logger.error(f"{method} 分类过程中出错: {str(e)}", exc_info=True)
-            return {
-                'classification': 'unclassified',
-                'confidence': 0.0,  # 错误情况下置信度为0
-                'rule_name': f"{method.upper()} Classification",
-                'explanation': f"Error during classification: {str(e)}"
-            }
+            logger.error("%s 分类过程中出错: %s", method, e, exc_info=True)
+            MODEL_ERRORS.labels(method).inc()
+            return self._error_result(e, method)
+
+    def classify_emails_batch(self, emails: List[Any], method: str, categories: Sequence[str],
+                              classifier: Optional[EmailClassificationTool] = None) -> List[Dict[str, Any]]:
+        """
+        使用指定方法批量分类邮件，整个批次一次调用分类器的 classify_batch
+        
+        Args:
+            emails: 要分类的邮件列表
+            method: 分类方法 ('llm', 'bert', 'fasttext')
+            categories: 可用的分类类别
+            classifier: 已解析的分类器，未传入时从工厂获取
+            
+        Returns:
+            与 emails 一一对应的分类结果字典列表
+        """
+        if not emails:
+            return []
+        try:
+            # 先查缓存，只把未命中的邮件交给分类器
+            keys = [ClassificationCache.make_key(email, method, categories) for email in emails]
+            results: List[Optional[Dict[str, Any]]] = [ClassificationCache.get(key, method) for key in keys]
+            missing = [position for position, result in enumerate(results) if result is None]
+            if len(missing) < len(emails):
+                logger.info("%s 批量分类：%s/%s 封邮件命中缓存", method, len(emails) - len(missing), len(emails))
+            
+            if missing:
+                classifier = classifier or self.get_classifier(method)
+                MODEL_CALLS.labels(method).inc(len(missing))
+                STAGE_EMAILS.labels(method).inc(len(missing))
+                with STAGE_LATENCY.labels(method).time():
+                    outputs = classifier.classify_batch([emails[position] for position in missing], categories)
+                errors = sum(1 for output in outputs if self._is_error(output))
+                if errors:
+                    MODEL_ERRORS.labels(method).inc(errors)
+                for position, output in zip(missing, outputs):
+                    formatted = self._format_result(output, method)
+                    if ClassificationCache.is_cacheable(formatted):
+                        ClassificationCache.set(keys[position], method, formatted)
+                    results[position] = formatted
+            return results
+        except Exception as e:
+            logger.error("%s 批量分类过程中出错: %s", method, e, exc_info=True)
+            MODEL_ERRORS.labels(method).inc(len(emails))
+            return [self._error_result(e, method) for _ in emails]
+
+    @staticmethod
+    def _format_result(result: Dict[str, Any], method: str) -> Dict[str, Any]:
+        """将分类器的输出整理为统一的结果格式，保留出错标记"""
+        formatted = {
+            'classification': result.get('classification', 'unclassified'),
+            'confidence': result.get('confidence', 0.0),  # 获取置信度，如果没有则默认为0
+            'rule_name': f"{method.upper()} Classification",
+            'explanation': result.get('explanation', 'No explanation provided'),
+            'stage': method
+        }
+        if result.get('error'):
+            formatted['error'] = True
+        return formatted
+
+    @staticmethod
+    def _is_error(result: Dict[str, Any]) -> bool:
+        """分类器出错或无法解析模型输出时返回的结果（带 error 标记，或置信度为 0 且理由以 Error 开头）"""
+        return bool(result.get('error')) or (not result.get('confidence')
+                                             and str(result.get('explanation', '')).startswith('Error'))
+
+    @staticmethod
+    def _error_result(error: Exception, method: str) -> Dict[str, Any]:
+        """分类出错时的结果"""
+        return {
+            'classification': 'unclassified',
+            'confidence': 0.0,  # 错误情况下置信度为0
+            'rule_name': f"{method.upper()} Classification",
+            'explanation': f"Error during classification: {str(error)}",
+            'stage': method,
+            'error': True
+        }
 
 class EmailClassificationAgent:
     """Agent for email classification using multiple models"""
-    def __init__(self, categories: List[str]):
+    def __init__(self, categories: List[str], tools: Optional[Mapping[str, EmailClassificationTool]] = None):
         self.categories = categories
+        self.tools = tools or {}
         self.factory = ClassifierFactory.get_instance()
         self.is_initialized = True
         
@@ -449,18 +525,18 @@ class EmailClassificationAgent:
         Returns:
             Classification result dictionary
         """
-        result = self.factory.classify_email(email, method, self.categories)
+        result = self.factory.classify_email(email, method, self.categories, self.tools.get(method))
         
         # 处理置信度
         if 'confidence' not in result and 'score' in result:
             # 如果模型返回了 'score' 而不是 'confidence'，使用 score 作为置信度
             result['confidence'] = result['score']
-            logger.debug(f"使用模型返回的 'score' ({result['score']}) 作为置信度")
+            logger.debug("使用模型返回的 'score' (%s) 作为置信度", result['score'])
         elif 'confidence' not in result:
             # 如果模型没有返回置信度，设置为 0，表示无法确定置信度
             # 这样在后续的阈值判断中，会被视为低置信度结果
             result['confidence'] = 0.0
-            logger.warning(f"{method} 模型未返回置信度，设置为 0.0")
+            logger.warning("%s 模型未返回置信度，设置为 0.0", method)
         
         # 确保结果包含解释
         if 'explanation' not in result:
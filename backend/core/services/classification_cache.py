@@ -0,0 +1,288 @@
+import copy
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Optional
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class LocalCacheBackend:
+    """进程内 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if self.ttl and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, method: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    使用 Django 缓存框架（settings.CACHES），淘汰策略由缓存后端负责（如 Redis 的 LRU、LocMem 的 MAX_ENTRIES）
+
+    缓存可能与会话等其他数据共用，因此 clear 不清空整个缓存：键中带有代数（保存在缓存的
+    clfcache:generation 中），clear 将代数加一，旧条目不再被读取，之后按 TTL 或淘汰策略移除。
+    """
+
+    key_prefix = 'clfcache:'
+    generation_key = key_prefix + 'generation'
+
+    def __init__(self, alias: str, ttl: int):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}{self.cache.get(self.generation_key, 0)}:{key}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(self._key(key))
+
+    def set(self, key: str, method: str, value: Dict[str, Any]) -> None:
+        self.cache.set(self._key(key), value, timeout=self.ttl or None)
+
+    def clear(self) -> None:
+        """使本缓存的所有条目失效，不影响缓存中的其他数据"""
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            self.cache.set(self.generation_key, 1, timeout=None)
+
+
+class DatabaseCacheBackend:
+    """
+    使用 CCClassificationCache 表，多个进程和服务器共享
+
+    读取时检查 TTL；写入时若条目数超过上限，按 last_used_at 删除最久未使用的条目。
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        from django.db.models import F
+        from ..models import CCClassificationCache
+
+        entry = CCClassificationCache.objects.filter(key=key).only('result', 'created_at').first()
+        if entry is None:
+            return None
+        now = timezone.now()
+        if self.ttl and entry.created_at < now - timedelta(seconds=self.ttl):
+            CCClassificationCache.objects.filter(key=key).delete()
+            return None
+        CCClassificationCache.objects.filter(key=key).update(hit_count=F('hit_count') + 1, last_used_at=now)
+        return entry.result
+
+    def set(self, key: str, method: str, value: Dict[str, Any]) -> None:
+        from ..models import CCClassificationCache
+
+        now = timezone.now()
+        CCClassificationCache.objects.update_or_create(
+            key=key,
+            defaults={'method': method, 'result': value, 'last_used_at': now, 'created_at': now, 'hit_count': 0}
+        )
+        self._writes += 1
+        # 每 100 次写入检查一次条目上限
+        if self._writes % 100 == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期条目，以及超过 max_entries 的最久未使用条目"""
+        from ..models import CCClassificationCache
+
+        deleted = 0
+        if self.ttl:
+            deleted += CCClassificationCache.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+            ).delete()[0]
+        cutoff = CCClassificationCache.objects.order_by('-last_used_at').values_list(
+            'last_used_at', flat=True
+        )[self.max_entries:self.max_entries + 1]
+        cutoff = list(cutoff)
+        if cutoff:
+            deleted += CCClassificationCache.objects.filter(last_used_at__lte=cutoff[0]).delete()[0]
+        return deleted
+
+    def clear(self) -> None:
+        from ..models import CCClassificationCache
+        CCClassificationCache.objects.all().delete()
+
+
+class ClassificationCache:
+    """
+    模型分类结果缓存
+
+    放在 ClassifierFactory.classify_email 之前，内容完全相同的邮件（如系统通知）不再重复执行
+    FastText、BERT 或 LLM。缓存键是规范化后的主题、清洗后的正文、发件人、分类方法、
+    该方法的模型版本（CLASSIFICATION_MODEL_VERSIONS）以及可用分类的哈希，
+    模型或分类类别变化后旧结果自然失效。
+
+    后端由 CLASSIFICATION_CACHE_BACKEND 选择：'local'（进程内 LRU）、'django'（Django 缓存框架）、
+    'db'（CCClassificationCache 表）或 'none'（禁用）。
+    """
+
+    _lock = threading.Lock()
+    _backend = None
+    _backend_name: Optional[str] = None
+    _hits: Dict[str, int] = {}
+    _misses: Dict[str, int] = {}
+
+    @classmethod
+    def get_backend(cls):
+        """按当前配置创建（或复用）缓存后端，禁用时返回 None"""
+        name = getattr(settings, 'CLASSIFICATION_CACHE_BACKEND', 'local')
+        if cls._backend_name == name:
+            return cls._backend
+
+        with cls._lock:
+            if cls._backend_name != name:
+                ttl = getattr(settings, 'CLASSIFICATION_CACHE_TTL', 86400)
+                max_entries = getattr(settings, 'CLASSIFICATION_CACHE_MAX_ENTRIES', 10000)
+                if name == 'local':
+                    cls._backend = LocalCacheBackend(max_entries, ttl)
+                elif name == 'django':
+                    cls._backend = DjangoCacheBackend(getattr(settings, 'CLASSIFICATION_CACHE_ALIAS', 'default'), ttl)
+                elif name == 'db':
+                    cls._backend = DatabaseCacheBackend(max_entries, ttl)
+                else:
+                    if name != 'none':
+                        logger.warning("未知的分类缓存后端: %s，缓存已禁用", name)
+                    cls._backend = None
+                cls._backend_name = name
+                logger.info("分类结果缓存后端: %s", name)
+        return cls._backend
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        return _WHITESPACE.sub(' ', text or '').strip().lower()
+
+    @staticmethod
+    def make_key(email, method: str, categories: Iterable[str] = ()) -> str:
+        """
+        计算邮件的缓存键
+
+        Args:
+            email: 邮件对象
+            method: 分类方法 ('llm', 'bert', 'fasttext')
+            categories: 可用的分类类别
+
+        Returns:
+            64 位十六进制的 SHA-256 摘要
+        """
+        from .email_normalizer import NormalizedEmail
+
+        versions = getattr(settings, 'CLASSIFICATION_MODEL_VERSIONS', {})
+        parts = (
+            ClassificationCache._normalize(email.subject),
+            ClassificationCache._normalize(NormalizedEmail.of(email).clean_text),
+            ClassificationCache._normalize(email.sender),
+            method,
+            str(versions.get(method, '1')),
+            ','.join(sorted(categories)),
+        )
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get(cls, key: str, method: str) -> Optional[Dict[str, Any]]:
+        """读取缓存结果并更新命中计数，未命中或缓存禁用时返回 None"""
+        backend = cls.get_backend()
+        if backend is None:
+            return None
+        try:
+            value = backend.get(key)
+        except Exception as e:
+            logger.warning("读取分类缓存失败: %s", e)
+            value = None
+
+        counters = cls._hits if value is not None else cls._misses
+        with cls._lock:
+            counters[method] = counters.get(method, 0) + 1
+        # 返回副本，调用方修改结果不会影响缓存内容
+        return copy.deepcopy(value) if value is not None else None
+
+    @classmethod
+    def set(cls, key: str, method: str, result: Dict[str, Any]) -> None:
+        """写入缓存结果"""
+        backend = cls.get_backend()
+        if backend is None:
+            return
+        try:
+            backend.set(key, method, copy.deepcopy(result))
+        except Exception as e:
+            logger.warning("写入分类缓存失败: %s", e)
+
+    @staticmethod
+    def is_cacheable(result: Dict[str, Any]) -> bool:
+        """只缓存正常的分类结果，出错或模型输出无法解析的结果（error 标记、置信度为 0）下次重新计算"""
+        return (result.get('classification') not in (None, 'unclassified', 'error')
+                and not result.get('error')
+                and result.get('confidence', 0) > 0)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """按分类方法返回命中和未命中次数"""
+        with cls._lock:
+            methods = sorted(set(cls._hits) | set(cls._misses))
+            per_method = {
+                method: {
+                    'hits': cls._hits.get(method, 0),
+                    'misses': cls._misses.get(method, 0),
+                }
+                for method in methods
+            }
+        hits = sum(item['hits'] for item in per_method.values())
+        misses = sum(item['misses'] for item in per_method.values())
+        return {
+            'backend': getattr(settings, 'CLASSIFICATION_CACHE_BACKEND', 'local'),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'methods': per_method,
+        }
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空缓存内容和计数"""
+        backend = cls.get_backend()
+        if backend is not None:
+            backend.clear()
+        with cls._lock:
+            cls._hits.clear()
+            cls._misses.clear()
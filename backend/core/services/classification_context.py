@@ -0,0 +1,109 @@
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from django.conf import settings
+from ..models import CCEmailClassifyRule
+from .ai_classifier import ClassifierFactory, EmailClassificationAgent, EmailClassificationTool
+from .rule_engine import CompiledRuleSet, RuleSetCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORIES = ("purchase", "techsupport", "festival", "other")
+
+# 各分类方法在级联中可能用到的模型
+MODELS_BY_METHOD = {
+    'decision_tree': (),
+    'sequence': ('llm',),
+    'stepgo': ('fasttext', 'bert', 'llm'),
+}
+
+
+@dataclass(frozen=True)
+class ClassificationContext:
+    """
+    一次分类运行的只读快照
+
+    在批次开始时构建一次：编译后的规则集、分类类别、各模型阈值、模型执行策略和已初始化的分类工具。
+    所有级联路径使用同一个上下文，不再逐封查询规则、创建分类代理或修改分类工具的共享状态；
+    上下文及其中的映射都不可修改，可以在工作线程之间共享。
+    """
+
+    rule_set: CompiledRuleSet
+    categories: Tuple[str, ...]
+    thresholds: Mapping[str, float]
+    strategy: str
+    model_order: Tuple[str, ...]
+    single_model: str
+    require_both: bool
+    tools: Mapping[str, EmailClassificationTool]
+    agent: EmailClassificationAgent
+
+    @classmethod
+    def build(cls, method: Optional[str] = None, rule_set: Optional[CompiledRuleSet] = None) -> 'ClassificationContext':
+        """
+        构建分类上下文
+
+        Args:
+            method: 分类方法，决定需要预先初始化哪些分类工具；None 表示全部
+            rule_set: 编译后的规则集，未传入时从缓存获取
+
+        Returns:
+            分类上下文
+        """
+        if rule_set is None:
+            rule_set = RuleSetCache.get_rule_set()
+
+        # 同一分类可能对应多条规则，去重并保持顺序
+        categories = tuple(dict.fromkeys(
+            CCEmailClassifyRule.objects.filter(is_active=True).values_list('classification', flat=True)
+        ))
+        if not categories:
+            logger.warning("没有可用的分类类别，使用默认类别")
+            categories = DEFAULT_CATEGORIES
+
+        models = MODELS_BY_METHOD.get(method, (method,)) if method else ('fasttext', 'bert', 'llm')
+        factory = ClassifierFactory.get_instance()
+        tools = MappingProxyType({model: factory.get_classifier(model) for model in models})
+
+        return cls(
+            rule_set=rule_set,
+            categories=categories,
+            thresholds=MappingProxyType({
+                'fasttext': settings.FASTTEXT_THRESHOLD,
+                'bert': settings.BERT_THRESHOLD,
+                'llm': settings.LLM_THRESHOLD,
+            }),
+            strategy=getattr(settings, 'MODEL_EXECUTION_STRATEGY', 'sequential'),
+            model_order=tuple(getattr(settings, 'MODEL_EXECUTION_ORDER', ['fasttext', 'bert'])),
+            single_model=getattr(settings, 'SINGLE_MODEL_CHOICE', 'bert'),
+            require_both=getattr(settings, 'PARALLEL_REQUIRE_BOTH', True),
+            tools=tools,
+            agent=EmailClassificationAgent(categories=list(categories), tools=tools),
+        )
+
+    @property
+    def stage_models(self) -> Optional[Tuple[str, ...]]:
+        """
+        分阶段批量执行时 LLM 之前的模型阶段
+
+        sequential 策略按 MODEL_EXECUTION_ORDER 执行，single 策略只执行 SINGLE_MODEL_CHOICE；
+        parallel 策略需要同时比较两个模型的结果，不能拆分为独立阶段，返回 None
+        """
+        if self.strategy == 'parallel':
+            return None
+        if self.strategy == 'single':
+            return (self.single_model if self.single_model in ('fasttext', 'bert') else 'bert',)
+        return tuple(model for model in self.model_order if model in ('fasttext', 'bert'))
+
+    def tool(self, method: str) -> EmailClassificationTool:
+        """获取分类工具，上下文中没有时从工厂获取"""
+        tool = self.tools.get(method)
+        if tool is None:
+            tool = ClassifierFactory.get_instance().get_classifier(method)
+        return tool
+
+    def passes(self, result: Dict[str, Any], method: str) -> bool:
+        """模型结果是否为有效分类且置信度达到该方法的阈值"""
+        return (result['classification'] not in ('unclassified', 'error')
+                and result.get('confidence', 0) >= self.thresholds[method])
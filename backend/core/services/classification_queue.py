@@ -0,0 +1,283 @@
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from ..models import CCClassificationJob, CCEmail
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """主机名和进程号，用于区分不同节点上的工作进程"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ClassificationQueue:
+    """
+    基于数据库的邮件分类任务队列
+
+    每封待分类邮件对应一条 CCClassificationJob。工作进程在事务中用
+    SELECT ... FOR UPDATE SKIP LOCKED 认领一批任务并设置租约，多个进程（可在不同节点上）
+    认领到的任务互不重叠，不需要额外的消息中间件。处理期间定期续约；进程崩溃后租约过期，
+    任务可被其他进程重新认领。失败的任务延迟 CLASSIFY_QUEUE_RETRY_DELAY 秒后重试，
+    尝试次数达到上限后标记为失败。
+    """
+
+    @staticmethod
+    def lease_seconds() -> int:
+        return getattr(settings, 'CLASSIFY_QUEUE_LEASE_SECONDS', 300)
+
+    @staticmethod
+    def enqueue(method: str = 'stepgo', received_after: Optional[datetime] = None,
+                limit: Optional[int] = None) -> int:
+        """
+        为未分类且没有等待中或执行中任务的邮件创建任务
+
+        按邮件当前的分类状态而不是任务历史选择邮件：被重置为未分类的邮件即使已有完成或失败的任务，
+        也会将该任务重置为等待状态（尝试次数清零），重新进入队列。
+
+        Args:
+            method: 分类方法
+            received_after: 只处理该时间之后收到的邮件
+            limit: 最多创建的任务数
+
+        Returns:
+            新创建或重新进入队列的任务数
+        """
+        queryset = CCEmail.objects.filter(categories='').exclude(
+            classification_job__status__in=(CCClassificationJob.STATUS_PENDING, CCClassificationJob.STATUS_RUNNING)
+        )
+        if received_after is not None:
+            queryset = queryset.filter(received_time__gte=received_after)
+        email_ids = queryset.order_by('received_time', 'id').values_list('id', flat=True)
+        if limit:
+            email_ids = email_ids[:limit]
+
+        max_attempts = getattr(settings, 'CLASSIFY_QUEUE_MAX_ATTEMPTS', 3)
+        batch_size = getattr(settings, 'CLASSIFY_QUEUE_BATCH_SIZE', 50) * 20
+        created = 0
+        batch: List[int] = []
+        for email_id in email_ids.iterator(chunk_size=batch_size):
+            batch.append(email_id)
+            if len(batch) >= batch_size:
+                created += ClassificationQueue._enqueue_batch(batch, method, max_attempts)
+                batch = []
+        if batch:
+            created += ClassificationQueue._enqueue_batch(batch, method, max_attempts)
+
+        logger.info("已为 %s 封未分类邮件创建分类任务，方法: %s", created, method)
+        return created
+
+    @staticmethod
+    def _enqueue_batch(email_ids: Sequence[int], method: str, max_attempts: int) -> int:
+        """已有完成或失败任务的邮件重置其任务，其余邮件新建任务"""
+        with transaction.atomic():
+            requeued = CCClassificationJob.objects.filter(
+                email_id__in=email_ids,
+                status__in=(CCClassificationJob.STATUS_DONE, CCClassificationJob.STATUS_FAILED),
+            ).update(
+                status=CCClassificationJob.STATUS_PENDING,
+                method=method,
+                attempts=0,
+                max_attempts=max_attempts,
+                available_at=timezone.now(),
+                worker_id='',
+                lease_expires_at=None,
+                last_error='',
+            )
+            existing = set(
+                CCClassificationJob.objects.filter(email_id__in=email_ids).values_list('email_id', flat=True)
+            )
+            created = CCClassificationJob.objects.bulk_create(
+                [CCClassificationJob(email_id=email_id, method=method, max_attempts=max_attempts)
+                 for email_id in email_ids if email_id not in existing],
+                ignore_conflicts=True,
+            )
+        return requeued + len(created)
+
+    @staticmethod
+    def claim(worker_id: str, batch_size: Optional[int] = None,
+              lease_seconds: Optional[int] = None) -> List[CCClassificationJob]:
+        """
+        认领一批可执行的任务
+
+        可执行的任务包括到达可认领时间的等待任务，以及租约已过期的执行中任务（原进程已失去响应）。
+        认领时尝试次数加一，返回的任务对象中是递增后的值。
+        被其他事务锁定的行直接跳过，并发的工作进程不会等待彼此，也不会认领到同一任务。
+
+        Args:
+            worker_id: 工作进程标识
+            batch_size: 最多认领的任务数，默认 CLASSIFY_QUEUE_BATCH_SIZE
+            lease_seconds: 租约时长，默认 CLASSIFY_QUEUE_LEASE_SECONDS
+
+        Returns:
+            认领到的任务（已关联邮件对象），没有可执行任务时为空列表
+        """
+        batch_size = batch_size or getattr(settings, 'CLASSIFY_QUEUE_BATCH_SIZE', 50)
+        lease_seconds = lease_seconds or ClassificationQueue.lease_seconds()
+        now = timezone.now()
+
+        if not connection.features.has_select_for_update_skip_locked:
+            logger.warning("数据库 %s 不支持 SKIP LOCKED，多个工作进程可能认领到同一任务", connection.vendor)
+
+        with transaction.atomic():
+            # 租约过期且尝试次数已达上限的任务不再重新认领
+            CCClassificationJob.objects.filter(
+                status=CCClassificationJob.STATUS_RUNNING, lease_expires_at__lt=now, attempts__gte=F('max_attempts')
+            ).update(status=CCClassificationJob.STATUS_FAILED, lease_expires_at=None, last_error='租约过期且尝试次数已达上限')
+
+            job_ids = list(
+                CCClassificationJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=CCClassificationJob.STATUS_PENDING, available_at__lte=now)
+                    | Q(status=CCClassificationJob.STATUS_RUNNING, lease_expires_at__lt=now)
+                )
+                .order_by('available_at', 'id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not job_ids:
+                return []
+            CCClassificationJob.objects.filter(id__in=job_ids).update(
+                status=CCClassificationJob.STATUS_RUNNING,
+                worker_id=worker_id,
+                attempts=F('attempts') + 1,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                heartbeat_at=now,
+            )
+
+        jobs = list(CCClassificationJob.objects.filter(id__in=job_ids).select_related('email', 'email__user_mail'))
+        logger.info("工作进程 %s 认领了 %s 个分类任务", worker_id, len(jobs))
+        return jobs
+
+    @staticmethod
+    def heartbeat(worker_id: str, job_ids: Sequence[int], lease_seconds: Optional[int] = None) -> int:
+        """
+        为仍由该进程持有的任务续约
+
+        Returns:
+            续约成功的任务数；少于 job_ids 时说明部分任务的租约已过期并被其他进程认领
+        """
+        if not job_ids:
+            return 0
+        now = timezone.now()
+        lease_seconds = lease_seconds or ClassificationQueue.lease_seconds()
+        return CCClassificationJob.objects.filter(
+            id__in=job_ids, worker_id=worker_id, status=CCClassificationJob.STATUS_RUNNING
+        ).update(lease_expires_at=now + timedelta(seconds=lease_seconds), heartbeat_at=now)
+
+    @staticmethod
+    def lock_owned(worker_id: str, job_ids: Sequence[int]) -> List[int]:
+        """
+        锁定并返回仍由该进程持有的任务
+
+        须在事务中调用：返回的任务行在事务结束前保持锁定，claim 会跳过它们，
+        调用方可以在同一事务中保存结果并 complete，不会与重新认领这些任务的进程重复写入。
+        不在返回值中的任务租约已失效，可能已被其他进程认领，调用方不应再为其保存或转发结果。
+        """
+        if not job_ids:
+            return []
+        return list(
+            CCClassificationJob.objects.select_for_update()
+            .filter(id__in=job_ids, worker_id=worker_id, status=CCClassificationJob.STATUS_RUNNING)
+            .values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def complete(worker_id: str, job_ids: Sequence[int]) -> int:
+        """将任务标记为完成，只更新仍由该进程持有的任务"""
+        if not job_ids:
+            return 0
+        return CCClassificationJob.objects.filter(
+            id__in=job_ids, worker_id=worker_id, status=CCClassificationJob.STATUS_RUNNING
+        ).update(status=CCClassificationJob.STATUS_DONE, lease_expires_at=None, last_error='')
+
+    @staticmethod
+    def fail(worker_id: str, job: CCClassificationJob, error: str) -> str:
+        """
+        记录任务失败
+
+        尝试次数未达上限时重新进入等待状态，延迟 CLASSIFY_QUEUE_RETRY_DELAY * 尝试次数 秒后可再次认领；
+        达到上限后标记为失败，不再重试。
+
+        Returns:
+            任务的新状态
+        """
+        attempts = job.attempts
+        if attempts >= job.max_attempts:
+            status = CCClassificationJob.STATUS_FAILED
+            available_at = timezone.now()
+        else:
+            status = CCClassificationJob.STATUS_PENDING
+            delay = getattr(settings, 'CLASSIFY_QUEUE_RETRY_DELAY', 60) * max(attempts, 1)
+            available_at = timezone.now() + timedelta(seconds=delay)
+
+        CCClassificationJob.objects.filter(
+            id=job.id, worker_id=worker_id, status=CCClassificationJob.STATUS_RUNNING
+        ).update(status=status, available_at=available_at, lease_expires_at=None, last_error=error[:2000])
+        logger.warning(
+            "分类任务 %s（邮件 %s）第 %s 次执行失败，状态: %s，错误: %s",
+            job.id, job.email_id, attempts, status, error
+        )
+        return status
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """按状态统计任务数，以及租约已过期的执行中任务数"""
+        counts = dict(
+            CCClassificationJob.objects.values('status').annotate(count=Count('id')).values_list('status', 'count')
+        )
+        expired = CCClassificationJob.objects.filter(
+            status=CCClassificationJob.STATUS_RUNNING, lease_expires_at__lt=timezone.now()
+        ).count()
+        return {
+            'pending': counts.get(CCClassificationJob.STATUS_PENDING, 0),
+            'running': counts.get(CCClassificationJob.STATUS_RUNNING, 0),
+            'done': counts.get(CCClassificationJob.STATUS_DONE, 0),
+            'failed': counts.get(CCClassificationJob.STATUS_FAILED, 0),
+            'expired_leases': expired,
+        }
+
+
+class LeaseHeartbeat:
+    """
+    处理一批任务期间在后台线程中定期续约
+
+    续约间隔为租约时长的三分之一，单个批次的处理时间超过租约时长也不会被其他进程重新认领。
+    用作上下文管理器：进入时启动线程，退出时停止线程并关闭线程的数据库连接。
+    """
+
+    def __init__(self, worker_id: str, job_ids: Sequence[int], lease_seconds: Optional[int] = None):
+        self.worker_id = worker_id
+        self.job_ids = list(job_ids)
+        self.lease_seconds = lease_seconds or ClassificationQueue.lease_seconds()
+        self.lost = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat-{worker_id}", daemon=True)
+
+    def _run(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        try:
+            while not self._stop.wait(interval):
+                try:
+                    renewed = ClassificationQueue.heartbeat(self.worker_id, self.job_ids, self.lease_seconds)
+                    self.lost = len(self.job_ids) - renewed
+                    if self.lost:
+                        logger.warning("工作进程 %s 有 %s 个任务的租约已失效", self.worker_id, self.lost)
+                except Exception as e:
+                    logger.error("任务续约失败: %s", e)
+        finally:
+            connection.close()
+
+    def __enter__(self) -> 'LeaseHeartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,69 @@
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DomainIndex:
+    """
+    发件人域名索引
+
+    精确域名使用哈希表，启用子域名匹配的域名按反向标签（com -> vendor -> mail）存入后缀字典树。
+    每个域名只记录优先级最高（下标最小）的规则，查询时间与规则数量无关。
+    """
+
+    _TERMINAL = ''  # 域名标签不会为空字符串，用作字典树节点的规则标记
+
+    def __init__(self):
+        self._exact: Dict[str, int] = {}
+        self._suffix_trie: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def add(self, domain: str, rule_index: int, include_subdomains: bool = False) -> None:
+        """
+        添加域名
+
+        Args:
+            domain: 小写域名，如 vendor.com
+            rule_index: 规则在规则集中的下标
+            include_subdomains: 是否同时匹配 mail.vendor.com 等子域名
+        """
+        domain = domain.strip().lstrip('.')
+        if not domain:
+            return
+
+        if rule_index < self._exact.get(domain, rule_index + 1):
+            self._exact[domain] = rule_index
+
+        if include_subdomains:
+            node = self._suffix_trie
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            if rule_index < node.get(self._TERMINAL, rule_index + 1):
+                node[self._TERMINAL] = rule_index
+
+    def lookup(self, domain: str) -> Optional[int]:
+        """
+        查找匹配域名的最高优先级规则下标
+
+        Args:
+            domain: 小写的发件人域名
+
+        Returns:
+            规则下标，未匹配时返回 None
+        """
+        best = self._exact.get(domain)
+        if not self._suffix_trie or not domain:
+            return best
+
+        node = self._suffix_trie
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            candidate = node.get(self._TERMINAL)
+            if candidate is not None and (best is None or candidate < best):
+                best = candidate
+        return best
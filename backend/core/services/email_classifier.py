@@ -1,8 +1,19 @@
+import asyncio
 import logging
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from ..models import CCEmail, CCEmailClassifyRule
-from .ai_classifier import EmailClassificationAgent, ClassifierFactory
+from django.db import transaction
+from ..metrics import STAGE_EMAILS, STAGE_LATENCY, record_classified
+from ..models import CCEmail
+from .ai_classifier import ClassifierFactory
+from .classification_context import ClassificationContext
+from .email_normalizer import NormalizedEmail
+from .near_duplicate import NearDuplicateDetector
+from .rule_engine import CompiledRule, CompiledRuleSet, EmailFeatures, RuleSetCache
+from .rule_stats import RuleStatsRecorder
 import time
 
 logger = logging.getLogger(__name__)
@@ -12,6 +23,10 @@ class EmailClassifier:
 
     # 分类器工厂实例
     _factory = None
+
+    # 并行模型分类使用的线程池
+    _model_executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
     
     @classmethod
     def get_factory(cls):
@@ -20,6 +35,11 @@ class EmailClassifier:
             cls._factory = ClassifierFactory.get_instance()
         return cls._factory
 
+    @staticmethod
+    def _trace_enabled() -> bool:
+        """是否输出规则匹配的调试追踪（逐条件详情）"""
+        return getattr(settings, 'RULE_DEBUG_TRACE', False) and logger.isEnabledFor(logging.DEBUG)
+
     @staticmethod
     def classify_emails(emails: List[CCEmail], method: str = "sequence") -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -36,65 +56,161 @@ class EmailClassifier:
         
         # 记录开始时间
         start_time = time.time()
-        logger.info(f"开始对 {len(emails)} 封邮件进行分类，使用方法: {method}")
+        logger.info("开始对 %s 封邮件进行分类，使用方法: %s", len(emails), method)
         
-        # 处理每封邮件
+        # 整个批次共享同一份分类上下文：编译后的规则集、分类类别、阈值和分类工具
+        context = ClassificationContext.build(method)
+        
+        for item in EmailClassifier._classify_batch(emails, method, context):
+            result.setdefault(item['classification'], []).append(item)
+        
+        # 记录结束时间和统计信息
+        end_time = time.time()
+        duration = end_time - start_time
+        total_emails = len(emails)
+        classified_emails = sum(len(emails_list) for emails_list in result.values())
+        logger.info("分类完成，共处理 %s/%s 封邮件，耗时 %.2f 秒", classified_emails, total_emails, duration)
+        logger.info("分类结果统计: %s", ', '.join([f'{k}: {len(v)}' for k, v in result.items()]))
+        
+        # 定期将规则命中统计写入数据库
+        RuleStatsRecorder.maybe_flush(context.rule_set)
+        
+        return result
+
+    @staticmethod
+    def iter_classify_emails(emails: Iterable[CCEmail], method: str = "sequence",
+                             batch_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式分类邮件，逐封产出结果
+        
+        按 batch_size（默认 CLASSIFY_STREAM_BATCH_SIZE）从 emails 中取出一批，批内仍按阶段批量执行，
+        每批完成后按输入顺序逐封产出结果。emails 可以是 QuerySet.iterator() 等惰性序列，
+        内存占用只与批大小有关；调用方可以边产出边保存和转发，运行中断时已产出的结果不会丢失。
+        
+        Args:
+            emails: 要分类的邮件（可迭代对象）
+            method: 分类方法 ('decision_tree', 'llm', 'bert', 'fasttext', 'sequence', 'stepgo')
+            batch_size: 每批分类的邮件数
+            
+        Yields:
+            单封邮件的结果字典，字段同 classify_emails 返回的列表元素，classification 为分类结果
+        """
+        batch_size = batch_size or getattr(settings, 'CLASSIFY_STREAM_BATCH_SIZE', 100)
+        logger.info("开始流式分类，批大小: %s，使用方法: %s", batch_size, method)
+        
+        # 整个运行共享同一份分类上下文
+        context = ClassificationContext.build(method)
+        batch: List[CCEmail] = []
+        total = 0
         for email in emails:
-            logger.debug(f"开始处理邮件: {email.subject[:50]}...")
+            batch.append(email)
+            if len(batch) >= batch_size:
+                yield from EmailClassifier._classify_batch(batch, method, context)
+                total += len(batch)
+                batch = []
+                RuleStatsRecorder.maybe_flush(context.rule_set)
+        if batch:
+            yield from EmailClassifier._classify_batch(batch, method, context)
+            total += len(batch)
+        
+        logger.info("流式分类完成，共处理 %s 封邮件", total)
+        RuleStatsRecorder.maybe_flush(context.rule_set)
+
+    @staticmethod
+    def _classify_batch(emails: List[CCEmail], method: str, context: ClassificationContext) -> Iterator[Dict[str, Any]]:
+        """
+        对一批邮件分类，按输入顺序逐封产出结果字典
+        
+        Args:
+            emails: 要分类的邮件列表
+            method: 分类方法
+            context: 分类上下文
+        """
+        rule_set = context.rule_set
+        # 对需要规则阶段的方法，先在整个批次上一次性评估规则
+        rule_results = [None] * len(emails)
+        if method in ("decision_tree", "sequence", "stepgo"):
+            try:
+                rule_results = EmailClassifier.classify_by_rules_batch(emails, rule_set)
+            except Exception as e:
+                logger.error("批量规则评估出错，改为逐封评估: %s", e, exc_info=True)
+        
+        # 近似重复检测：未被规则解决的邮件按内容聚类，每个簇只有代表邮件进入模型阶段
+        near_duplicate_scope = NearDuplicateDetector.scope(method, context.categories)
+        members, inherited, fingerprints = EmailClassifier._plan_near_duplicates(
+            emails, method, rule_results, near_duplicate_scope
+        )
+        outcomes = {}
+        
+        # stepgo 按阶段批量执行：每个模型阶段一次处理前一阶段未解决的全部邮件
+        step_results = None
+        if method == "stepgo" and context.stage_models is not None:
+            try:
+                positions = [p for p in range(len(emails)) if p not in members and p not in inherited]
+                batch_results = EmailClassifier._step_classify_batch(
+                    [emails[p] for p in positions], context, [rule_results[p] for p in positions]
+                )
+                step_results = [None] * len(emails)
+                for p, step_result in zip(positions, batch_results):
+                    step_results[p] = step_result
+            except Exception as e:
+                logger.error("分阶段批量分类出错，改为逐封分类: %s", e, exc_info=True)
+        
+        # 处理每封邮件
+        for position, (email, rule_result) in enumerate(zip(emails, rule_results)):
+            logger.debug("开始处理邮件: %.50s...", email.subject)
             
             try:
                 # 根据方法选择分类器
-                if method == "decision_tree":
-                    classification_result = EmailClassifier._classify_by_decision_tree(email)
+                if position in inherited:
+                    classification_result = inherited[position]
+                elif position in members and members[position][0] in outcomes:
+                    representative, distance = members[position]
+                    classification_result = NearDuplicateDetector.inherit(
+                        outcomes[representative], NearDuplicateDetector.describe(emails[representative]), distance
+                    )
+                elif method == "decision_tree":
+                    classification_result = rule_result or EmailClassifier._classify_by_decision_tree(email, rule_set)
                 elif method == "sequence":
                     # 先使用决策树进行分类
-                    logger.info(f"序列分类：第一步 - 对邮件 '{email.subject[:50]}...' 使用决策树进行分类")
-                    classification_result = EmailClassifier._classify_by_decision_tree(email)
+                    logger.info("序列分类：第一步 - 对邮件 '%.50s...' 使用决策树进行分类", email.subject)
+                    classification_result = rule_result or EmailClassifier._classify_by_decision_tree(email, rule_set)
                     
                     # 如果邮件未分类，使用 AI 代理进行二次分类
                     if classification_result['classification'] == 'unclassified':
-                        logger.info(f"序列分类：邮件 '{email.subject[:50]}...' 未分类，使用 AI 代理进行二次分类")
-                        classification_result = EmailClassifier._classify_by_ai_agent(email, 'llm')
+                        logger.info("序列分类：邮件 '%.50s...' 未分类，使用 AI 代理进行二次分类", email.subject)
+                        classification_result = EmailClassifier._classify_by_ai_agent(email, 'llm', context)
                         logger.info("序列分类：完成 AI 代理二次分类")
                     else:
-                        logger.info(f"序列分类：邮件已通过决策树成功分类为 '{classification_result['classification']}'")
+                        logger.info("序列分类：邮件已通过决策树成功分类为 '%s'", classification_result['classification'])
+                elif method == "stepgo" and step_results is not None and step_results[position] is not None:
+                    classification_result = step_results[position]
                 elif method == "stepgo":
                     # 逐步尝试不同的分类器，根据置信度阈值判断是否继续
-                    logger.info(f"开始对邮件 '{email.subject[:50]}...' 进行逐步分类 (stepgo)")
-                    classification_result = EmailClassifier._step_classifier(email)
-                    logger.info(f"逐步分类完成，结果: {classification_result['classification']}，置信度: {classification_result.get('confidence', 'N/A')}")
+                    logger.info("开始对邮件 '%.50s...' 进行逐步分类 (stepgo)", email.subject)
+                    classification_result = EmailClassifier._step_classifier(email, context, rule_result)
+                    logger.info("逐步分类完成，结果: %s，置信度: %s", classification_result['classification'], classification_result.get('confidence', 'N/A'))
                 else:
-                    classification_result = EmailClassifier._classify_by_ai_agent(email, method)
+                    classification_result = EmailClassifier._classify_by_ai_agent(email, method, context)
+                
+                outcomes[position] = classification_result
+                if position in fingerprints:
+                    NearDuplicateDetector.remember(
+                        email, fingerprints[position], classification_result, near_duplicate_scope
+                    )
                 
                 # 记录分类结果
                 classification = classification_result.get('classification', 'unknown')
-                logger.info(f"邮件 '{email.subject[:50]}...' 被 {method} 分类为 '{classification}'")
-                
-                # 将结果添加到对应分类的列表中
-                if classification not in result:
-                    result[classification] = []
-                
-                # 创建邮件结果字典，包含完整的邮件对象
-                email_result = {
-                    'email': email,  # 包含完整的邮件对象
-                    'subject': email.subject,
-                    'sender': email.sender,
-                    'received_time': email.received_time,
-                    'classification': classification,
-                    'rule_name': classification_result.get('rule_name', ''),
-                    'explanation': classification_result.get('explanation', '')
-                }
+                logger.info("邮件 '%.50s...' 被 %s 分类为 '%s'", email.subject, method, classification)
+                record_classified(classification_result)
                 
-                result[classification].append(email_result)
+                item = EmailClassifier._email_result(email, classification, classification_result)
                 
             except Exception as e:
-                logger.error(f"处理邮件时出错: {str(e)}", exc_info=True)
+                logger.error("处理邮件时出错: %s", e, exc_info=True)
+                record_classified({'classification': 'error'})
                 # 将错误邮件归类为 'error'
-                if 'error' not in result:
-                    result['error'] = []
-                    
-                # 创建错误结果字典
-                error_result = {
+                item = {
                     'email': email,  # 包含完整的邮件对象
                     'subject': email.subject,
                     'sender': email.sender,
@@ -103,71 +219,295 @@ class EmailClassifier:
                     'rule_name': '',
                     'explanation': f"Error: {str(e)}"
                 }
-                    
-                result['error'].append(error_result)
+            
+            yield item
+
+    @staticmethod
+    def _plan_near_duplicates(emails: List[CCEmail], method: str, rule_results: List[Optional[Dict[str, Any]]],
+                              scope):
+        """
+        对需要进入模型阶段的邮件进行近似重复聚类（见 NearDuplicateDetector.plan）
         
-        # 记录结束时间和统计信息
-        end_time = time.time()
-        duration = end_time - start_time
-        total_emails = len(emails)
-        classified_emails = sum(len(emails_list) for emails_list in result.values())
-        logger.info(f"分类完成，共处理 {classified_emails}/{total_emails} 封邮件，耗时 {duration:.2f} 秒")
-        logger.info(f"分类结果统计: {', '.join([f'{k}: {len(v)}' for k, v in result.items()])}")
+        纯规则方法不参与；需要规则阶段的方法只对批量规则评估后仍未分类的邮件聚类，
+        批量规则评估失败时不聚类。
+        """
+        if method == "decision_tree" or len(emails) == 0 or not NearDuplicateDetector.enabled():
+            return {}, {}, {}
+        if method in ("sequence", "stepgo"):
+            positions = [
+                position for position, rule_result in enumerate(rule_results)
+                if rule_result is not None and rule_result['classification'] == 'unclassified'
+            ]
+        else:
+            positions = list(range(len(emails)))
+        try:
+            return NearDuplicateDetector.plan(emails, positions, scope)
+        except Exception as e:
+            logger.error("近似重复检测出错，逐封分类: %s", e, exc_info=True)
+            return {}, {}, {}
+
+    @staticmethod
+    def _email_result(email: CCEmail, classification: str, classification_result: Dict[str, Any]) -> Dict[str, Any]:
+        """创建邮件结果字典，包含完整的邮件对象"""
+        return {
+            'email': email,  # 包含完整的邮件对象
+            'subject': email.subject,
+            'sender': email.sender,
+            'received_time': email.received_time,
+            'classification': classification,
+            'confidence': classification_result.get('confidence'),
+            'rule_name': classification_result.get('rule_name', ''),
+            'explanation': classification_result.get('explanation', '')
+        }
+
+    # 保存分类结果时更新的字段
+    RESULT_FIELDS = (
+        'categories',
+        'classification_method',
+        'classification_confidence',
+        'classification_reason',
+        'classification_rule',
+    )
+
+    @staticmethod
+    def _apply_result(data: Dict[str, Any], method: str) -> CCEmail:
+        """将分类结果写到邮件对象上（不保存）"""
+        email = data['email']
+        email.categories = data['classification']
+        
+        # 保存分类详情
+        email.classification_method = method
         
+        # 保存置信度（如果有）
+        if data.get('confidence') is not None:
+            email.classification_confidence = data['confidence']
+        
+        # 保存分类理由
+        if 'explanation' in data:
+            email.classification_reason = data['explanation']
+        
+        # 保存匹配规则（如果有）
+        if 'rule_name' in data:
+            email.classification_rule = data['rule_name']
+        return email
+
+    @staticmethod
+    def persist_results(results: Iterable[Dict[str, Any]], method: str, batch_size: Optional[int] = None) -> int:
+        """
+        批量将分类结果写回数据库
+        
+        在一个事务中用 bulk_update 每 batch_size 封邮件执行一条 UPDATE，而不是每封邮件一次往返。
+        新提取了正文纯文本的邮件（见 NormalizedEmail.persist_fields）单独一组，同时更新 normalized_text。
+        
+        Args:
+            results: classify_emails / iter_classify_emails 产出的结果字典
+            method: 分类方法
+            batch_size: 每条 UPDATE 语句更新的邮件数，默认 CLASSIFY_PERSIST_BATCH_SIZE
+            
+        Returns:
+            保存的邮件数
+        """
+        batch_size = batch_size or getattr(settings, 'CLASSIFY_PERSIST_BATCH_SIZE', 200)
+        
+        # 按需要更新的字段分组，bulk_update 要求同一次调用的邮件更新相同的字段
+        groups: Dict[tuple, List[CCEmail]] = {}
+        for data in results:
+            email = EmailClassifier._apply_result(data, method)
+            fields = EmailClassifier.RESULT_FIELDS + tuple(NormalizedEmail.persist_fields(email))
+            groups.setdefault(fields, []).append(email)
+        
+        saved = 0
+        with transaction.atomic():
+            for fields, emails in groups.items():
+                CCEmail.objects.bulk_update(emails, fields, batch_size=batch_size)
+                saved += len(emails)
+        logger.debug("批量保存了 %s 封邮件的分类结果，方法: %s", saved, method)
+        return saved
+
+    @staticmethod
+    async def aclassify_emails(emails: List[CCEmail], method: str = "sequence",
+                               llm_concurrency: Optional[int] = None,
+                               model_concurrency: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        classify_emails 的异步版本，邮件并发处理
+        
+        规则阶段仍在整个批次上一次完成；模型调用在线程中执行，LLM 调用和 FastText/BERT 推理
+        分别受 ASYNC_LLM_CONCURRENCY 和 ASYNC_MODEL_CONCURRENCY 信号量限制。
+        返回结构与 classify_emails 相同，每个分类下邮件的顺序与输入顺序一致。
+        可在异步视图中直接 await，也可在同步代码中通过 asyncio.run 调用。
+        
+        Args:
+            emails: 要分类的邮件列表
+            method: 分类方法 ('decision_tree', 'llm', 'bert', 'fasttext', 'sequence', 'stepgo')
+            llm_concurrency: 同时进行的 LLM 调用数上限
+            model_concurrency: 同时进行的 FastText/BERT 推理数上限
+            
+        Returns:
+            按分类组织的邮件字典
+        """
+        start_time = time.time()
+        logger.info("开始异步分类 %s 封邮件，使用方法: %s", len(emails), method)
+        
+        llm_semaphore = asyncio.Semaphore(llm_concurrency or getattr(settings, 'ASYNC_LLM_CONCURRENCY', 8))
+        model_semaphore = asyncio.Semaphore(model_concurrency or getattr(settings, 'ASYNC_MODEL_CONCURRENCY', 2))
+        
+        # 数据库访问和分类器初始化（如读取 LLM 配置）统一在 sync_to_async 的线程中执行，不在并发任务中进行
+        context = await sync_to_async(ClassificationContext.build)(method)
+        rule_set = context.rule_set
+        rule_results: List[Optional[Dict[str, Any]]] = [None] * len(emails)
+        if method in ("decision_tree", "sequence", "stepgo"):
+            rule_results = await asyncio.to_thread(EmailClassifier.classify_by_rules_batch, emails, rule_set)
+        
+        async def run_model(email: CCEmail, model: str) -> Dict[str, Any]:
+            semaphore = llm_semaphore if model == 'llm' else model_semaphore
+            async with semaphore:
+                return await asyncio.to_thread(
+                    EmailClassifier.get_factory().classify_email, email, model, context.categories, context.tool(model)
+                )
+        
+        async def classify_one(email: CCEmail, rule_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if method == "decision_tree":
+                return rule_result
+            if method == "sequence":
+                if rule_result['classification'] != 'unclassified':
+                    return rule_result
+                return await run_model(email, 'llm')
+            if method != "stepgo":
+                return await run_model(email, method)
+            
+            if rule_result['classification'] != 'unclassified':
+                return rule_result
+            stage_models = context.stage_models
+            if stage_models is None:
+                # parallel 策略：FastText 和 BERT 并发执行
+                fasttext_result, bert_result = await asyncio.gather(
+                    run_model(email, 'fasttext'), run_model(email, 'bert')
+                )
+                passed = [
+                    result for result, model in ((fasttext_result, 'fasttext'), (bert_result, 'bert'))
+                    if context.passes(result, model)
+                ]
+                if context.require_both:
+                    if len(passed) == 2:
+                        return max(passed, key=lambda result: result.get('confidence', 0))
+                elif passed:
+                    return passed[0]
+            else:
+                for model in stage_models:
+                    result = await run_model(email, model)
+                    if context.passes(result, model):
+                        return result
+            
+            result = await run_model(email, 'llm')
+            if context.passes(result, 'llm'):
+                return result
+            return {
+                'classification': 'unclassified',
+                'rule_name': 'Step Classification',
+                'explanation': "所有分类方法都未能提供高置信度的分类结果",
+                'confidence': 0.0
+            }
+        
+        outcomes = await asyncio.gather(
+            *(classify_one(email, rule_result) for email, rule_result in zip(emails, rule_results)),
+            return_exceptions=True
+        )
+        
+        # 按输入顺序组织结果
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for email, outcome in zip(emails, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error("处理邮件时出错: %s", outcome, exc_info=outcome)
+                classification = 'error'
+                outcome = {'rule_name': '', 'explanation': f"Error: {str(outcome)}"}
+            else:
+                classification = outcome.get('classification', 'unknown')
+            record_classified({**outcome, 'classification': classification})
+            result.setdefault(classification, []).append(
+                EmailClassifier._email_result(email, classification, outcome)
+            )
+        
+        duration = time.time() - start_time
+        logger.info("异步分类完成，共处理 %s 封邮件，耗时 %.2f 秒", len(emails), duration)
+        logger.info("分类结果统计: %s", ', '.join([f'{k}: {len(v)}' for k, v in result.items()]))
+        
+        await sync_to_async(RuleStatsRecorder.maybe_flush)(rule_set)
         return result
 
     @staticmethod
-    def _classify_by_decision_tree(email: CCEmail) -> Dict[str, Any]:
+    def _classify_by_decision_tree(email: CCEmail, rule_set: Optional[CompiledRuleSet] = None) -> Dict[str, Any]:
         """使用决策树规则对单个邮件进行分类"""
         try:
-            # 获取所有激活的规则
-            rules = CCEmailClassifyRule.objects.filter(is_active=True).order_by('priority')
-            logger.info(f"获取到 {len(rules)} 条活动规则")
+            # 使用编译后的规则集，未传入时从进程级缓存获取
+            if rule_set is None:
+                rule_set = RuleSetCache.get_rule_set()
+
+            STAGE_EMAILS.labels('rules').inc()
+            with STAGE_LATENCY.labels('rules').time():
+                rule = rule_set.first_match(email)
+            return EmailClassifier._rule_result(email, rule)
 
-            # 遍历规则进行匹配
-            for rule in rules:
-                logger.debug(f"尝试匹配规则: {rule.name}")
-                if EmailClassifier._match_rule(email, rule):
-                    logger.info(f"邮件 '{email.subject[:50]}...' 匹配规则 '{rule.name}'，归类为 '{rule.classification}'")
-                    return {
-                        'classification': rule.classification,
-                        'rule_name': rule.name,
-                        'explanation': f"匹配规则: {rule.name}，规则描述: {rule.description}",
-                        'confidence': 1.0  # 决策树匹配是确定性的，置信度为 1.0
-                    }
+        except Exception as e:
+            logger.error("决策树分类过程中出错: %s", e, exc_info=True)
+            raise
 
-            # 如果没有匹配的规则，归类为未分类
-            logger.info(f"邮件 '{email.subject[:50]}...' 未匹配任何规则，归类为 'unclassified'")
+    @staticmethod
+    def classify_by_rules_batch(emails: List[CCEmail], rule_set: Optional[CompiledRuleSet] = None) -> List[Dict[str, Any]]:
+        """
+        在整个批次上评估决策树规则
+        
+        Args:
+            emails: 要分类的邮件列表
+            rule_set: 编译后的规则集，未传入时从缓存获取
+            
+        Returns:
+            与 emails 一一对应的分类结果字典列表，顺序与逐封评估一致
+        """
+        if rule_set is None:
+            rule_set = RuleSetCache.get_rule_set()
+
+        STAGE_EMAILS.labels('rules').inc(len(emails))
+        with STAGE_LATENCY.labels('rules').time():
+            rules = rule_set.first_match_batch(emails)
+        return [EmailClassifier._rule_result(email, rule) for email, rule in zip(emails, rules)]
+
+    @staticmethod
+    def _rule_result(email: CCEmail, rule: Optional[CompiledRule]) -> Dict[str, Any]:
+        """根据匹配到的规则构建分类结果"""
+        if rule is not None:
+            logger.info("邮件 '%.50s...' 匹配规则 '%s'，归类为 '%s'", email.subject, rule.name, rule.classification)
+            if EmailClassifier._trace_enabled():
+                for detail in rule.explain(EmailFeatures(email)):
+                    logger.debug("- %s: %s", detail['condition'], detail['details'])
             return {
-                'classification': 'unclassified',
-                'rule_name': None,
-                'explanation': "未匹配任何规则",
-                'confidence': 0.0  # 未匹配任何规则，置信度为 0
+                'classification': rule.classification,
+                'rule_name': rule.name,
+                'explanation': rule.explanation,
+                'confidence': 1.0,  # 决策树匹配是确定性的，置信度为 1.0
+                'stage': 'rules'
             }
 
-        except Exception as e:
-            logger.error(f"决策树分类过程中出错: {str(e)}", exc_info=True)
-            raise
+        # 如果没有匹配的规则，归类为未分类
+        logger.info("邮件 '%.50s...' 未匹配任何规则，归类为 'unclassified'", email.subject)
+        return {
+            'classification': 'unclassified',
+            'rule_name': None,
+            'explanation': "未匹配任何规则",
+            'confidence': 0.0  # 未匹配任何规则，置信度为 0
+        }
 
     @staticmethod
-    def _classify_by_ai_agent(email: CCEmail, method: str) -> Dict[str, Any]:
-        """使用 AI 代理对单个邮件进行分类"""
+    def _classify_by_ai_agent(email: CCEmail, method: str,
+                              context: Optional[ClassificationContext] = None) -> Dict[str, Any]:
+        """使用 AI 代理对单个邮件进行分类，context 未传入时单独构建"""
         try:
-            # 获取分类器工厂
-            factory = EmailClassifier.get_factory()
-            
-            # 获取可用的分类
-            categories = [rule.classification for rule in CCEmailClassifyRule.objects.filter(is_active=True)]
-            if not categories:
-                logger.warning("没有可用的分类类别，使用默认类别")
-                categories = ["purchase", "techsupport", "festival", "other"]
-            
-            # 创建分类代理
-            agent = EmailClassificationAgent(categories=categories)
+            # 分类代理、分类类别和分类器都来自批次共享的上下文
+            if context is None:
+                context = ClassificationContext.build(method)
             
             # 进行分类
-            logger.info(f"使用 {method} 方法对邮件 '{email.subject[:50]}...' 进行分类")
-            result = agent.classify_email(email, method=method)
+            logger.info("使用 %s 方法对邮件 '%.50s...' 进行分类", method, email.subject)
+            result = context.agent.classify_email(email, method=method)
             
             # 确保结果包含置信度和理由
             if 'confidence' not in result:
@@ -176,11 +516,11 @@ class EmailClassifier:
             if 'explanation' not in result:
                 result['explanation'] = f"使用 {method} 方法分类"
                 
-            logger.info(f"AI 代理将邮件 '{email.subject[:50]}...' 分类为 '{result['classification']}'，置信度: {result.get('confidence', 'N/A')}")
+            logger.info("AI 代理将邮件 '%.50s...' 分类为 '%s'，置信度: %s", email.subject, result['classification'], result.get('confidence', 'N/A'))
             return result
             
         except Exception as e:
-            logger.error(f"AI 代理分类过程中出错: {str(e)}", exc_info=True)
+            logger.error("AI 代理分类过程中出错: %s", e, exc_info=True)
             return {
                 'classification': 'error',
                 'rule_name': None,
@@ -189,166 +529,53 @@ class EmailClassifier:
             }
 
     @staticmethod
-    def _match_rule(email: CCEmail, rule: CCEmailClassifyRule) -> bool:
-        """检查邮件是否匹配规则"""
-        try:
-            match_results = []
-            has_any_condition = False  # 标记是否有任何条件被设置
-            
-            # 检查发件人域名
-            if rule.sender_domains:
-                has_any_condition = True
-                sender_domain = email.sender.split('@')[-1].lower()
-                is_domain_match = sender_domain in rule.sender_domains
-                match_results.append({
-                    'condition': 'sender_domain',
-                    'matched': is_domain_match,
-                    'details': f"域名 '{sender_domain}' {'匹配' if is_domain_match else '不匹配'}"
-                })
-                if is_domain_match:
-                    logger.info(f"规则 '{rule.name}' 的发件人域名条件匹配成功")
-                    return True
-
-            # 检查主题关键词
-            if rule.subject_keywords:
-                has_any_condition = True
-                subject_matches = [
-                    keyword.lower() for keyword in rule.subject_keywords 
-                    if keyword.lower() in email.subject.lower()
-                ]
-                is_subject_match = len(subject_matches) > 0
-                match_results.append({
-                    'condition': 'subject_keywords',
-                    'matched': is_subject_match,
-                    'details': f"找到关键词: {subject_matches}" if is_subject_match else "未找到任何主题关键词"
-                })
-                if is_subject_match:
-                    logger.info(f"规则 '{rule.name}' 的主题关键词条件匹配成功: {subject_matches}")
-                    return True
-
-            # 检查正文关键词
-            if rule.body_keywords:
-                has_any_condition = True
-                body_matches = [
-                    keyword.lower() for keyword in rule.body_keywords 
-                    if keyword.lower() in email.content.lower()
-                ]
-                is_body_match = len(body_matches) > 0
-                match_results.append({
-                    'condition': 'body_keywords',
-                    'matched': is_body_match,
-                    'details': f"找到关键词: {body_matches}" if is_body_match else "未找到任何正文关键词"
-                })
-                if is_body_match:
-                    logger.info(f"规则 '{rule.name}' 的正文关键词条件匹配成功: {body_matches}")
-                    return True
-
-            # 检查附件数量
-            if rule.min_attachments > 0 or rule.max_attachments:
-                has_any_condition = True
-                is_count_match = True
-                count_details = []
-                
-                if email.attachment_count < rule.min_attachments:
-                    is_count_match = False
-                    count_details.append(f"数量({email.attachment_count})小于最小要求({rule.min_attachments})")
-                
-                if rule.max_attachments and email.attachment_count > rule.max_attachments:
-                    is_count_match = False
-                    count_details.append(f"数量({email.attachment_count})超过最大限制({rule.max_attachments})")
-                
-                match_results.append({
-                    'condition': 'attachment_count',
-                    'matched': is_count_match,
-                    'details': "附件数量符合要求" if is_count_match else ", ".join(count_details)
-                })
-                if is_count_match:
-                    logger.info(f"规则 '{rule.name}' 的附件数量条件匹配成功")
-                    return True
-
-            # 检查附件大小
-            if rule.min_attachment_size > 0 or rule.max_attachment_size:
-                has_any_condition = True
-                is_size_match = True
-                size_details = []
-                
-                if email.total_attachment_size < rule.min_attachment_size:
-                    is_size_match = False
-                    size_details.append(f"大小({email.total_attachment_size}B)小于最小要求({rule.min_attachment_size}B)")
-                
-                if rule.max_attachment_size and email.total_attachment_size > rule.max_attachment_size:
-                    is_size_match = False
-                    size_details.append(f"大小({email.total_attachment_size}B)超过最大限制({rule.max_attachment_size}B)")
-                
-                match_results.append({
-                    'condition': 'attachment_size',
-                    'matched': is_size_match,
-                    'details': "附件大小符合要求" if is_size_match else ", ".join(size_details)
-                })
-                if is_size_match:
-                    logger.info(f"规则 '{rule.name}' 的附件大小条件匹配成功")
-                    return True
-
-            # 记录所有匹配结果
-            logger.debug(f"规则 '{rule.name}' 匹配结果:")
-            for result in match_results:
-                logger.debug(f"- {result['condition']}: {result['details']}")
-
-            # 如果规则没有设置任何条件，返回 False
-            if not has_any_condition:
-                logger.warning(f"规则 '{rule.name}' 未设置任何条件")
-                return False
-
-            # 如果所有条件都检查完还没有返回 True，说明没有任何条件匹配
-            logger.debug(f"规则 '{rule.name}' 的所有条件都不匹配")
-            return False
-
-        except Exception as e:
-            logger.error(f"匹配规则 '{rule.name}' 时出错: {str(e)}", exc_info=True)
-            return False
-
-    @staticmethod
-    def _step_classifier(email: CCEmail) -> Dict[str, Any]:
+    def _step_classifier(email: CCEmail, context: Optional[ClassificationContext] = None,
+                         rule_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         逐步尝试不同的分类器，直到获得可信的分类结果
         
         Args:
             email: 要分类的邮件
+            context: 分类上下文，未传入时单独构建
+            rule_result: 批量规则评估得到的结果，传入时跳过规则匹配
             
         Returns:
             分类结果字典
         """
         try:
             # 1. 首先尝试决策树分类
-            logger.info(f"步进分类：第一步 - 对邮件 '{email.subject[:50]}...' 使用决策树进行分类")
-            result = EmailClassifier._classify_by_decision_tree(email)
+            if context is None:
+                context = ClassificationContext.build("stepgo")
+            
+            logger.info("步进分类：第一步 - 对邮件 '%.50s...' 使用决策树进行分类", email.subject)
+            result = rule_result or EmailClassifier._classify_by_decision_tree(email, context.rule_set)
             
             # 如果决策树分类成功（不是 unclassified），直接返回结果
             if result['classification'] != 'unclassified':
-                logger.info(f"步进分类：邮件通过决策树成功分类为 '{result['classification']}'")
+                logger.info("步进分类：邮件通过决策树成功分类为 '%s'", result['classification'])
                 return result
             
             # 获取模型执行策略
-            strategy = getattr(settings, 'MODEL_EXECUTION_STRATEGY', 'sequential')
-            logger.info(f"使用模型执行策略: {strategy}")
+            strategy = context.strategy
+            logger.info("使用模型执行策略: %s", strategy)
             
             # 2. 根据策略执行模型分类
             if strategy == 'sequential':
                 # 顺序执行模式
-                return EmailClassifier._sequential_model_classification(email)
+                return EmailClassifier._sequential_model_classification(email, context)
             elif strategy == 'parallel':
                 # 并行执行模式
-                return EmailClassifier._parallel_model_classification(email)
+                return EmailClassifier._parallel_model_classification(email, context)
             elif strategy == 'single':
                 # 单模型执行模式
-                return EmailClassifier._single_model_classification(email)
+                return EmailClassifier._single_model_classification(email, context)
             else:
                 # 默认使用顺序执行
-                logger.warning(f"未知的模型执行策略: {strategy}，使用默认的顺序执行模式")
-                return EmailClassifier._sequential_model_classification(email)
+                logger.warning("未知的模型执行策略: %s，使用默认的顺序执行模式", strategy)
+                return EmailClassifier._sequential_model_classification(email, context)
             
         except Exception as e:
-            logger.error(f"步进分类过程中出错: {str(e)}", exc_info=True)
+            logger.error("步进分类过程中出错: %s", e, exc_info=True)
             return {
                 'classification': 'error',
                 'rule_name': 'Step Classification',
@@ -357,65 +584,136 @@ class EmailClassifier:
             }
     
     @staticmethod
-    def _sequential_model_classification(email: CCEmail) -> Dict[str, Any]:
+    def _step_classify_batch(emails: List[CCEmail], context: Optional[ClassificationContext] = None,
+                             rule_results: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        """
+        分阶段批量执行 stepgo 分类
+        
+        先在整个批次上执行规则阶段，未解决的邮件作为一个批次交给 FastText，
+        剩余的再作为一个批次交给 BERT，最后剩余的交给 LLM。与逐封执行的级联结果相同，
+        但每个模型阶段只调用一次批量推理。每个阶段解决的邮件数和耗时记录到日志。
+        
+        Args:
+            emails: 要分类的邮件列表
+            context: 分类上下文，未传入时单独构建（须为非 parallel 策略）
+            rule_results: 批量规则评估得到的结果，缺失的位置重新评估
+            
+        Returns:
+            与 emails 一一对应的分类结果字典列表
+        """
+        if context is None:
+            context = ClassificationContext.build("stepgo")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(emails)
+        rule_results = rule_results or [None] * len(emails)
+        
+        # 1. 规则阶段
+        stage_start = time.perf_counter()
+        pending = []
+        for position, (email, rule_result) in enumerate(zip(emails, rule_results)):
+            result = rule_result or EmailClassifier._classify_by_decision_tree(email, context.rule_set)
+            if result['classification'] != 'unclassified':
+                results[position] = result
+            else:
+                pending.append(position)
+        logger.info(
+            "分阶段分类：rules 阶段处理 %s 封，解决 %s 封，耗时 %.3f 秒",
+            len(emails), len(emails) - len(pending), time.perf_counter() - stage_start
+        )
+        
+        # 2. 模型阶段，每个阶段只处理前面阶段未解决的邮件
+        factory = EmailClassifier.get_factory()
+        for model in context.stage_models + ('llm',):
+            if not pending:
+                break
+            stage_start = time.perf_counter()
+            stage_results = factory.classify_emails_batch(
+                [emails[position] for position in pending], model, context.categories, context.tool(model)
+            )
+            remaining = []
+            for position, result in zip(pending, stage_results):
+                if context.passes(result, model):
+                    results[position] = result
+                else:
+                    remaining.append(position)
+            logger.info(
+                "分阶段分类：%s 阶段处理 %s 封，解决 %s 封，耗时 %.3f 秒",
+                model, len(pending), len(pending) - len(remaining), time.perf_counter() - stage_start
+            )
+            pending = remaining
+        
+        # 所有阶段都未能提供高置信度分类的邮件
+        for position in pending:
+            results[position] = {
+                'classification': 'unclassified',
+                'rule_name': 'Step Classification',
+                'explanation': "所有分类方法都未能提供高置信度的分类结果",
+                'confidence': 0.0
+            }
+        return results
+
+    @staticmethod
+    def _sequential_model_classification(email: CCEmail, context: Optional[ClassificationContext] = None) -> Dict[str, Any]:
         """
         按顺序执行模型分类
         
         Args:
             email: 要分类的邮件
+            context: 分类上下文，未传入时单独构建
             
         Returns:
             分类结果字典
         """
+        if context is None:
+            context = ClassificationContext.build("stepgo")
         # 获取模型执行顺序
-        model_order = getattr(settings, 'MODEL_EXECUTION_ORDER', ['fasttext', 'bert'])
-        logger.info(f"顺序执行模型，顺序为: {model_order}")
+        model_order = context.model_order
+        logger.info("顺序执行模型，顺序为: %s", model_order)
         
         # 按顺序执行模型
         for model in model_order:
             if model == 'fasttext':
                 # 尝试 FastText 分类
-                logger.info(f"步进分类：使用 FastText 进行分类 - 邮件 '{email.subject[:50]}...'")
-                result = EmailClassifier._classify_by_ai_agent(email, 'fasttext')
+                logger.info("步进分类：使用 FastText 进行分类 - 邮件 '%.50s...'", email.subject)
+                result = EmailClassifier._classify_by_ai_agent(email, 'fasttext', context)
                 
                 # 检查 FastText 分类结果的置信度是否高于阈值
                 confidence = result.get('confidence', 0)
                 if (result['classification'] != 'unclassified' and 
                     result['classification'] != 'error' and 
-                    confidence >= settings.FASTTEXT_THRESHOLD):
-                    logger.info(f"步进分类：邮件通过 FastText 成功分类为 '{result['classification']}'，置信度: {confidence}")
+                    confidence >= context.thresholds['fasttext']):
+                    logger.info("步进分类：邮件通过 FastText 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
                     return result
                 else:
-                    logger.info(f"步进分类：FastText 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.FASTTEXT_THRESHOLD}，继续下一步")
+                    logger.info("步进分类：FastText 分类结果 '%s' 置信度 %s 低于阈值 %s，继续下一步", result['classification'], confidence, context.thresholds['fasttext'])
             
             elif model == 'bert':
                 # 尝试 BERT 分类
-                logger.info(f"步进分类：使用 BERT 进行分类 - 邮件 '{email.subject[:50]}...'")
-                result = EmailClassifier._classify_by_ai_agent(email, 'bert')
+                logger.info("步进分类：使用 BERT 进行分类 - 邮件 '%.50s...'", email.subject)
+                result = EmailClassifier._classify_by_ai_agent(email, 'bert', context)
                 
                 # 检查 BERT 分类结果的置信度是否高于阈值
                 confidence = result.get('confidence', 0)
                 if (result['classification'] != 'unclassified' and 
                     result['classification'] != 'error' and 
-                    confidence >= settings.BERT_THRESHOLD):
-                    logger.info(f"步进分类：邮件通过 BERT 成功分类为 '{result['classification']}'，置信度: {confidence}")
+                    confidence >= context.thresholds['bert']):
+                    logger.info("步进分类：邮件通过 BERT 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
                     return result
                 else:
-                    logger.info(f"步进分类：BERT 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.BERT_THRESHOLD}，继续下一步")
+                    logger.info("步进分类：BERT 分类结果 '%s' 置信度 %s 低于阈值 %s，继续下一步", result['classification'], confidence, context.thresholds['bert'])
         
         # 尝试 LLM 分类（作为最后的备选）
-        logger.info(f"步进分类：使用 LLM 进行分类 - 邮件 '{email.subject[:50]}...'")
-        result = EmailClassifier._classify_by_ai_agent(email, 'llm')
+        logger.info("步进分类：使用 LLM 进行分类 - 邮件 '%.50s...'", email.subject)
+        result = EmailClassifier._classify_by_ai_agent(email, 'llm', context)
         
         # 检查 LLM 分类结果的置信度是否高于阈值
         confidence = result.get('confidence', 0)
         if (result['classification'] != 'unclassified' and 
             result['classification'] != 'error' and 
-            confidence >= settings.LLM_THRESHOLD):
-            logger.info(f"步进分类：邮件通过 LLM 成功分类为 '{result['classification']}'，置信度: {confidence}")
+            confidence >= context.thresholds['llm']):
+            logger.info("步进分类：邮件通过 LLM 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
             return result
         else:
-            logger.info(f"步进分类：LLM 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.LLM_THRESHOLD}，分类失败")
+            logger.info("步进分类：LLM 分类结果 '%s' 置信度 %s 低于阈值 %s，分类失败", result['classification'], confidence, context.thresholds['llm'])
             # 如果所有方法都未能提供高置信度的分类，返回 unclassified
             return {
                 'classification': 'unclassified',
@@ -424,76 +722,100 @@ class EmailClassifier:
                 'confidence': 0.0
             }
     
+    @classmethod
+    def _get_model_executor(cls) -> ThreadPoolExecutor:
+        """获取并行模型分类使用的线程池（进程内共享）"""
+        if cls._model_executor is None:
+            with cls._executor_lock:
+                if cls._model_executor is None:
+                    workers = getattr(settings, 'PARALLEL_MODEL_WORKERS', 4)
+                    cls._model_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='model')
+        return cls._model_executor
+
     @staticmethod
-    def _parallel_model_classification(email: CCEmail) -> Dict[str, Any]:
+    def _parallel_model_classification(email: CCEmail, context: Optional[ClassificationContext] = None) -> Dict[str, Any]:
         """
         并行执行模型分类
         
+        FastText 和 BERT 在线程池中并发执行（两者推理时都会释放 GIL），延迟约为两者中较慢的一个。
+        任一模型通过阈值即可时，第一个通过阈值的结果立即返回；能确定两个模型无法满足策略时
+        立即转入 LLM，不再等待另一个模型。
+        
         Args:
             email: 要分类的邮件
+            context: 分类上下文，未传入时单独构建
             
         Returns:
             分类结果字典
         """
-        require_both = getattr(settings, 'PARALLEL_REQUIRE_BOTH', True)
-        logger.info(f"并行执行模型，{'要求两个模型都超过阈值' if require_both else '任一模型超过阈值即可'}")
-        
-        # 执行 FastText 分类
-        logger.info(f"步进分类：使用 FastText 进行分类 - 邮件 '{email.subject[:50]}...'")
-        fasttext_result = EmailClassifier._classify_by_ai_agent(email, 'fasttext')
-        fasttext_confidence = fasttext_result.get('confidence', 0)
-        fasttext_passed = (fasttext_result['classification'] != 'unclassified' and 
-                          fasttext_result['classification'] != 'error' and 
-                          fasttext_confidence >= settings.FASTTEXT_THRESHOLD)
-        
-        logger.info(f"FastText 分类结果: '{fasttext_result['classification']}'，置信度: {fasttext_confidence}，{'通过' if fasttext_passed else '未通过'}阈值")
-        
-        # 执行 BERT 分类
-        logger.info(f"步进分类：使用 BERT 进行分类 - 邮件 '{email.subject[:50]}...'")
-        bert_result = EmailClassifier._classify_by_ai_agent(email, 'bert')
-        bert_confidence = bert_result.get('confidence', 0)
-        bert_passed = (bert_result['classification'] != 'unclassified' and 
-                      bert_result['classification'] != 'error' and 
-                      bert_confidence >= settings.BERT_THRESHOLD)
-        
-        logger.info(f"BERT 分类结果: '{bert_result['classification']}'，置信度: {bert_confidence}，{'通过' if bert_passed else '未通过'}阈值")
-        
-        # 根据策略判断是否分类成功
-        if require_both:
-            # 要求两个模型都通过阈值
-            if fasttext_passed and bert_passed:
-                # 两个模型都通过，选择置信度更高的结果
-                if fasttext_confidence >= bert_confidence:
-                    logger.info(f"两个模型都通过阈值，选择置信度更高的 FastText 结果: '{fasttext_result['classification']}'")
-                    return fasttext_result
+        if context is None:
+            context = ClassificationContext.build("stepgo")
+        require_both = context.require_both
+        logger.info("并行执行模型，%s", '要求两个模型都超过阈值' if require_both else '任一模型超过阈值即可')
+        
+        # 工作线程只读取共享的上下文，不访问数据库
+        factory = EmailClassifier.get_factory()
+        
+        executor = EmailClassifier._get_model_executor()
+        logger.info("步进分类：并行使用 FastText 和 BERT 进行分类 - 邮件 '%.50s...'", email.subject)
+        futures = {
+            executor.submit(factory.classify_email, email, model, context.categories, context.tool(model)): model
+            for model in ('fasttext', 'bert')
+        }
+        results: Dict[str, Dict[str, Any]] = {}
+        passed: Dict[str, bool] = {}
+        pending = set(futures)
+        
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    model = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error("%s 并行分类出错: %s", model, e, exc_info=True)
+                        result = {'classification': 'error', 'confidence': 0.0, 'rule_name': None,
+                                  'explanation': f"分类错误: {str(e)}"}
+                    results[model] = result
+                    passed[model] = context.passes(result, model)
+                    logger.info("%s 分类结果: '%s'，置信度: %s，%s阈值", model, result['classification'], result.get('confidence', 0), '通过' if passed[model] else '未通过')
+            
+                if require_both:
+                    if not all(passed.values()):
+                        # 已有模型未通过阈值，策略不可能满足，不再等待另一个模型
+                        logger.info("并行模式要求两个模型都通过阈值，但未满足条件")
+                        break
+                    if not pending:
+                        # 两个模型都通过，选择置信度更高的结果（相同时优先 FastText）
+                        best = max(('fasttext', 'bert'), key=lambda m: (results[m].get('confidence', 0), m == 'fasttext'))
+                        logger.info("两个模型都通过阈值，选择置信度更高的 %s 结果: '%s'", best, results[best]['classification'])
+                        return results[best]
                 else:
-                    logger.info(f"两个模型都通过阈值，选择置信度更高的 BERT 结果: '{bert_result['classification']}'")
-                    return bert_result
-            else:
-                logger.info("并行模式要求两个模型都通过阈值，但未满足条件")
-        else:
-            # 任一模型通过阈值即可
-            if fasttext_passed:
-                logger.info(f"FastText 通过阈值，使用 FastText 结果: '{fasttext_result['classification']}'")
-                return fasttext_result
-            elif bert_passed:
-                logger.info(f"BERT 通过阈值，使用 BERT 结果: '{bert_result['classification']}'")
-                return bert_result
-            else:
-                logger.info("两个模型都未通过阈值")
+                    # 任一模型通过阈值即可，同时完成时优先 FastText
+                    for model in ('fasttext', 'bert'):
+                        if passed.get(model):
+                            logger.info("%s 通过阈值，使用 %s 结果: '%s'", model, model, results[model]['classification'])
+                            return results[model]
+                    if not pending:
+                        logger.info("两个模型都未通过阈值")
+        finally:
+            # 提前返回时不再等待剩余模型，尚未开始执行的任务直接取消
+            for future in pending:
+                future.cancel()
         
-        # 如果根据策略未能分类成功，尝试 LLM
-        logger.info(f"步进分类：使用 LLM 进行分类 - 邮件 '{email.subject[:50]}...'")
-        llm_result = EmailClassifier._classify_by_ai_agent(email, 'llm')
+        # 如果根据策略未能分类成功，立即尝试 LLM
+        logger.info("步进分类：使用 LLM 进行分类 - 邮件 '%.50s...'", email.subject)
+        llm_result = EmailClassifier._classify_by_ai_agent(email, 'llm', context)
         llm_confidence = llm_result.get('confidence', 0)
         
         if (llm_result['classification'] != 'unclassified' and 
             llm_result['classification'] != 'error' and 
-            llm_confidence >= settings.LLM_THRESHOLD):
-            logger.info(f"步进分类：邮件通过 LLM 成功分类为 '{llm_result['classification']}'，置信度: {llm_confidence}")
+            llm_confidence >= context.thresholds['llm']):
+            logger.info("步进分类：邮件通过 LLM 成功分类为 '%s'，置信度: %s", llm_result['classification'], llm_confidence)
             return llm_result
         else:
-            logger.info(f"步进分类：LLM 分类结果 '{llm_result['classification']}' 置信度 {llm_confidence} 低于阈值 {settings.LLM_THRESHOLD}，分类失败")
+            logger.info("步进分类：LLM 分类结果 '%s' 置信度 %s 低于阈值 %s，分类失败", llm_result['classification'], llm_confidence, context.thresholds['llm'])
             # 如果所有方法都未能提供高置信度的分类，返回 unclassified
             return {
                 'classification': 'unclassified',
@@ -503,79 +825,82 @@ class EmailClassifier:
             }
     
     @staticmethod
-    def _single_model_classification(email: CCEmail) -> Dict[str, Any]:
+    def _single_model_classification(email: CCEmail, context: Optional[ClassificationContext] = None) -> Dict[str, Any]:
         """
         单模型执行分类
         
         Args:
             email: 要分类的邮件
+            context: 分类上下文，未传入时单独构建
             
         Returns:
             分类结果字典
         """
+        if context is None:
+            context = ClassificationContext.build("stepgo")
         # 获取要使用的模型
-        model_choice = getattr(settings, 'SINGLE_MODEL_CHOICE', 'bert')
-        logger.info(f"单模型执行，使用模型: {model_choice}")
+        model_choice = context.single_model
+        logger.info("单模型执行，使用模型: %s", model_choice)
         
         if model_choice == 'fasttext':
             # 使用 FastText 分类
-            logger.info(f"步进分类：使用 FastText 进行分类 - 邮件 '{email.subject[:50]}...'")
-            result = EmailClassifier._classify_by_ai_agent(email, 'fasttext')
+            logger.info("步进分类：使用 FastText 进行分类 - 邮件 '%.50s...'", email.subject)
+            result = EmailClassifier._classify_by_ai_agent(email, 'fasttext', context)
             
             # 检查 FastText 分类结果的置信度是否高于阈值
             confidence = result.get('confidence', 0)
             if (result['classification'] != 'unclassified' and 
                 result['classification'] != 'error' and 
-                confidence >= settings.FASTTEXT_THRESHOLD):
-                logger.info(f"步进分类：邮件通过 FastText 成功分类为 '{result['classification']}'，置信度: {confidence}")
+                confidence >= context.thresholds['fasttext']):
+                logger.info("步进分类：邮件通过 FastText 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
                 return result
             else:
-                logger.info(f"步进分类：FastText 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.FASTTEXT_THRESHOLD}")
+                logger.info("步进分类：FastText 分类结果 '%s' 置信度 %s 低于阈值 %s", result['classification'], confidence, context.thresholds['fasttext'])
         
         elif model_choice == 'bert':
             # 使用 BERT 分类
-            logger.info(f"步进分类：使用 BERT 进行分类 - 邮件 '{email.subject[:50]}...'")
-            result = EmailClassifier._classify_by_ai_agent(email, 'bert')
+            logger.info("步进分类：使用 BERT 进行分类 - 邮件 '%.50s...'", email.subject)
+            result = EmailClassifier._classify_by_ai_agent(email, 'bert', context)
             
             # 检查 BERT 分类结果的置信度是否高于阈值
             confidence = result.get('confidence', 0)
             if (result['classification'] != 'unclassified' and 
                 result['classification'] != 'error' and 
-                confidence >= settings.BERT_THRESHOLD):
-                logger.info(f"步进分类：邮件通过 BERT 成功分类为 '{result['classification']}'，置信度: {confidence}")
+                confidence >= context.thresholds['bert']):
+                logger.info("步进分类：邮件通过 BERT 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
                 return result
             else:
-                logger.info(f"步进分类：BERT 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.BERT_THRESHOLD}")
+                logger.info("步进分类：BERT 分类结果 '%s' 置信度 %s 低于阈值 %s", result['classification'], confidence, context.thresholds['bert'])
         
         else:
-            logger.warning(f"未知的单模型选择: {model_choice}，使用默认的 BERT 模型")
+            logger.warning("未知的单模型选择: %s，使用默认的 BERT 模型", model_choice)
             # 使用 BERT 作为默认选择
-            logger.info(f"步进分类：使用 BERT 进行分类 - 邮件 '{email.subject[:50]}...'")
-            result = EmailClassifier._classify_by_ai_agent(email, 'bert')
+            logger.info("步进分类：使用 BERT 进行分类 - 邮件 '%.50s...'", email.subject)
+            result = EmailClassifier._classify_by_ai_agent(email, 'bert', context)
             
             # 检查 BERT 分类结果的置信度是否高于阈值
             confidence = result.get('confidence', 0)
             if (result['classification'] != 'unclassified' and 
                 result['classification'] != 'error' and 
-                confidence >= settings.BERT_THRESHOLD):
-                logger.info(f"步进分类：邮件通过 BERT 成功分类为 '{result['classification']}'，置信度: {confidence}")
+                confidence >= context.thresholds['bert']):
+                logger.info("步进分类：邮件通过 BERT 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
                 return result
             else:
-                logger.info(f"步进分类：BERT 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.BERT_THRESHOLD}")
+                logger.info("步进分类：BERT 分类结果 '%s' 置信度 %s 低于阈值 %s", result['classification'], confidence, context.thresholds['bert'])
         
         # 尝试 LLM 分类（作为备选）
-        logger.info(f"步进分类：使用 LLM 进行分类 - 邮件 '{email.subject[:50]}...'")
-        result = EmailClassifier._classify_by_ai_agent(email, 'llm')
+        logger.info("步进分类：使用 LLM 进行分类 - 邮件 '%.50s...'", email.subject)
+        result = EmailClassifier._classify_by_ai_agent(email, 'llm', context)
         
         # 检查 LLM 分类结果的置信度是否高于阈值
         confidence = result.get('confidence', 0)
         if (result['classification'] != 'unclassified' and 
             result['classification'] != 'error' and 
-            confidence >= settings.LLM_THRESHOLD):
-            logger.info(f"步进分类：邮件通过 LLM 成功分类为 '{result['classification']}'，置信度: {confidence}")
+            confidence >= context.thresholds['llm']):
+            logger.info("步进分类：邮件通过 LLM 成功分类为 '%s'，置信度: %s", result['classification'], confidence)
             return result
         else:
-            logger.info(f"步进分类：LLM 分类结果 '{result['classification']}' 置信度 {confidence} 低于阈值 {settings.LLM_THRESHOLD}，分类失败")
+            logger.info("步进分类：LLM 分类结果 '%s' 置信度 %s 低于阈值 %s，分类失败", result['classification'], confidence, context.thresholds['llm'])
             # 如果所有方法都未能提供高置信度的分类，返回 unclassified
             return {
                 'classification': 'unclassified',
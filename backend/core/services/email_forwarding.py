@@ -3,7 +3,6 @@ from typing import Dict, List, Any, Optional
 from django.conf import settings
 from django.utils import timezone
 from ..models import CCForwardingRule, CCForwardingAddress, CCEmailForwardingLog
-from django.db import connection
 
 logger = logging.getLogger(__name__)
 
@@ -85,12 +84,91 @@ class EmailForwardingService:
             }
             
         except Exception as e:
-            logger.error(f"获取转发信息时出错: {str(e)}", exc_info=True)
+            logger.error("获取转发信息时出错: %s", e, exc_info=True)
             return {
                 'success': False,
                 'error': f'处理转发请求时出错: {str(e)}'
             }
     
+    @staticmethod
+    def forward_classified_email(classification: str, email_data: Dict[str, Any], graph_service) -> List[Dict[str, Any]]:
+        """
+        根据分类结果转发单封邮件，供逐封产出结果的流式分类在分类后立即转发
+        
+        Args:
+            classification: 邮件的分类
+            email_data: 分类结果中的邮件条目，包含 'email' 对象
+            graph_service: Graph API 服务，用于转发邮件
+            
+        Returns:
+            该邮件的转发结果列表（每个邮件类型一条），跳过或失败时为空
+        """
+        processing_results = []
+        if classification in ['error', 'unclassified']:
+            return processing_results
+        
+        # 获取对应的 email_types
+        email_types = settings.EMAIL_TYPE_MAPPING.get(classification.lower(), [])
+        logger.debug("映射的邮件类型: %s", email_types)
+        
+        email = email_data['email']
+        
+        # 对每个 email_type 进行处理
+        for email_type in email_types:
+            logger.info("处理邮件类型: %s, 邮件: %s", email_type, email.subject)
+            
+            # 获取转发信息
+            logger.debug("获取转发信息")
+            forwarding_info = EmailForwardingService.get_forwarding_info(
+                email_content=email.content,
+                email_type=email_type
+            )
+            
+            if forwarding_info.get('success'):
+                # 转发邮件
+                logger.info("转发邮件到: %s", forwarding_info['forward_addresses'])
+                try:
+                    forward_result = graph_service.forward_email(
+                        email_id=email.message_id,
+                        to_recipients=forwarding_info['forward_addresses'],
+                        forward_comment=forwarding_info['forward_message']
+                    )
+                    
+                    # 创建日志条目
+                    logger.debug("在数据库中创建日志条目")
+                    
+                    log_entry = CCEmailForwardingLog.objects.create(
+                        title=email.subject,
+                        sender=email.sender,
+                        received_time=email.received_time,
+                        classification=classification,
+                        email_type=email_type,
+                        forwarding_recipient=','.join([
+                            addr['email'] for addr in forwarding_info['forward_addresses']
+                        ]),
+                        message_id=email.message_id,
+                        created_at=timezone.now()
+                    )
+                    
+                    logger.debug("创建的日志条目 ID: %s", log_entry.id)
+                    processing_results.append({
+                        'id': log_entry.id,
+                        'title': log_entry.title,
+                        'sender': log_entry.sender,
+                        'received_time': log_entry.received_time,
+                        'classification': log_entry.classification,
+                        'email_type': log_entry.email_type,
+                        'forwarding_recipient': log_entry.forwarding_recipient,
+                        'created_at': log_entry.created_at
+                    })
+                    logger.info("成功处理并转发邮件: %s", email.subject)
+                except Exception as e:
+                    logger.error("转发邮件时出错: %s", e, exc_info=True)
+            else:
+                logger.warning("无法获取邮件的转发信息: %s, 错误: %s", email.subject, forwarding_info.get('error'))
+        
+        return processing_results
+    
     @staticmethod
     def process_classified_emails(classification_results: Dict[str, List[Dict[str, Any]]], graph_service) -> List[Dict[str, Any]]:
         """
@@ -107,83 +185,21 @@ class EmailForwardingService:
         
         # 遍历所有分类
         for classification, emails_data in classification_results.items():
-            logger.info(f"处理分类 '{classification}' 的 {len(emails_data)} 封邮件")
+            logger.info("处理分类 '%s' 的 %s 封邮件", classification, len(emails_data))
             
             # 跳过 'error' 和 'unclassified' 分类
             if classification in ['error', 'unclassified']:
-                logger.info(f"跳过 '{classification}' 分类的邮件")
+                logger.info("跳过 '%s' 分类的邮件", classification)
                 continue
             
-            # 获取对应的 email_types
-            email_types = settings.EMAIL_TYPE_MAPPING.get(classification.lower(), [])
-            logger.debug(f"映射的邮件类型: {email_types}")
-            
-            if not email_types:
-                logger.warning(f"分类 '{classification}' 没有映射的邮件类型")
+            if not settings.EMAIL_TYPE_MAPPING.get(classification.lower(), []):
+                logger.warning("分类 '%s' 没有映射的邮件类型", classification)
                 continue
             
             # 处理每封邮件
             for email_data in emails_data:
-                email = email_data['email']
-                
-                # 对每个 email_type 进行处理
-                for email_type in email_types:
-                    logger.info(f"处理邮件类型: {email_type}, 邮件: {email.subject}")
-                    
-                    # 获取转发信息
-                    logger.debug("获取转发信息")
-                    forwarding_info = EmailForwardingService.get_forwarding_info(
-                        email_content=email.content,
-                        email_type=email_type
-                    )
-                    
-                    if forwarding_info.get('success'):
-                        # 转发邮件
-                        logger.info(f"转发邮件到: {forwarding_info['forward_addresses']}")
-                        try:
-                            forward_result = graph_service.forward_email(
-                                email_id=email.message_id,
-                                to_recipients=forwarding_info['forward_addresses'],
-                                forward_comment=forwarding_info['forward_message']
-                            )
-                            
-                            # 创建日志条目
-                            logger.debug("在数据库中创建日志条目")
-                            
-                            # 获取当前最大 ID 并加 1
-                            with connection.cursor() as cursor:
-                                cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM cc_email_forwarding_log")
-                                next_id = cursor.fetchone()[0]
-                            
-                            log_entry = CCEmailForwardingLog.objects.create(
-                                id=next_id,  # 手动设置 ID
-                                title=email.subject,
-                                sender=email.sender,
-                                received_time=email.received_time,
-                                classification=classification,
-                                email_type=email_type,
-                                forwarding_recipient=','.join([
-                                    addr['email'] for addr in forwarding_info['forward_addresses']
-                                ]),
-                                message_id=email.message_id,
-                                created_at=timezone.now()
-                            )
-                            
-                            logger.debug(f"创建的日志条目 ID: {log_entry.id}")
-                            processing_results.append({
-                                'id': log_entry.id,
-                                'title': log_entry.title,
-                                'sender': log_entry.sender,
-                                'received_time': log_entry.received_time,
-                                'classification': log_entry.classification,
-                                'email_type': log_entry.email_type,
-                                'forwarding_recipient': log_entry.forwarding_recipient,
-                                'created_at': log_entry.created_at
-                            })
-                            logger.info(f"成功处理并转发邮件: {email.subject}")
-                        except Exception as e:
-                            logger.error(f"转发邮件时出错: {str(e)}", exc_info=True)
-                    else:
-                        logger.warning(f"无法获取邮件的转发信息: {email.subject}, 错误: {forwarding_info.get('error')}")
+                processing_results.extend(
+                    EmailForwardingService.forward_classified_email(classification, email_data, graph_service)
+                )
         
         return processing_results 
\ No newline at end of file
@@ -0,0 +1,184 @@
+import re
+from functools import cached_property
+from html import unescape
+from typing import List, Optional
+from django.conf import settings
+
+_WHITESPACE = re.compile(r'\s+')
+
+# 内容不是正文的元素，其中的文本全部跳过
+SKIPPED_ELEMENTS = ('script', 'style', 'noscript', 'template', 'title', 'svg', 'object')
+
+_TAG = re.compile(r'<[^>]+>')
+_SKIPPED_START = re.compile(rf'<!--|<({"|".join(SKIPPED_ELEMENTS)})\b[^>]*?(/?)>', re.IGNORECASE)
+_SKIPPED_END = {tag: re.compile(rf'</{tag}\s*>', re.IGNORECASE) for tag in SKIPPED_ELEMENTS}
+
+# 每次处理的 HTML 字符数，提取的文本达到预算后不再处理后面的部分
+_CHUNK = 32 * 1024
+# 字符实体的最大长度（最长的命名实体 &CounterClockwiseContourIntegral; 为 33 个字符）
+_ENTITY_MAX = 40
+
+def _chunk_end(html_content: str, position: int) -> int:
+    """当前分块的结束位置，不会把一个标签或字符实体切成两半"""
+    limit = position + _CHUNK
+    if limit >= len(html_content):
+        return len(html_content)
+    lt = html_content.rfind('<', position, limit)
+    gt = html_content.rfind('>', position, limit)
+    if lt > gt:
+        if lt > position:
+            return lt
+        gt = html_content.find('>', limit)
+        return len(html_content) if gt < 0 else gt + 1
+    # 分块末尾有未以 ; 结束的 &...（可能是被切开的字符实体）时，在 & 之前结束
+    amp = html_content.rfind('&', max(position, gt + 1, limit - _ENTITY_MAX), limit)
+    if amp > position and ';' not in html_content[amp:limit]:
+        return amp
+    return limit
+
+
+def _clean_fragment(fragment: str) -> str:
+    """去除标签、解码字符实体并合并空白字符"""
+    text = _TAG.sub(' ', fragment)
+    if '&' in text:
+        text = unescape(text)
+    # 转义序列和引号的清理与之前基于正则的实现一致，模型输入格式不变
+    text = text.replace('\\r', ' ').replace('\\n', ' ').replace('\\t', ' ')
+    text = text.replace('"', '').replace("'", "")
+    return _WHITESPACE.sub(' ', text)
+
+
+def extract_text_from_html(html_content: str, max_chars: Optional[int] = None) -> str:
+    """
+    从 HTML 内容中提取纯文本
+
+    按分块从前向后单遍处理：<style>、<script> 等非正文元素和注释整体跳过，
+    其余部分去除标签并解码字符实体；提取的文本达到字符预算后立即停止，不再处理剩余的 HTML。
+
+    Args:
+        html_content: HTML 格式的内容
+        max_chars: 最多提取的字符数，未传入时使用 EMAIL_TEXT_MAX_CHARS，0 表示不限制
+
+    Returns:
+        提取的纯文本，空白字符合并为单个空格
+    """
+    if not html_content:
+        return ""
+    if max_chars is None:
+        max_chars = getattr(settings, 'EMAIL_TEXT_MAX_CHARS', 20000)
+
+    parts: List[str] = []
+    collected = 0
+    position = 0
+    end = len(html_content)
+    while position < end and (not max_chars or collected < max_chars):
+        limit = _chunk_end(html_content, position)
+        skipped = _SKIPPED_START.search(html_content, position, limit)
+        stop = skipped.start() if skipped else limit
+        if stop > position:
+            fragment = _clean_fragment(html_content[position:stop])
+            parts.append(fragment)
+            # 首尾空白在合并相邻片段时会被合并或去除，不计入预算
+            collected += len(fragment.strip())
+        if skipped is None:
+            position = limit
+            continue
+
+        # 跳过注释或非正文元素的全部内容，未闭合时跳过到正文末尾
+        parts.append(' ')
+        tag = skipped.group(1)
+        if tag is None:
+            closing = html_content.find('-->', skipped.end())
+            position = end if closing < 0 else closing + 3
+        elif skipped.group(2):
+            position = skipped.end()
+        else:
+            closing = _SKIPPED_END[tag.lower()].search(html_content, skipped.end())
+            position = closing.end() if closing else end
+
+    text = _WHITESPACE.sub(' ', ''.join(parts)).strip()
+    return text[:max_chars] if max_chars else text
+
+
+class NormalizedEmail:
+    """
+    邮件的预处理结果
+
+    每封邮件只构建一次（缓存在邮件对象上），规则匹配、FastText、BERT、LLM、结果缓存和近似重复检测
+    共用同一份清洗后的文本、小写主题和正文、发件人域名和长度统计；各属性在首次访问时计算。
+
+    CCEmail.normalized_text 已有值时直接使用，不再解析 HTML。未保存时，若启用了
+    EMAIL_NORMALIZED_TEXT_PERSIST，清洗后的文本会写回邮件对象，保存分类结果时通过
+    persist_fields 一并写入数据库，之后重新分类可跳过 HTML 解析。
+    """
+
+    _CACHE_ATTR = '_normalized_email'
+
+    def __init__(self, email):
+        self.email = email
+        self.subject = email.subject or ""
+        self.content = email.content or ""
+        self.sender = email.sender or ""
+        self.text_extracted = False
+
+    @classmethod
+    def of(cls, email) -> 'NormalizedEmail':
+        """获取邮件的预处理结果，邮件的主题、正文或发件人变化后重新构建"""
+        cached = email.__dict__.get(cls._CACHE_ATTR)
+        if (cached is None or cached.content != (email.content or "")
+                or cached.subject != (email.subject or "") or cached.sender != (email.sender or "")):
+            cached = cls(email)
+            email.__dict__[cls._CACHE_ATTR] = cached
+        return cached
+
+    @cached_property
+    def clean_text(self) -> str:
+        """去除 HTML 标签后的正文纯文本"""
+        stored = getattr(self.email, 'normalized_text', None)
+        if stored is not None:
+            return stored
+        text = extract_text_from_html(self.content)
+        self.text_extracted = True
+        if getattr(settings, 'EMAIL_NORMALIZED_TEXT_PERSIST', True) and hasattr(self.email, 'normalized_text'):
+            self.email.normalized_text = text
+        return text
+
+    @cached_property
+    def subject_lower(self) -> str:
+        return self.subject.lower()
+
+    @cached_property
+    def content_lower(self) -> str:
+        """原始正文（含 HTML）的小写形式，规则的正文关键词和模式在其上匹配"""
+        return self.content.lower()
+
+    @cached_property
+    def text_lower(self) -> str:
+        """清洗后正文的小写形式"""
+        return self.clean_text.lower()
+
+    @cached_property
+    def sender_domain(self) -> str:
+        return self.sender.split('@')[-1].lower()
+
+    @property
+    def content_length(self) -> int:
+        return len(self.content)
+
+    @property
+    def text_length(self) -> int:
+        return len(self.clean_text)
+
+    @cached_property
+    def word_count(self) -> int:
+        return len(self.clean_text.split())
+
+    @classmethod
+    def persist_fields(cls, email) -> List[str]:
+        """本次运行中新提取了纯文本、需要随分类结果一起保存的字段"""
+        cached = email.__dict__.get(cls._CACHE_ATTR)
+        if (cached is not None and cached.text_extracted
+                and getattr(settings, 'EMAIL_NORMALIZED_TEXT_PERSIST', True)
+                and getattr(email, 'normalized_text', None) is not None):
+            return ['normalized_text']
+        return []
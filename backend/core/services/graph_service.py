@@ -3,6 +3,7 @@ import requests
 from typing import Dict, List, Any, Optional
 from django.utils import timezone
 from datetime import timedelta
+from ..metrics import GRAPH_REQUESTS, STAGE_LATENCY
 from ..models import CCUserMailInfo
 
 logger = logging.getLogger(__name__)
@@ -53,7 +54,7 @@ class GraphService:
         }
 
         try:
-            logger.debug(f"刷新访问令牌: {token_url}")
+            logger.debug("刷新访问令牌: %s", token_url)
             response = requests.post(token_url, data=data)
             response.raise_for_status()
             token_data = response.json()
@@ -72,7 +73,7 @@ class GraphService:
             logger.debug("成功刷新访问令牌")
             return self.user_mail.access_token
         except Exception as e:
-            logger.error(f"刷新访问令牌失败: {str(e)}")
+            logger.error("刷新访问令牌失败: %s", e)
             raise
 
     def _get_headers(self) -> dict:
@@ -115,27 +116,34 @@ class GraphService:
                 "comment": forward_comment
             }
             
-            logger.debug(f"转发邮件: {url}")
-            logger.debug(f"收件人: {formatted_recipients}")
+            logger.debug("转发邮件: %s", url)
+            logger.debug("收件人: %s", formatted_recipients)
             
-            # 发送请求
-            response = requests.post(url, headers=self._get_headers(), json=data)
+            # 发送请求（只统计 Graph API 请求本身的耗时，不含获取令牌）
+            headers = self._get_headers()
+            try:
+                with STAGE_LATENCY.labels('graph_forward').time():
+                    response = requests.post(url, headers=headers, json=data)
+            except requests.exceptions.RequestException:
+                GRAPH_REQUESTS.labels('forward', 'error').inc()
+                raise
+            GRAPH_REQUESTS.labels('forward', str(response.status_code)).inc()
             response.raise_for_status()
             
-            logger.info(f"成功转发邮件 {email_id} 给 {', '.join([r['email'] for r in to_recipients])}")
+            logger.info("成功转发邮件 %s 给 %s", email_id, ', '.join([r['email'] for r in to_recipients]))
             return {
                 'success': True,
                 'message': f"成功转发邮件给 {len(to_recipients)} 个收件人"
             }
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"转发邮件时出错: {str(e)}", exc_info=True)
+            logger.error("转发邮件时出错: %s", e, exc_info=True)
             return {
                 'success': False,
                 'error': f"转发邮件时出错: {str(e)}"
             }
         except Exception as e:
-            logger.error(f"转发邮件时出现意外错误: {str(e)}", exc_info=True)
+            logger.error("转发邮件时出现意外错误: %s", e, exc_info=True)
             return {
                 'success': False,
                 'error': f"转发邮件时出现意外错误: {str(e)}"
@@ -0,0 +1,130 @@
+import logging
+from collections import deque
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+try:
+    import ahocorasick  # pyahocorasick，可选的 C 实现
+except ImportError:  # pragma: no cover - 依赖可选
+    ahocorasick = None
+
+
+class KeywordAutomaton:
+    """
+    多模式关键词匹配器（Aho-Corasick 自动机）
+
+    将所有关键词编译为一个自动机，对文本只扫描一遍即可得到所有命中关键词对应的标签。
+    安装了 pyahocorasick 时使用其 C 实现，否则使用纯 Python 实现。
+    关键词和待匹配文本都应预先转为小写。
+    """
+
+    def __init__(self):
+        self._keywords: Dict[str, Set[Hashable]] = {}
+        self._always: Set[Hashable] = set()  # 空关键词总是命中
+        self._built = False
+        self._automaton = None
+        # 纯 Python 实现的状态表
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        self._output: List[FrozenSet[Hashable]] = []
+
+    def add(self, keyword: str, tag: Hashable) -> None:
+        """添加关键词及其标签，同一关键词可以对应多个标签"""
+        if self._built:
+            raise RuntimeError("Automaton already built")
+        if not keyword:
+            self._always.add(tag)
+            return
+        self._keywords.setdefault(keyword, set()).add(tag)
+
+    def __len__(self) -> int:
+        return len(self._keywords) + (1 if self._always else 0)
+
+    def build(self) -> 'KeywordAutomaton':
+        """编译自动机"""
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for keyword, tags in self._keywords.items():
+                automaton.add_word(keyword, frozenset(tags))
+            if self._keywords:
+                automaton.make_automaton()
+                self._automaton = automaton
+        else:
+            self._build_python()
+        self._built = True
+        return self
+
+    def _build_python(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[Hashable]] = [set()]
+
+        for keyword, tags in self._keywords.items():
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(set())
+                state = next_state
+            output[state].update(tags)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] |= output[fail[next_state]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = [frozenset(tags) for tags in output]
+
+    def search(self, text: str) -> Set[Hashable]:
+        """
+        扫描文本一次，返回所有命中关键词的标签集合
+
+        Args:
+            text: 已小写化的文本
+
+        Returns:
+            命中的标签集合
+        """
+        if not self._built:
+            raise RuntimeError("Automaton not built")
+
+        found: Set[Hashable] = set(self._always)
+        if not self._keywords or not text:
+            return found
+
+        if self._automaton is not None:
+            for _, tags in self._automaton.iter(text):
+                found |= tags
+            return found
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+    @classmethod
+    def from_keywords(cls, items: Iterable) -> 'KeywordAutomaton':
+        """从 (关键词, 标签) 序列构建自动机"""
+        automaton = cls()
+        for keyword, tag in items:
+            automaton.add(keyword, tag)
+        return automaton.build()
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from typing import List, Optional
 import requests
 from django.utils import timezone
+from ..metrics import GRAPH_REQUESTS, STAGE_LATENCY
 from ..models import CCUserMailInfo, CCEmail
 
 logger = logging.getLogger(__name__)
@@ -49,7 +50,7 @@ class OutlookMailService:
         }
 
         try:
-            logger.debug(f"刷新访问令牌: {token_url}")
+            logger.debug("刷新访问令牌: %s", token_url)
             response = requests.post(token_url, data=data)
             response.raise_for_status()
             token_data = response.json()
@@ -68,7 +69,7 @@ class OutlookMailService:
             logger.debug("成功刷新访问令牌")
             return self.user_mail.access_token
         except Exception as e:
-            logger.error(f"刷新访问令牌失败: {str(e)}")
+            logger.error("刷新访问令牌失败: %s", e)
             raise
 
     def _get_headers(self) -> dict:
@@ -104,11 +105,18 @@ class OutlookMailService:
             # 构建查询URL - 修改为只获取收件箱邮件
             url = f"{self.GRAPH_API_BASE}/users/{self.user_mail.email}/mailFolders/inbox/messages"
             
-            logger.debug(f"获取收件箱邮件，参数: {params}")
-            response = requests.get(url, headers=self._get_headers(), params=params)
+            logger.debug("获取收件箱邮件，参数: %s", params)
+            headers = self._get_headers()
+            try:
+                with STAGE_LATENCY.labels('graph_fetch').time():
+                    response = requests.get(url, headers=headers, params=params)
+            except requests.exceptions.RequestException:
+                GRAPH_REQUESTS.labels('fetch', 'error').inc()
+                raise
+            GRAPH_REQUESTS.labels('fetch', str(response.status_code)).inc()
             response.raise_for_status()
             emails_data = response.json().get('value', [])
-            logger.info(f"成功获取 {len(emails_data)} 封收件箱邮件")
+            logger.info("成功获取 %s 封收件箱邮件", len(emails_data))
 
             # 处理邮件数据
             processed_emails = []
@@ -146,10 +154,10 @@ class OutlookMailService:
             return processed_emails
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"获取邮件时出错: {str(e)}", exc_info=True)
+            logger.error("获取邮件时出错: %s", e, exc_info=True)
             raise
         except Exception as e:
-            logger.error(f"获取邮件时出现意外错误: {str(e)}", exc_info=True)
+            logger.error("获取邮件时出现意外错误: %s", e, exc_info=True)
             raise
 
     def _mark_as_read(self, message_id: str) -> None:
@@ -162,5 +170,5 @@ class OutlookMailService:
             response = requests.patch(url, headers=self._get_headers(), json=data)
             response.raise_for_status()
         except Exception as e:
-            logger.error(f"Error marking email as read: {str(e)}")
+            logger.error("Error marking email as read: %s", e)
             raise 
\ No newline at end of file
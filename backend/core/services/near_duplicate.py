@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from django.conf import settings
+from .email_normalizer import NormalizedEmail
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_DIGITS = re.compile(r'\d+')
+
+
+def simhash(text: str, shingle_size: int = 3, min_tokens: int = 0) -> Optional[int]:
+    """
+    计算文本的 64 位 SimHash 指纹
+
+    文本小写化、数字串统一替换为 '#'（订单号、工单号等不影响指纹），按词 n-gram 切片；
+    每个切片取 64 位哈希，各位按"1 加 0 减"累加后取符号得到指纹。
+    内容相近的文本指纹的汉明距离也很小。
+
+    Args:
+        text: 文本
+        shingle_size: 每个切片包含的词数
+        min_tokens: 词数少于该值时不计算指纹（短文本的指纹不可靠）
+
+    Returns:
+        指纹整数，文本过短时返回 None
+    """
+    tokens = _TOKEN.findall(_DIGITS.sub('#', (text or '').lower()))
+    if not tokens or len(tokens) < min_tokens:
+        return None
+
+    size = min(shingle_size, len(tokens))
+    shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles)
+
+    # (切片数, 64) 的位矩阵，按列统计 1 的个数
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    ones = bits.sum(axis=0)
+    fingerprint_bits = (ones * 2 > len(shingles)).astype(np.uint8)
+    return int.from_bytes(np.packbits(fingerprint_bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex:
+    """
+    SimHash 近邻索引（分段索引）
+
+    指纹被切成 max_distance + 1 段，汉明距离不超过 max_distance 的两个指纹至少有一段完全相同
+    （抽屉原理），因此只需比较至少一段相同的候选指纹。
+    设置 capacity 时按 LRU 淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_distance: int, capacity: Optional[int] = None):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        bands = max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        self._bands = [
+            (band * width, FINGERPRINT_BITS if band == bands - 1 else (band + 1) * width)
+            for band in range(bands)
+        ]
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _band_values(self, fingerprint: int):
+        for start, end in self._bands:
+            yield (fingerprint >> start) & ((1 << (end - start)) - 1)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: Hashable, fingerprint: int, payload: Any = None) -> None:
+        """添加条目，key 已存在时覆盖"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fingerprint, payload)
+            for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+                buckets.setdefault(value, set()).add(key)
+            if self.capacity:
+                while len(self._entries) > self.capacity:
+                    self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        fingerprint, _ = self._entries.pop(key)
+        for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+            bucket = buckets.get(value)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[value]
+
+    def query(self, fingerprint: int) -> Optional[Tuple[Hashable, Any, int]]:
+        """
+        查找距离最近且不超过 max_distance 的条目
+
+        Returns:
+            (key, payload, 汉明距离)，没有时返回 None
+        """
+        with self._lock:
+            candidates = set()
+            for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+                candidates |= buckets.get(value, set())
+
+            best = None
+            for key in candidates:
+                distance = hamming_distance(fingerprint, self._entries[key][0])
+                if distance <= self.max_distance and (best is None or distance < best[2]):
+                    best = (key, self._entries[key][1], distance)
+            if best is not None:
+                self._entries.move_to_end(best[0])
+            return best
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for buckets in self._buckets:
+                buckets.clear()
+
+
+class NearDuplicateDetector:
+    """
+    近似重复邮件检测
+
+    对一批邮件的清洗后文本计算 SimHash，在批次内聚类，并查询最近分类过的邮件指纹索引。
+    每个簇只有代表邮件进入模型阶段，其他成员继承代表的结果；命中最近索引的邮件直接继承
+    之前的结果。相似度阈值（NEAR_DUPLICATE_THRESHOLD，1 - 汉明距离/64）和索引大小
+    （NEAR_DUPLICATE_INDEX_SIZE）可配置。
+
+    最近索引按范围（分类方法、CLASSIFICATION_MODEL_VERSIONS 和可用分类，见 scope）分开保存，
+    与分类结果缓存的键一致：不同方法的结果互不继承，模型版本或分类类别变化后旧结果不再命中。
+    """
+
+    # 最多保留的最近索引数（范围数），按 LRU 淘汰
+    MAX_SCOPES = 16
+
+    _lock = threading.Lock()
+    _recent: "OrderedDict[Hashable, SimHashIndex]" = OrderedDict()
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'NEAR_DUPLICATE_ENABLED', True)
+
+    @staticmethod
+    def max_distance() -> int:
+        threshold = getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.90)
+        return max(0, int((1 - threshold) * FINGERPRINT_BITS))
+
+    @staticmethod
+    def scope(method: str, categories: Iterable[str] = ()) -> Tuple[str, Tuple, Tuple[str, ...]]:
+        """最近索引的范围：分类方法、各模型版本和排序后的可用分类"""
+        versions = getattr(settings, 'CLASSIFICATION_MODEL_VERSIONS', {})
+        return (
+            method,
+            tuple(sorted((model, str(version)) for model, version in versions.items())),
+            tuple(sorted(categories)),
+        )
+
+    @classmethod
+    def recent_index(cls, scope: Hashable) -> SimHashIndex:
+        """进程级的最近指纹索引（每个范围一个），阈值或容量配置变化时重建"""
+        max_distance = cls.max_distance()
+        capacity = getattr(settings, 'NEAR_DUPLICATE_INDEX_SIZE', 5000)
+        with cls._lock:
+            index = cls._recent.get(scope)
+            if index is None or index.max_distance != max_distance or index.capacity != capacity:
+                index = cls._recent[scope] = SimHashIndex(max_distance, capacity)
+            cls._recent.move_to_end(scope)
+            while len(cls._recent) > cls.MAX_SCOPES:
+                cls._recent.popitem(last=False)
+        return index
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空所有范围的最近索引"""
+        with cls._lock:
+            cls._recent.clear()
+
+    @staticmethod
+    def fingerprint(email) -> Optional[int]:
+        """计算邮件主题和清洗后正文的指纹"""
+        normalized = NormalizedEmail.of(email)
+        text = f"{normalized.subject} {normalized.clean_text}"
+        return simhash(text, min_tokens=getattr(settings, 'NEAR_DUPLICATE_MIN_TOKENS', 10))
+
+    @classmethod
+    def plan(cls, emails: Sequence, positions: Sequence[int],
+             scope: Hashable) -> Tuple[Dict[int, Tuple[int, int]], Dict[int, Dict[str, Any]], Dict[int, int]]:
+        """
+        对指定位置的邮件聚类
+
+        Args:
+            emails: 邮件列表
+            positions: 参与检测的邮件位置（如未被规则解决的邮件）
+            scope: 最近索引的范围（见 scope），只继承同一范围内的结果
+
+        Returns:
+            (members, inherited, fingerprints)：
+            members 为 成员位置 -> (代表位置, 汉明距离)；
+            inherited 为 命中最近索引的位置 -> 继承的结果；
+            fingerprints 为 代表位置 -> 指纹，供分类完成后写入最近索引
+        """
+        members: Dict[int, Tuple[int, int]] = {}
+        inherited: Dict[int, Dict[str, Any]] = {}
+        fingerprints: Dict[int, int] = {}
+
+        recent = cls.recent_index(scope)
+        batch_index = SimHashIndex(recent.max_distance)
+        for position in positions:
+            fingerprint = cls.fingerprint(emails[position])
+            if fingerprint is None:
+                continue
+
+            match = recent.query(fingerprint)
+            if match is not None:
+                _, payload, distance = match
+                inherited[position] = cls.inherit(payload, payload['source'], distance)
+                continue
+
+            match = batch_index.query(fingerprint)
+            if match is not None:
+                representative, _, distance = match
+                members[position] = (representative, distance)
+            else:
+                batch_index.add(position, fingerprint)
+                fingerprints[position] = fingerprint
+
+        if members or inherited:
+            logger.info(
+                "近似重复检测：%s 封邮件中 %s 封与批次内代表邮件近似，%s 封命中最近分类的邮件",
+                len(positions), len(members), len(inherited)
+            )
+        return members, inherited, fingerprints
+
+    @staticmethod
+    def describe(email) -> str:
+        return f"'{(email.subject or '')[:50]}' ({email.message_id or email.pk})"
+
+    @staticmethod
+    def inherit(result: Dict[str, Any], source: str, distance: int) -> Dict[str, Any]:
+        """
+        构建继承的分类结果，在理由中记录继承来源
+
+        Args:
+            result: 代表邮件的分类结果
+            source: 代表邮件的描述
+            distance: 与代表邮件指纹的汉明距离
+        """
+        similarity = 1 - distance / FINGERPRINT_BITS
+        inherited = {key: value for key, value in result.items() if key != 'source'}
+        inherited['explanation'] = (
+            f"继承自近似重复邮件 {source}（相似度 {similarity:.2f}）: {result.get('explanation', '')}"
+        )
+        inherited['inherited_from'] = source
+        return inherited
+
+    @classmethod
+    def remember(cls, email, fingerprint: int, result: Dict[str, Any], scope: Hashable) -> None:
+        """将代表邮件的有效分类结果写入该范围的最近索引"""
+        if result.get('classification') in (None, 'unclassified', 'error'):
+            return
+        payload = {
+            'classification': result['classification'],
+            'confidence': result.get('confidence', 0.0),
+            'rule_name': result.get('rule_name'),
+            'explanation': result.get('explanation', ''),
+            'source': cls.describe(email),
+        }
+        cls.recent_index(scope).add(fingerprint, fingerprint, payload)
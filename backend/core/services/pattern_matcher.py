@@ -0,0 +1,231 @@
+import fnmatch
+import logging
+import re
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover - 旧版本 Python
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+PATTERN_SYNTAX_REGEX = 'regex'
+PATTERN_SYNTAX_GLOB = 'glob'
+
+# 单个模式的最大长度
+MAX_PATTERN_LENGTH = 500
+
+_REPEAT_OPS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def translate_pattern(pattern: str, syntax: str = PATTERN_SYNTAX_REGEX) -> str:
+    """
+    将规则中的模式转换为正则表达式
+
+    regex 模式在文本中任意位置匹配；glob 模式（*、?、[...]）需匹配整个字段，如 *@vendor.com
+
+    Args:
+        pattern: 规则中配置的模式
+        syntax: 'regex' 或 'glob'
+
+    Returns:
+        正则表达式字符串
+    """
+    if syntax == PATTERN_SYNTAX_GLOB:
+        return r'\A' + fnmatch.translate(pattern)
+    if syntax != PATTERN_SYNTAX_REGEX:
+        raise ValueError(f"不支持的模式语法: {syntax}")
+    return pattern
+
+
+def _first_chars(items) -> Optional[Set[int]]:
+    """估算子模式可能匹配的首字符集合，无法确定时返回 None"""
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            return {av}
+        if op == sre_parse.IN:
+            chars: Set[int] = set()
+            for item_op, item_av in av:
+                if item_op == sre_parse.LITERAL:
+                    chars.add(item_av)
+                elif item_op == sre_parse.RANGE and item_av[1] - item_av[0] < 256:
+                    chars.update(range(item_av[0], item_av[1] + 1))
+                else:
+                    return None
+            return chars
+        if op == sre_parse.SUBPATTERN:
+            return _first_chars(av[-1])
+        if op in (sre_parse.AT,):
+            continue
+        return None
+    return None
+
+
+def _check_backtracking(items, outer_high: int = 1) -> Optional[str]:
+    """
+    检查可能导致灾难性回溯的结构，返回问题描述
+
+    outer_high 为外层重复次数上限中的最大值（不在重复中时为 1）。检查两类经典结构：
+    重复内部嵌套了可变长度的重复，即无上限重复中的可变长度重复，如 (a+)+、(\\w+\\s?)*，
+    以及上限大于 1 的重复中的无上限重复，如 (a+){1,50}；无上限重复内部的分支首字符可能相同，如 (a|ab)*。
+    此外禁止反向引用和条件分组，它们在合并后的表达式中分组编号会变化。
+    """
+    in_unbounded_repeat = outer_high == sre_parse.MAXREPEAT
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            low, high, sub = av
+            if (in_unbounded_repeat and high > 1 and low != high) or (outer_high > 1 and high == sre_parse.MAXREPEAT):
+                return "重复中嵌套了可变长度的重复，存在灾难性回溯风险"
+            problem = _check_backtracking(sub, max(outer_high, high))
+            if problem:
+                return problem
+        elif op == sre_parse.BRANCH:
+            branches = av[1]
+            if in_unbounded_repeat:
+                seen: Set[int] = set()
+                for branch in branches:
+                    chars = _first_chars(branch)
+                    if chars is None or chars & seen:
+                        return "无上限重复中的分支可能匹配相同的前缀，存在灾难性回溯风险"
+                    seen |= chars
+            for branch in branches:
+                problem = _check_backtracking(branch, outer_high)
+                if problem:
+                    return problem
+        elif op == sre_parse.SUBPATTERN:
+            problem = _check_backtracking(av[-1], outer_high)
+            if problem:
+                return problem
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            problem = _check_backtracking(av[1], outer_high)
+            if problem:
+                return problem
+        elif op == sre_parse.GROUPREF:
+            return "不支持反向引用"
+        elif op == sre_parse.GROUPREF_EXISTS:
+            return "不支持条件分组"
+    return None
+
+
+def validate_pattern(pattern: str, syntax: str = PATTERN_SYNTAX_REGEX) -> None:
+    """
+    校验规则模式，不合法或存在灾难性回溯风险时抛出 ValueError
+
+    模式会与其他规则的模式合并为一个正则表达式，因此同时禁止命名分组、反向引用和全局内联标志。
+
+    Args:
+        pattern: 规则中配置的模式
+        syntax: 'regex' 或 'glob'
+    """
+    if not isinstance(pattern, str) or not pattern:
+        raise ValueError("模式必须是非空字符串")
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"模式长度超过 {MAX_PATTERN_LENGTH} 个字符: {pattern[:50]}...")
+
+    regex = translate_pattern(pattern, syntax)
+    try:
+        # 以合并后的形式编译，全局内联标志（如开头的 (?i)）在分组内会报错
+        re.compile(f"(?:{regex})")
+        parsed = sre_parse.parse(regex)
+    except (re.error, OverflowError, RecursionError) as e:
+        raise ValueError(f"无效的模式 '{pattern}': {str(e)}")
+
+    if parsed.state.groupdict:
+        raise ValueError(f"模式 '{pattern}' 不能包含命名分组")
+
+    # glob 转换结果只包含原子分组和 .*，无需检查
+    if syntax == PATTERN_SYNTAX_REGEX:
+        problem = _check_backtracking(list(parsed))
+        if problem:
+            raise ValueError(f"模式 '{pattern}' 不安全: {problem}")
+
+
+class PatternMatcher:
+    """
+    多规则正则合并匹配器
+
+    同一字段上所有规则的模式按规则顺序合并为一个带命名分组的交替表达式，
+    每个分支包在零宽前瞻 (?=...) 中，使 finditer 在文本的每个位置都尝试匹配。
+    正则引擎在每个位置返回最靠前的匹配分支，因此整个文本扫描一遍得到的最小标签
+    就是首个匹配的规则；不需要为每条规则单独执行一次正则。
+    """
+
+    def __init__(self):
+        self._patterns: List[Tuple[Hashable, List[str]]] = []
+        self._regex: Optional[re.Pattern] = None
+        self._groups: Dict[str, Hashable] = {}
+        self._single: Dict[Hashable, re.Pattern] = {}
+        self._built = False
+
+    def add(self, tag: Hashable, patterns: Iterable[str]) -> None:
+        """添加一个标签（规则）及其正则表达式列表，标签应按优先级顺序添加"""
+        if self._built:
+            raise RuntimeError("Matcher already built")
+        patterns = list(patterns)
+        if patterns:
+            self._patterns.append((tag, patterns))
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def build(self) -> 'PatternMatcher':
+        """编译合并后的正则表达式"""
+        branches = []
+        for position, (tag, patterns) in enumerate(self._patterns):
+            group = f"r{position}"
+            self._groups[group] = tag
+            alternation = '|'.join(f"(?:{pattern})" for pattern in patterns)
+            branches.append(f"(?P<{group}>{alternation})")
+            self._single[tag] = re.compile(alternation, re.IGNORECASE)
+        if branches:
+            self._regex = re.compile(f"(?=(?:{'|'.join(branches)}))", re.IGNORECASE)
+        self._built = True
+        return self
+
+    def first(self, text: str, limit: Optional[Hashable] = None) -> Optional[Hashable]:
+        """
+        扫描文本一次，返回命中的最小标签
+
+        Args:
+            text: 待匹配的文本
+            limit: 已知命中的最小标签；只有更小的标签才会改变结果
+
+        Returns:
+            命中的最小标签，未命中时返回 None
+        """
+        if not self._built:
+            raise RuntimeError("Matcher not built")
+        if self._regex is None or text is None:
+            return None
+        if limit is not None and not self._patterns[0][0] < limit:
+            return None
+
+        first_tag = self._patterns[0][0]
+        best = None
+        for match in self._regex.finditer(text):
+            # 规则分组包住了模式内部的分组，最后闭合的总是规则分组
+            tag = self._groups[match.lastgroup]
+            if best is None or tag < best:
+                best = tag
+                if best == first_tag:
+                    break
+        if best is not None and limit is not None and not best < limit:
+            return None
+        return best
+
+    def search_all(self, text: str) -> Set[Hashable]:
+        """返回所有命中的标签（逐个标签检查，用于需要完整结果的场景）"""
+        if not self._built:
+            raise RuntimeError("Matcher not built")
+        if not text:
+            text = ""
+        return {tag for tag, regex in self._single.items() if regex.search(text)}
+
+    @classmethod
+    def from_patterns(cls, items: Iterable[Tuple[Hashable, Iterable[str]]]) -> 'PatternMatcher':
+        """从 (标签, 正则表达式列表) 序列构建匹配器"""
+        matcher = cls()
+        for tag, patterns in items:
+            matcher.add(tag, patterns)
+        return matcher.build()
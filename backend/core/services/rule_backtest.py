@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from ..models import CCEmail, CCEmailClassifyRule
+from .rule_engine import CompiledRuleSet
+
+logger = logging.getLogger(__name__)
+
+# 回测时从数据库读取的邮件字段，只传输匹配所需的列
+EMAIL_FIELDS = (
+    'id', 'subject', 'content', 'sender', 'attachment_count', 'total_attachment_size',
+    'categories', 'classification_rule',
+)
+
+# 候选规则 JSON 中允许的字段
+RULE_FIELDS = (
+    'id', 'name', 'description', 'sender_domains', 'match_subdomains', 'subject_keywords', 'body_keywords',
+    'subject_patterns', 'body_patterns', 'sender_patterns', 'pattern_syntax',
+    'min_attachments', 'max_attachments', 'min_attachment_size', 'max_attachment_size',
+    'classification', 'priority', 'is_active',
+)
+
+# 大模型分类结果在 classification_rule 中的标记（见 ClassifierFactory.classify_email）
+LLM_RULE_NAME = 'LLM Classification'
+
+# 工作进程中的规则集，由 _init_worker 构建
+_worker_rule_sets: Optional[Tuple[CompiledRuleSet, CompiledRuleSet]] = None
+
+
+def _rule_to_dict(rule: CCEmailClassifyRule) -> Dict[str, Any]:
+    return {field: getattr(rule, field) for field in RULE_FIELDS if hasattr(rule, field)}
+
+
+def _init_worker(current_rules: List[Dict[str, Any]], candidate_rules: List[Dict[str, Any]]) -> None:
+    """工作进程初始化：配置 Django 并编译当前规则集和候选规则集"""
+    global _worker_rule_sets
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        django.setup()
+    _worker_rule_sets = (
+        CompiledRuleSet(CCEmailClassifyRule(**data) for data in current_rules),
+        CompiledRuleSet(CCEmailClassifyRule(**data) for data in candidate_rules),
+    )
+
+
+def _evaluate_chunk(rows: Sequence[Tuple]) -> Dict[str, Any]:
+    """
+    在一批邮件上评估当前规则集和候选规则集
+
+    Args:
+        rows: 按 EMAIL_FIELDS 顺序排列的邮件字段元组
+
+    Returns:
+        可累加的部分统计结果
+    """
+    current_set, candidate_set = _worker_rule_sets
+    emails = []
+    stored = []
+    for row in rows:
+        values = dict(zip(EMAIL_FIELDS, row))
+        stored.append((values.pop('categories') or '', values.pop('classification_rule') or ''))
+        emails.append(CCEmail(**values))
+
+    current_matches = current_set.first_match_batch(emails)
+    candidate_matches = candidate_set.first_match_batch(emails)
+
+    rule_hits = Counter()
+    shifts = Counter()
+    counts = Counter()
+    for (categories, classification_rule), current, candidate in zip(stored, current_matches, candidate_matches):
+        counts['emails'] += 1
+        is_llm = classification_rule == LLM_RULE_NAME
+        if current is None:
+            counts['model_stage_current'] += 1
+            counts['llm_current'] += is_llm
+        if candidate is None:
+            counts['model_stage_candidate'] += 1
+            continue
+
+        rule_hits[candidate.name] += 1
+        if current is None:
+            counts['newly_resolved'] += 1
+            counts['llm_saved'] += is_llm
+        new_category = candidate.classification
+        if new_category != categories:
+            counts['reclassified'] += 1
+            shifts[f"{categories or '(unclassified)'} -> {new_category}"] += 1
+
+    return {'counts': counts, 'rule_hits': rule_hits, 'shifts': shifts}
+
+
+class RuleBacktestService:
+    """
+    规则回测服务
+
+    在已存储的 CCEmail 上评估候选规则集，统计每条规则的命中数、相对当前 categories 的分类变化，
+    以及当前规则集和候选规则集下需要进入模型阶段的邮件数量。只读数据库，不调用 Graph 或任何模型。
+    """
+
+    @staticmethod
+    def load_rules_json(path: str) -> List[CCEmailClassifyRule]:
+        """
+        从 JSON 文件加载候选规则（规则对象列表，字段同 CCEmailClassifyRule）
+
+        Args:
+            path: JSON 文件路径
+
+        Returns:
+            未保存的规则对象列表，已按优先级排序
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        if not isinstance(items, list):
+            raise ValueError("候选规则 JSON 必须是规则对象列表")
+
+        rules = []
+        for position, item in enumerate(items):
+            unknown = set(item) - set(RULE_FIELDS)
+            if unknown:
+                raise ValueError(f"第 {position + 1} 条规则包含未知字段: {sorted(unknown)}")
+            item.setdefault('description', '')
+            item.setdefault('sender_domains', [])
+            item.setdefault('subject_keywords', [])
+            item.setdefault('body_keywords', [])
+            # 未指定 id 的规则使用负数占位，保持同优先级时的文件顺序
+            item.setdefault('id', -len(items) + position)
+            rule = CCEmailClassifyRule(**item)
+            rule.validate_patterns()
+            rules.append(rule)
+        return sorted(rules, key=lambda rule: (rule.priority, rule.id))
+
+    @staticmethod
+    def load_inactive_rules(include_active: bool = False) -> List[CCEmailClassifyRule]:
+        """加载未激活的规则作为候选规则集，include_active 为 True 时与活动规则合并"""
+        rules = CCEmailClassifyRule.objects.all()
+        if not include_active:
+            rules = rules.filter(is_active=False)
+        return list(rules.order_by('priority', 'id'))
+
+    @staticmethod
+    def iter_chunks(chunk_size: int, received_after: Optional[datetime] = None,
+                    limit: Optional[int] = None) -> Iterator[List[Tuple]]:
+        """以服务端游标流式读取邮件，按 chunk_size 分组"""
+        queryset = CCEmail.objects.order_by('id')
+        if received_after is not None:
+            queryset = queryset.filter(received_time__gte=received_after)
+        if limit:
+            queryset = queryset[:limit]
+
+        chunk = []
+        for row in queryset.values_list(*EMAIL_FIELDS).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def run(candidate_rules: List[CCEmailClassifyRule], chunk_size: int = 2000, workers: Optional[int] = None,
+            received_after: Optional[datetime] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        执行回测
+
+        Args:
+            candidate_rules: 候选规则列表（按优先级排序）
+            chunk_size: 每批读取和评估的邮件数
+            workers: 工作进程数，1 表示在当前进程中评估
+            received_after: 只回测该时间之后接收的邮件
+            limit: 最多回测的邮件数
+
+        Returns:
+            回测报告
+        """
+        start = time.perf_counter()
+        current_rules = [
+            _rule_to_dict(rule)
+            for rule in CCEmailClassifyRule.objects.filter(is_active=True).order_by('priority', 'id')
+        ]
+        candidate_data = [_rule_to_dict(rule) for rule in candidate_rules]
+        workers = workers or os.cpu_count() or 1
+        logger.info(
+            f"开始规则回测：当前规则 {len(current_rules)} 条，候选规则 {len(candidate_data)} 条，"
+            f"批大小 {chunk_size}，工作进程 {workers}"
+        )
+
+        counts = Counter()
+        rule_hits = Counter()
+        shifts = Counter()
+
+        def merge(partial: Dict[str, Any]) -> None:
+            counts.update(partial['counts'])
+            rule_hits.update(partial['rule_hits'])
+            shifts.update(partial['shifts'])
+
+        chunks = RuleBacktestService.iter_chunks(chunk_size, received_after, limit)
+        if workers == 1:
+            _init_worker(current_rules, candidate_data)
+            for chunk in chunks:
+                merge(_evaluate_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(current_rules, candidate_data)) as executor:
+                # 限制在途批次数量，避免读库速度快于评估速度时占用过多内存
+                pending = set()
+                for chunk in chunks:
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            merge(future.result())
+                    pending.add(executor.submit(_evaluate_chunk, chunk))
+                for future in pending:
+                    merge(future.result())
+
+        total = counts['emails']
+        model_current = counts['model_stage_current']
+        model_candidate = counts['model_stage_candidate']
+        candidate_names = [data['name'] for data in candidate_data]
+        report = {
+            'emails': total,
+            'current_rules': len(current_rules),
+            'candidate_rules': len(candidate_data),
+            'rule_hits': {name: rule_hits.get(name, 0) for name in candidate_names},
+            'reclassified': counts['reclassified'],
+            'category_shifts': dict(shifts.most_common()),
+            'model_stage': {
+                'current': model_current,
+                'candidate': model_candidate,
+                'saved': model_current - model_candidate,
+                'newly_resolved_by_rules': counts['newly_resolved'],
+            },
+            'llm_calls': {
+                'observed_current': counts['llm_current'],
+                'saved': counts['llm_saved'],
+                'llm_share_of_model_stage': round(counts['llm_current'] / model_current, 4) if model_current else 0.0,
+            },
+            'duration_sec': round(time.perf_counter() - start, 3),
+        }
+        logger.info(
+            f"规则回测完成：{total} 封邮件，重新分类 {counts['reclassified']} 封，"
+            f"模型阶段 {model_current} -> {model_candidate}，耗时 {report['duration_sec']} 秒"
+        )
+        return report
@@ -0,0 +1,513 @@
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Iterable, Sequence, Set
+import numpy as np
+from django.conf import settings
+from ..models import CCEmail, CCEmailClassifyRule
+from .domain_index import DomainIndex
+from .email_normalizer import NormalizedEmail
+from .keyword_matcher import KeywordAutomaton
+from .pattern_matcher import PatternMatcher, translate_pattern, validate_pattern
+from .rule_stats import RuleStats, RuleStatsRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class EmailFeatures:
+    """
+    单封邮件的匹配特征
+
+    主题、正文的小写形式和发件人域名来自邮件的 NormalizedEmail，每封邮件只计算一次，
+    供所有规则以及之后的模型阶段复用
+    """
+    __slots__ = ('email', 'normalized')
+
+    def __init__(self, email: CCEmail):
+        self.email = email
+        self.normalized = NormalizedEmail.of(email)
+
+    @property
+    def subject_lower(self) -> str:
+        return self.normalized.subject_lower
+
+    @property
+    def content_lower(self) -> str:
+        return self.normalized.content_lower
+
+    @property
+    def sender_domain(self) -> str:
+        return self.normalized.sender_domain
+
+
+class CompiledRule:
+    """
+    预编译的分类规则
+
+    在构建时完成关键词小写化、域名集合化等工作，匹配时不再访问数据库或重复处理规则数据
+    """
+    __slots__ = (
+        'id', 'name', 'description', 'classification', 'priority',
+        'sender_domains', 'match_subdomains', 'subject_keywords', 'body_keywords',
+        'min_attachments', 'max_attachments', 'min_attachment_size', 'max_attachment_size',
+        'subject_patterns', 'body_patterns', 'sender_patterns', 'has_pattern_condition',
+        'has_count_condition', 'has_size_condition', 'has_any_condition', 'explanation',
+        '_pattern_regexes',
+    )
+
+    def __init__(self, rule: CCEmailClassifyRule):
+        self.id = rule.id
+        self.name = rule.name
+        self.description = rule.description
+        self.classification = rule.classification
+        self.priority = rule.priority
+        self.sender_domains = frozenset(d.strip().lower().lstrip('.') for d in (rule.sender_domains or []))
+        self.match_subdomains = bool(rule.match_subdomains)
+        self.subject_keywords = tuple(k.lower() for k in (rule.subject_keywords or []))
+        self.body_keywords = tuple(k.lower() for k in (rule.body_keywords or []))
+        self.min_attachments = rule.min_attachments or 0
+        self.max_attachments = rule.max_attachments
+        self.min_attachment_size = rule.min_attachment_size or 0
+        self.max_attachment_size = rule.max_attachment_size
+        self.has_count_condition = self.min_attachments > 0 or bool(self.max_attachments)
+        self.has_size_condition = self.min_attachment_size > 0 or bool(self.max_attachment_size)
+        syntax = getattr(rule, 'pattern_syntax', None) or 'regex'
+        self.subject_patterns = self._compile_patterns(rule, 'subject_patterns', syntax)
+        self.body_patterns = self._compile_patterns(rule, 'body_patterns', syntax)
+        self.sender_patterns = self._compile_patterns(rule, 'sender_patterns', syntax)
+        self.has_pattern_condition = bool(self.subject_patterns or self.body_patterns or self.sender_patterns)
+        self.has_any_condition = bool(
+            self.sender_domains or self.subject_keywords or self.body_keywords
+            or self.has_pattern_condition or self.has_count_condition or self.has_size_condition
+        )
+        self.explanation = f"匹配规则: {rule.name}，规则描述: {rule.description}"
+        self._pattern_regexes = {}
+
+    @staticmethod
+    def _compile_patterns(rule: CCEmailClassifyRule, field: str, syntax: str) -> tuple:
+        """将模式转换为正则表达式；绕过保存校验写入的无效模式会被忽略"""
+        patterns = []
+        for pattern in getattr(rule, field, None) or []:
+            try:
+                validate_pattern(pattern, syntax)
+            except ValueError as e:
+                logger.warning("规则 '%s' 的 %s 模式已忽略: %s", rule.name, field, e)
+                continue
+            patterns.append(translate_pattern(pattern, syntax))
+        return tuple(patterns)
+
+    def _pattern_regex(self, field: str) -> re.Pattern:
+        """单条规则某个字段的模式合并后的正则，用于逐条匹配和调试"""
+        regex = self._pattern_regexes.get(field)
+        if regex is None:
+            alternation = '|'.join(f"(?:{pattern})" for pattern in getattr(self, field))
+            regex = self._pattern_regexes[field] = re.compile(alternation, re.IGNORECASE)
+        return regex
+
+    def matches_patterns(self, features: EmailFeatures) -> bool:
+        """检查主题、正文、发件人的正则/通配符模式条件"""
+        email = features.email
+        if self.subject_patterns and self._pattern_regex('subject_patterns').search(email.subject or ""):
+            return True
+        if self.body_patterns and self._pattern_regex('body_patterns').search(email.content or ""):
+            return True
+        if self.sender_patterns and self._pattern_regex('sender_patterns').search(email.sender or ""):
+            return True
+        return False
+
+    def matches(self, features: EmailFeatures) -> bool:
+        """检查邮件是否匹配规则，任一条件满足即视为匹配"""
+        if self.subject_keywords:
+            subject = features.subject_lower
+            if any(keyword in subject for keyword in self.subject_keywords):
+                return True
+
+        if self.body_keywords:
+            content = features.content_lower
+            if any(keyword in content for keyword in self.body_keywords):
+                return True
+
+        if self.has_pattern_condition and self.matches_patterns(features):
+            return True
+
+        return self.matches_structural(features)
+
+    def matches_structural(self, features: EmailFeatures) -> bool:
+        """检查关键词以外的条件（发件人域名、附件数量、附件大小）"""
+        if self.sender_domains and self.matches_domain(features.sender_domain):
+            return True
+
+        return self.matches_attachments(features)
+
+    def matches_domain(self, domain: str) -> bool:
+        """检查发件人域名条件"""
+        if domain in self.sender_domains:
+            return True
+        if self.match_subdomains:
+            labels = domain.split('.')
+            return any('.'.join(labels[i:]) in self.sender_domains for i in range(1, len(labels)))
+        return False
+
+    def matches_attachments(self, features: EmailFeatures) -> bool:
+        """检查附件数量和附件大小条件"""
+        email = features.email
+
+        if self.has_count_condition:
+            count = email.attachment_count
+            if count >= self.min_attachments and not (self.max_attachments and count > self.max_attachments):
+                return True
+
+        if self.has_size_condition:
+            size = email.total_attachment_size
+            if size >= self.min_attachment_size and not (self.max_attachment_size and size > self.max_attachment_size):
+                return True
+
+        return False
+
+    def explain(self, features: EmailFeatures) -> List[Dict[str, Any]]:
+        """
+        逐个条件给出匹配详情，仅用于调试追踪（RULE_DEBUG_TRACE）
+
+        Args:
+            features: 邮件匹配特征
+
+        Returns:
+            条件匹配详情列表
+        """
+        email = features.email
+        details = []
+
+        if self.sender_domains:
+            matched = self.matches_domain(features.sender_domain)
+            details.append({
+                'condition': 'sender_domain',
+                'matched': matched,
+                'details': f"域名 '{features.sender_domain}' {'匹配' if matched else '不匹配'}"
+            })
+
+        if self.subject_keywords:
+            found = [keyword for keyword in self.subject_keywords if keyword in features.subject_lower]
+            details.append({
+                'condition': 'subject_keywords',
+                'matched': bool(found),
+                'details': f"找到关键词: {found}" if found else "未找到任何主题关键词"
+            })
+
+        if self.body_keywords:
+            found = [keyword for keyword in self.body_keywords if keyword in features.content_lower]
+            details.append({
+                'condition': 'body_keywords',
+                'matched': bool(found),
+                'details': f"找到关键词: {found}" if found else "未找到任何正文关键词"
+            })
+
+        for field, text in (('subject_patterns', email.subject),
+                            ('body_patterns', email.content),
+                            ('sender_patterns', email.sender)):
+            if getattr(self, field):
+                match = self._pattern_regex(field).search(text or "")
+                details.append({
+                    'condition': field,
+                    'matched': bool(match),
+                    'details': f"模式命中: '{match.group(0)[:100]}'" if match else "未命中任何模式"
+                })
+
+        if self.has_count_condition:
+            count = email.attachment_count
+            matched = count >= self.min_attachments and not (self.max_attachments and count > self.max_attachments)
+            details.append({
+                'condition': 'attachment_count',
+                'matched': matched,
+                'details': f"附件数量 {count}，要求 [{self.min_attachments}, {self.max_attachments or '∞'}]"
+            })
+
+        if self.has_size_condition:
+            size = email.total_attachment_size
+            matched = size >= self.min_attachment_size and not (self.max_attachment_size and size > self.max_attachment_size)
+            details.append({
+                'condition': 'attachment_size',
+                'matched': matched,
+                'details': f"附件大小 {size}B，要求 [{self.min_attachment_size}B, {self.max_attachment_size or '∞'}B]"
+            })
+
+        return details
+
+
+class CompiledRuleSet:
+    """
+    按优先级排列的预编译规则集合
+
+    所有规则的主题关键词和正文关键词分别编译为一个 Aho-Corasick 自动机，
+    每封邮件的主题和正文各只扫描一遍，得到命中的规则下标集合；发件人域名通过 DomainIndex 查询。
+    主题、正文、发件人的正则/通配符模式各合并为一个 PatternMatcher，每个字段一次 finditer 扫描。
+    规则内各条件为"或"关系，因此邮件的匹配结果就是各类条件命中的最小规则下标，
+    只有附件条件需要按顺序逐条检查，且只检查排在当前最优结果之前的规则。
+
+    传入 hit_rates 时，优先级相同的规则按历史命中率从高到低排列，常见的匹配可以更早结束评估。
+    """
+
+    def __init__(self, rules: Iterable[CCEmailClassifyRule], version: int = 0,
+                 hit_rates: Optional[Dict[int, float]] = None):
+        self.version = version
+        if hit_rates:
+            rules = sorted(rules, key=lambda rule: (rule.priority, -hit_rates.get(rule.id, 0.0)))
+
+        self.rules: List[CompiledRule] = []
+        for rule in rules:
+            compiled = CompiledRule(rule)
+            if not compiled.has_any_condition:
+                logger.warning("规则 '%s' 未设置任何条件，已忽略", rule.name)
+                continue
+            self.rules.append(compiled)
+
+        self.domain_index = DomainIndex()
+        for index, rule in enumerate(self.rules):
+            for domain in rule.sender_domains:
+                self.domain_index.add(domain, index, include_subdomains=rule.match_subdomains)
+
+        self.subject_automaton = KeywordAutomaton.from_keywords(
+            (keyword, index) for index, rule in enumerate(self.rules) for keyword in rule.subject_keywords
+        )
+        self.body_automaton = KeywordAutomaton.from_keywords(
+            (keyword, index) for index, rule in enumerate(self.rules) for keyword in rule.body_keywords
+        )
+        # 第一条含主题/正文关键词的规则下标，已命中更靠前的规则时可跳过对应的扫描
+        self._first_subject_rule = next(
+            (index for index, rule in enumerate(self.rules) if rule.subject_keywords), None
+        )
+        self._first_body_rule = next(
+            (index for index, rule in enumerate(self.rules) if rule.body_keywords), None
+        )
+        self.subject_patterns = PatternMatcher.from_patterns(
+            (index, rule.subject_patterns) for index, rule in enumerate(self.rules)
+        )
+        self.body_patterns = PatternMatcher.from_patterns(
+            (index, rule.body_patterns) for index, rule in enumerate(self.rules)
+        )
+        self.sender_patterns = PatternMatcher.from_patterns(
+            (index, rule.sender_patterns) for index, rule in enumerate(self.rules)
+        )
+        # 含附件条件的规则，按优先级排列
+        self._attachment_rules = [
+            (index, rule) for index, rule in enumerate(self.rules)
+            if rule.has_count_condition or rule.has_size_condition
+        ]
+        self._build_attachment_arrays()
+        self.stats = RuleStats(len(self.rules))
+
+    def _build_attachment_arrays(self) -> None:
+        """将附件条件整理为 NumPy 数组，供批量评估使用（上限为空或 0 时视为无上限）"""
+        unbounded = np.iinfo(np.int64).max
+        rules = [rule for _, rule in self._attachment_rules]
+        self._att_index = np.array([index for index, _ in self._attachment_rules], dtype=np.int64)
+        self._att_has_count = np.array([rule.has_count_condition for rule in rules], dtype=bool)
+        self._att_min_count = np.array([rule.min_attachments for rule in rules], dtype=np.int64)
+        self._att_max_count = np.array([rule.max_attachments or unbounded for rule in rules], dtype=np.int64)
+        self._att_has_size = np.array([rule.has_size_condition for rule in rules], dtype=bool)
+        self._att_min_size = np.array([rule.min_attachment_size for rule in rules], dtype=np.int64)
+        self._att_max_size = np.array([rule.max_attachment_size or unbounded for rule in rules], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    @property
+    def categories(self) -> List[str]:
+        """规则集中出现的分类"""
+        return [rule.classification for rule in self.rules]
+
+    def keyword_hits(self, features: EmailFeatures, best: Optional[int] = None, full: bool = False) -> Set[int]:
+        """
+        返回关键词条件命中的规则下标
+
+        Args:
+            features: 邮件匹配特征
+            best: 已知命中的最小规则下标；排在其后的关键词规则不会改变结果，对应的扫描会被跳过
+            full: 为 True 时总是完整扫描主题和正文
+
+        Returns:
+            命中的规则下标集合
+        """
+        hits: Set[int] = set()
+        if self._first_subject_rule is not None and (full or best is None or self._first_subject_rule < best):
+            hits = self.subject_automaton.search(features.subject_lower)
+            if hits and (best is None or min(hits) < best):
+                best = min(hits)
+        if self._first_body_rule is not None and (full or best is None or self._first_body_rule < best):
+            hits |= self.body_automaton.search(features.content_lower)
+        return hits
+
+    def pattern_hit(self, features: EmailFeatures, best: Optional[int] = None) -> Optional[int]:
+        """
+        返回模式条件命中的最小规则下标
+
+        Args:
+            features: 邮件匹配特征
+            best: 已知命中的最小规则下标；只检查排在其前面的规则
+
+        Returns:
+            比 best 更小的命中下标，没有时返回 None
+        """
+        email = features.email
+        found = None
+        for matcher, text in ((self.sender_patterns, email.sender),
+                              (self.subject_patterns, email.subject),
+                              (self.body_patterns, email.content)):
+            if not len(matcher):
+                continue
+            index = matcher.first(text or "", limit=best)
+            if index is not None:
+                best = found = index
+        return found
+
+    def _text_match_index(self, features: EmailFeatures) -> Optional[int]:
+        """返回域名、关键词和模式条件命中的最小规则下标"""
+        best = self.domain_index.lookup(features.sender_domain)
+
+        hits = self.keyword_hits(features, best)
+        if hits:
+            first_hit = min(hits)
+            if best is None or first_hit < best:
+                best = first_hit
+
+        pattern_index = self.pattern_hit(features, best)
+        if pattern_index is not None:
+            best = pattern_index
+        return best
+
+    def first_match(self, email: CCEmail) -> Optional[CompiledRule]:
+        """
+        返回邮件匹配的第一条规则（按优先级顺序）
+
+        Args:
+            email: 要匹配的邮件
+
+        Returns:
+            匹配的规则，未匹配时返回 None
+        """
+        start = time.perf_counter()
+        best = self._first_match_index(EmailFeatures(email))
+        self.stats.record(best, time.perf_counter() - start)
+        return self.rules[best] if best is not None else None
+
+    def _first_match_index(self, features: EmailFeatures) -> Optional[int]:
+        """返回首个匹配规则的下标"""
+        best = self._text_match_index(features)
+
+        for index, rule in self._attachment_rules:
+            if best is not None and index >= best:
+                break
+            if rule.matches_attachments(features):
+                best = index
+                break
+
+        return best
+
+    def first_match_batch(self, emails: Sequence[CCEmail]) -> List[Optional[CompiledRule]]:
+        """
+        批量返回每封邮件匹配的第一条规则，结果与逐封调用 first_match 相同
+
+        域名、关键词和模式条件通过每封邮件预先计算的特征解析；附件数量和大小条件
+        在整个批次上以 NumPy 数组比较一次完成（邮件数 × 附件规则数）。
+
+        Args:
+            emails: 要匹配的邮件列表
+
+        Returns:
+            与 emails 一一对应的规则列表，未匹配的位置为 None
+        """
+        count = len(emails)
+        if not count:
+            return []
+
+        start = time.perf_counter()
+        no_match = len(self.rules)
+        best = np.full(count, no_match, dtype=np.int64)
+
+        for position, email in enumerate(emails):
+            candidate = self._text_match_index(EmailFeatures(email))
+            if candidate is not None:
+                best[position] = candidate
+
+        if self._attachment_rules:
+            counts = np.fromiter((email.attachment_count or 0 for email in emails), dtype=np.int64, count=count)
+            sizes = np.fromiter((email.total_attachment_size or 0 for email in emails), dtype=np.int64, count=count)
+            counts = counts[:, np.newaxis]
+            sizes = sizes[:, np.newaxis]
+
+            count_match = self._att_has_count & (counts >= self._att_min_count) & (counts <= self._att_max_count)
+            size_match = self._att_has_size & (sizes >= self._att_min_size) & (sizes <= self._att_max_size)
+            matched = count_match | size_match
+
+            first_attachment_rule = np.where(
+                matched.any(axis=1), self._att_index[matched.argmax(axis=1)], no_match
+            )
+            best = np.minimum(best, first_attachment_rule)
+
+        indexes = [index if index < no_match else None for index in best.tolist()]
+        self.stats.record_batch(indexes, time.perf_counter() - start)
+        return [self.rules[index] if index is not None else None for index in indexes]
+
+    def match_all(self, email: CCEmail) -> List[CompiledRule]:
+        """返回邮件匹配的所有规则（按优先级顺序）"""
+        features = EmailFeatures(email)
+        hits = self.keyword_hits(features, full=True)
+        hits |= self.sender_patterns.search_all(email.sender)
+        hits |= self.subject_patterns.search_all(email.subject)
+        hits |= self.body_patterns.search_all(email.content)
+        return [
+            rule for index, rule in enumerate(self.rules)
+            if index in hits or rule.matches_structural(features)
+        ]
+
+
+class RuleSetCache:
+    """
+    进程级规则集缓存
+
+    规则集在首次使用时编译一次，并以版本号标识。CCEmailClassifyRule 的 post_save/post_delete
+    信号会递增版本号使缓存失效；CLASSIFY_RULES_CACHE_TTL 用于感知其他进程对规则的修改。
+    重新编译前会先把旧规则集的命中统计写入数据库；启用 RULE_ADAPTIVE_ORDER 时，
+    同优先级规则按历史命中率排序。
+    """
+
+    _lock = threading.Lock()
+    _rule_set: Optional[CompiledRuleSet] = None
+    _version = 0
+    _built_at = 0.0
+
+    @classmethod
+    def get_rule_set(cls) -> CompiledRuleSet:
+        """获取当前版本的规则集，必要时重新编译"""
+        ttl = getattr(settings, 'CLASSIFY_RULES_CACHE_TTL', 300)
+        rule_set = cls._rule_set
+        if rule_set is not None and rule_set.version == cls._version:
+            if not ttl or time.monotonic() - cls._built_at < ttl:
+                return rule_set
+
+        with cls._lock:
+            rule_set = cls._rule_set
+            expired = ttl and time.monotonic() - cls._built_at >= ttl
+            if rule_set is None or rule_set.version != cls._version or expired:
+                if expired:
+                    cls._version += 1
+                version = cls._version
+                if rule_set is not None:
+                    RuleStatsRecorder.flush(rule_set)
+
+                hit_rates = None
+                if getattr(settings, 'RULE_ADAPTIVE_ORDER', False):
+                    hit_rates = RuleStatsRecorder.load_hit_rates()
+                rules = CCEmailClassifyRule.objects.filter(is_active=True).order_by('priority', 'id')
+                rule_set = CompiledRuleSet(rules, version=version, hit_rates=hit_rates)
+                cls._rule_set = rule_set
+                cls._built_at = time.monotonic()
+                logger.info("已编译 %s 条活动规则，规则集版本: %s", len(rule_set), version)
+            return rule_set
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """使缓存的规则集失效，下次获取时重新编译"""
+        with cls._lock:
+            cls._version += 1
+        logger.debug("规则集缓存已失效，新版本: %s", cls._version)
@@ -0,0 +1,184 @@
+import logging
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from django.db import connection, transaction
+from ..models import CCEmail
+from .rule_engine import CompiledRule, CompiledRuleSet
+
+logger = logging.getLogger(__name__)
+
+
+class RulePushdownService:
+    """
+    将决策树规则下推到 PostgreSQL 执行
+
+    把规则集编译为一条 UPDATE ... SET categories = CASE ... END 语句，在数据库内一次性
+    对所有未分类且能被规则匹配的邮件完成分类，不再把邮件逐封加载到 Python。
+    规则按优先级生成 CASE WHEN 分支，因此与 CompiledRuleSet.first_match 的首个匹配语义一致。
+    注意：关键词匹配使用 PostgreSQL 的 lower()，非 ASCII 字符的小写规则取决于数据库排序规则。
+    正则/通配符模式使用 Python re 语法，与 PostgreSQL 正则不完全兼容，因此只下推
+    第一条含模式条件的规则之前的规则，其余邮件留给 Python 端分类。
+    """
+
+    @staticmethod
+    def pushable_rules(rule_set: CompiledRuleSet) -> List[CompiledRule]:
+        """返回可以下推的规则，即第一条含模式条件的规则之前的所有规则"""
+        rules = []
+        for rule in rule_set.rules:
+            if rule.has_pattern_condition:
+                break
+            rules.append(rule)
+        return rules
+
+    @staticmethod
+    def _like_escape(value: str) -> str:
+        """转义 LIKE 模式中的通配符"""
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    @staticmethod
+    def _rule_predicate(rule: CompiledRule) -> Tuple[str, List[Any]]:
+        """
+        生成单条规则的 WHERE 谓词
+
+        谓词引用子查询 f 中预先计算的 subject_lower、content_lower、sender_domain 列。
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+
+        if rule.sender_domains:
+            domains = sorted(rule.sender_domains)
+            conditions.append(f"f.sender_domain IN ({', '.join(['%s'] * len(domains))})")
+            params.extend(domains)
+            if rule.match_subdomains:
+                for domain in domains:
+                    conditions.append("f.sender_domain LIKE %s ESCAPE '\\'")
+                    params.append('%.' + RulePushdownService._like_escape(domain))
+
+        for keyword in rule.subject_keywords:
+            conditions.append("strpos(f.subject_lower, %s) > 0")
+            params.append(keyword)
+
+        for keyword in rule.body_keywords:
+            conditions.append("strpos(f.content_lower, %s) > 0")
+            params.append(keyword)
+
+        if rule.has_count_condition:
+            clause = "f.attachment_count >= %s"
+            params.append(rule.min_attachments)
+            if rule.max_attachments:
+                clause += " AND f.attachment_count <= %s"
+                params.append(rule.max_attachments)
+            conditions.append(f"({clause})")
+
+        if rule.has_size_condition:
+            clause = "f.total_attachment_size >= %s"
+            params.append(rule.min_attachment_size)
+            if rule.max_attachment_size:
+                clause += " AND f.total_attachment_size <= %s"
+                params.append(rule.max_attachment_size)
+            conditions.append(f"({clause})")
+
+        return " OR ".join(conditions), params
+
+    @staticmethod
+    def build_update_sql(rule_set: CompiledRuleSet, method: str,
+                         received_after: Optional[datetime] = None) -> Tuple[str, List[Any]]:
+        """
+        生成分类 UPDATE 语句
+
+        Args:
+            rule_set: 编译后的规则集
+            method: 写入 classification_method 的分类方法名称
+            received_after: 只处理该时间之后接收的邮件
+
+        Returns:
+            (SQL 语句, 参数列表)
+        """
+        qn = connection.ops.quote_name
+        table = qn(CCEmail._meta.db_table)
+        rules = RulePushdownService.pushable_rules(rule_set)
+
+        # 子查询 m 为每封邮件计算匹配的规则下标，谓词只计算一次
+        match_cases: List[str] = []
+        match_params: List[Any] = []
+        for index, rule in enumerate(rules):
+            predicate, params = RulePushdownService._rule_predicate(rule)
+            match_cases.append(f"WHEN {predicate} THEN {index}")
+            match_params.extend(params)
+
+        source_filter = "categories = ''"
+        source_params: List[Any] = []
+        if received_after is not None:
+            source_filter += " AND received_time >= %s"
+            source_params.append(received_after)
+
+        set_params: List[Any] = []
+
+        def index_case(values: List[str]) -> str:
+            set_params.extend(values)
+            return "CASE m.rule_index " + " ".join(
+                f"WHEN {index} THEN %s" for index in range(len(values))
+            ) + " END"
+
+        categories_case = index_case([rule.classification for rule in rules])
+        rule_case = index_case([rule.name for rule in rules])
+        reason_case = index_case([rule.explanation for rule in rules])
+        set_params.append(method)
+
+        sql = (
+            f"UPDATE {table} AS e SET "
+            f"categories = {categories_case}, "
+            f"classification_rule = {rule_case}, "
+            f"classification_reason = {reason_case}, "
+            f"classification_method = %s, "
+            f"classification_confidence = 1.0 "
+            f"FROM ("
+            f"SELECT f.id, CASE {' '.join(match_cases)} END AS rule_index "
+            f"FROM ("
+            f"SELECT id, lower(subject) AS subject_lower, lower(content) AS content_lower, "
+            f"regexp_replace(lower(sender), '^.*@', '') AS sender_domain, "
+            f"attachment_count, total_attachment_size "
+            f"FROM {table} WHERE {source_filter}"
+            f") AS f"
+            f") AS m "
+            f"WHERE e.id = m.id AND m.rule_index IS NOT NULL AND e.categories = ''"
+        )
+        return sql, set_params + match_params + source_params
+
+    @staticmethod
+    def classify_backlog(rule_set: CompiledRuleSet, method: str,
+                         received_after: Optional[datetime] = None) -> int:
+        """
+        在数据库中用规则集分类所有能被规则匹配的未分类邮件
+
+        Args:
+            rule_set: 编译后的规则集
+            method: 写入 classification_method 的分类方法名称
+            received_after: 只处理该时间之后接收的邮件
+
+        Returns:
+            被分类的邮件数量
+        """
+        if connection.vendor != 'postgresql':
+            raise NotImplementedError(f"规则下推仅支持 PostgreSQL，当前数据库: {connection.vendor}")
+
+        rules = RulePushdownService.pushable_rules(rule_set)
+        if not rules:
+            logger.info("没有可下推的活动规则")
+            return 0
+        if len(rules) < len(rule_set):
+            logger.info(
+                "规则 '%s' 含模式条件，其后的 %s 条规则不下推",
+                rule_set.rules[len(rules)].name, len(rule_set) - len(rules)
+            )
+
+        sql, params = RulePushdownService.build_update_sql(rule_set, method, received_after)
+        logger.debug("规则下推 SQL: %s", sql)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                updated = cursor.rowcount
+
+        logger.info("规则下推完成，%s 条规则在数据库中分类了 %s 封邮件", len(rules), updated)
+        return updated
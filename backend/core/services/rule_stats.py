@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import CCEmailClassifyRule, CCRuleHitStat
+
+logger = logging.getLogger(__name__)
+
+
+class RuleStats:
+    """
+    单个编译后规则集的命中统计
+
+    按"首个匹配规则的下标"累加邮件数和耗时，每封邮件的记录开销为 O(1)。
+    由于规则按顺序评估，下标为 b 的结果意味着下标 0..b 的规则都被评估过，
+    因此每条规则的评估次数可在刷新时通过后缀和得到；单封邮件的耗时平均分摊给被评估的规则。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        # 最后一个位置记录未匹配任何规则的邮件
+        self._resolved = [0] * (size + 1)
+        self._seconds = [0.0] * (size + 1)
+
+    def record(self, index: Optional[int], seconds: float) -> None:
+        """记录一封邮件的匹配结果"""
+        position = self.size if index is None else index
+        with self._lock:
+            self._resolved[position] += 1
+            self._seconds[position] += seconds
+
+    def record_batch(self, indexes: Iterable[Optional[int]], seconds: float) -> None:
+        """记录一个批次的匹配结果，批次耗时平均分摊到每封邮件"""
+        positions = [self.size if index is None else index for index in indexes]
+        if not positions:
+            return
+        share = seconds / len(positions)
+        with self._lock:
+            for position in positions:
+                self._resolved[position] += 1
+                self._seconds[position] += share
+
+    def drain(self):
+        """
+        取出并清空累计数据
+
+        Returns:
+            (evaluations, hits, eval_seconds) 三个按规则下标排列的数组
+        """
+        with self._lock:
+            resolved = np.array(self._resolved, dtype=np.int64)
+            seconds = np.array(self._seconds, dtype=np.float64)
+            self._resolved = [0] * (self.size + 1)
+            self._seconds = [0.0] * (self.size + 1)
+
+        if not self.size:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        # 结果下标为 b 的邮件评估了 b + 1 条规则；未匹配的邮件评估了全部规则
+        evaluated_counts = np.arange(1, self.size + 2, dtype=np.float64)
+        evaluated_counts[-1] = self.size
+        shares = seconds / evaluated_counts
+
+        evaluations = np.cumsum(resolved[::-1])[::-1][:self.size]
+        eval_seconds = np.cumsum(shares[::-1])[::-1][:self.size]
+        hits = resolved[:self.size]
+        return evaluations, hits, eval_seconds
+
+
+class RuleStatsRecorder:
+    """将内存中的规则统计定期写入 CCRuleHitStat 表"""
+
+    _lock = threading.Lock()
+    _last_flush = time.monotonic()
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'RULE_STATS_ENABLED', True)
+
+    @classmethod
+    def maybe_flush(cls, rule_set) -> None:
+        """距离上次刷新超过 RULE_STATS_FLUSH_INTERVAL 秒时刷新"""
+        interval = getattr(settings, 'RULE_STATS_FLUSH_INTERVAL', 60)
+        if time.monotonic() - cls._last_flush >= interval:
+            cls.flush(rule_set)
+
+    @classmethod
+    def flush(cls, rule_set) -> int:
+        """
+        将规则集的统计增量写入数据库
+
+        Args:
+            rule_set: 编译后的规则集
+
+        Returns:
+            更新的规则数量
+        """
+        if rule_set is None or not cls.enabled():
+            return 0
+
+        with cls._lock:
+            cls._last_flush = time.monotonic()
+            evaluations, hits, eval_seconds = rule_set.stats.drain()
+
+            deltas = {}
+            for index, rule in enumerate(rule_set.rules):
+                if rule.id is not None and evaluations[index]:
+                    deltas[rule.id] = (int(evaluations[index]), int(hits[index]), float(eval_seconds[index]) * 1000)
+            if not deltas:
+                return 0
+
+            try:
+                now = timezone.now()
+                with transaction.atomic():
+                    rule_ids = set(CCEmailClassifyRule.objects.filter(id__in=deltas).values_list('id', flat=True))
+                    existing = set(CCRuleHitStat.objects.filter(rule_id__in=rule_ids).values_list('rule_id', flat=True))
+                    CCRuleHitStat.objects.bulk_create(
+                        [CCRuleHitStat(rule_id=rule_id) for rule_id in rule_ids - existing],
+                        ignore_conflicts=True
+                    )
+                    for rule_id in rule_ids:
+                        rule_evaluations, rule_hits, rule_ms = deltas[rule_id]
+                        updates = {
+                            'evaluations': F('evaluations') + rule_evaluations,
+                            'hits': F('hits') + rule_hits,
+                            'total_eval_time_ms': F('total_eval_time_ms') + rule_ms,
+                            'updated_at': now,
+                        }
+                        if rule_hits:
+                            updates['last_hit_at'] = now
+                        CCRuleHitStat.objects.filter(rule_id=rule_id).update(**updates)
+                logger.debug("已刷新 %s 条规则的命中统计", len(rule_ids))
+                return len(rule_ids)
+            except Exception as e:
+                logger.error("刷新规则命中统计时出错: %s", e, exc_info=True)
+                return 0
+
+    @staticmethod
+    def load_hit_rates() -> Dict[int, float]:
+        """读取各规则的历史命中率"""
+        return {
+            stat.rule_id: stat.hit_rate
+            for stat in CCRuleHitStat.objects.all()
+        }
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CCEmailClassifyRule
+from .services.rule_engine import RuleSetCache
+
+
+@receiver(post_save, sender=CCEmailClassifyRule)
+@receiver(post_delete, sender=CCEmailClassifyRule)
+def invalidate_rule_set_cache(sender, **kwargs):
+    """分类规则变更后使编译后的规则集失效"""
+    RuleSetCache.invalidate()
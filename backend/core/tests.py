@@ -1,3 +1,1380 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+import importlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import torch
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .log_handlers import RateLimitFilter, SamplingFilter
+from .middleware import RequestLoggingMiddleware
+from .model_providers import BertProvider
+from .management.commands.classify_emails import Command as ClassifyEmailsCommand
+from .management.commands.classify_worker import Command as ClassifyWorkerCommand
+from .models import (
+    CCClassificationCheckpoint, CCClassificationJob, CCEmail, CCEmailClassifyRule, CCEmailForwardingLog, CCRuleHitStat,
+    CCUserMailInfo,
+)
+from .services.ai_classifier import ClassifierFactory, EmailClassificationAgent, LLMClassificationTool
+from .services.classification_cache import ClassificationCache, DjangoCacheBackend
+from .services.classification_context import ClassificationContext
+from .services.classification_queue import ClassificationQueue
+from .services.email_classifier import EmailClassifier
+from .services.email_normalizer import NormalizedEmail, extract_text_from_html
+from .services import keyword_matcher
+from .services.domain_index import DomainIndex
+from .services.keyword_matcher import KeywordAutomaton
+from .services.near_duplicate import NearDuplicateDetector
+from .services.pattern_matcher import PatternMatcher, translate_pattern, validate_pattern
+from .services.rule_pushdown import RulePushdownService
+from .services.rule_stats import RuleStats, RuleStatsRecorder
+from .services.rule_engine import CompiledRuleSet, RuleSetCache
+from .views import metrics_view
+
+
+ORDER_RULE = dict(name='Orders', description='order notices', sender_domains=[], subject_keywords=['order'],
+                  body_keywords=[], classification='purchase')
+
+
+def stub_context(rules=(), tools=None, **overrides):
+    """用给定的规则和模型工具构建分类上下文，不访问数据库和真实模型"""
+    values = dict(
+        rule_set=CompiledRuleSet([CCEmailClassifyRule(id=index, **rule) for index, rule in enumerate(rules, 1)]),
+        categories=('purchase', 'techsupport', 'festival', 'other'),
+        thresholds={'fasttext': 0.95, 'bert': 0.9, 'llm': 0.8},
+        strategy='sequential',
+        model_order=('fasttext', 'bert'),
+        single_model='bert',
+        require_both=True,
+        tools=tools or {},
+        agent=None,
+    )
+    values.update(overrides)
+    return ClassificationContext(**values)
+
+
+class PersistResultsTests(TestCase):
+    """EmailClassifier.persist_results 按批次执行 UPDATE，语句数与批次数而不是邮件数成正比"""
+
+    EMAIL_COUNT = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        CCEmail.objects.bulk_create([
+            CCEmail(
+                user_mail=user_mail,
+                message_id=f'message-{i}',
+                subject=f'Order {i} shipped',
+                sender='shop@example.com',
+                received_time=timezone.now(),
+                content=f'<p>Your order {i} has shipped</p>',
+            )
+            for i in range(cls.EMAIL_COUNT)
+        ])
+
+    def _results(self, emails):
+        # 分类流程实际产出的结果字典
+        return list(EmailClassifier._classify_batch(emails, 'decision_tree', stub_context([ORDER_RULE])))
+
+    def test_one_update_per_batch(self):
+        emails = list(CCEmail.objects.order_by('id'))
+
+        # 事务的 SAVEPOINT 和 RELEASE 两条语句，加上 25 封邮件每 10 封一条 UPDATE
+        with self.assertNumQueries(2 + 3):
+            saved = EmailClassifier.persist_results(self._results(emails), 'decision_tree', batch_size=10)
+
+        self.assertEqual(saved, self.EMAIL_COUNT)
+        for email in CCEmail.objects.all():
+            self.assertEqual(email.categories, 'purchase')
+            self.assertEqual(email.classification_method, 'decision_tree')
+            self.assertEqual(email.classification_rule, 'Orders')
+            self.assertEqual(email.classification_reason, '匹配规则: Orders，规则描述: order notices')
+            self.assertEqual(email.classification_confidence, 1.0)
+
+    def test_query_count_does_not_grow_with_emails(self):
+        emails = list(CCEmail.objects.order_by('id'))
+
+        with self.assertNumQueries(2 + 1):
+            EmailClassifier.persist_results(self._results(emails[:5]), 'llm', batch_size=100)
+        with self.assertNumQueries(2 + 1):
+            EmailClassifier.persist_results(self._results(emails), 'llm', batch_size=100)
+
+    def test_extracted_text_is_saved_in_separate_group(self):
+        emails = list(CCEmail.objects.order_by('id'))
+        for email in emails[:3]:
+            NormalizedEmail.of(email).clean_text
+
+        with self.settings(EMAIL_NORMALIZED_TEXT_PERSIST=True):
+            with self.assertNumQueries(2 + 2):
+                EmailClassifier.persist_results(self._results(emails), 'llm', batch_size=100)
+
+        self.assertEqual(CCEmail.objects.exclude(normalized_text=None).count(), 3)
+        self.assertEqual(CCEmail.objects.get(pk=emails[0].pk).normalized_text, 'Your order 0 has shipped')
+
+
+class RecordingLLMProvider:
+    """记录收到的消息并返回固定 JSON 结果的 LLM 提供者"""
+
+    def __init__(self, classification):
+        self.classification = classification
+        self.messages = []
+
+    def chat(self, messages):
+        self.messages.append(messages)
+        return json.dumps({'classification': self.classification, 'confidence': 0.99, 'explanation': 'test'})
+
+
+class LowConfidenceTool:
+    """总是返回低置信度结果的模型工具，邮件会继续进入下一阶段"""
+
+    def classify_batch(self, emails, categories):
+        return [{'classification': 'other', 'confidence': 0.1} for _ in emails]
+
+
+class StepBatchLLMCategoriesTests(TestCase):
+    """分阶段批量 stepgo 中 LLM 阶段收到上下文的分类类别"""
+
+    def test_llm_stage_prompt_contains_categories(self):
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        emails = [
+            CCEmail.objects.create(
+                user_mail=user_mail,
+                message_id=f'message-{i}',
+                subject=f'Greetings {i}',
+                sender='friend@example.com',
+                received_time=timezone.now(),
+                content='<p>Happy holidays</p>',
+            )
+            for i in range(2)
+        ]
+        llm = LLMClassificationTool()
+        llm.llm_provider = RecordingLLMProvider('festival')
+        context = ClassificationContext(
+            rule_set=CompiledRuleSet([]),
+            categories=('purchase', 'festival'),
+            thresholds={'fasttext': 0.95, 'bert': 0.9, 'llm': 0.95},
+            strategy='sequential',
+            model_order=('fasttext', 'bert'),
+            single_model='bert',
+            require_both=True,
+            tools={'fasttext': LowConfidenceTool(), 'bert': LowConfidenceTool(), 'llm': llm},
+            agent=None,
+        )
+
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='none'):
+            results = EmailClassifier._step_classify_batch(emails, context)
+
+        self.assertEqual([result['classification'] for result in results], ['festival', 'festival'])
+        self.assertEqual(len(llm.llm_provider.messages), 2)
+        for messages in llm.llm_provider.messages:
+            self.assertIn('purchase, festival', messages[0]['content'])
+
+
+class ClassificationQueueTests(TestCase):
+    """任务队列的认领、租约过期、重试和重新入队"""
+
+    def setUp(self):
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        self.emails = [
+            CCEmail.objects.create(
+                user_mail=user_mail,
+                message_id=f'message-{i}',
+                subject=f'Order {i} shipped',
+                sender='shop@example.com',
+                received_time=timezone.now(),
+                content=f'<p>Your order {i} has shipped</p>',
+            )
+            for i in range(3)
+        ]
+
+    def expire_leases(self):
+        CCClassificationJob.objects.filter(status=CCClassificationJob.STATUS_RUNNING).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        self.assertEqual(ClassificationQueue.enqueue('decision_tree'), 3)
+        self.assertEqual(ClassificationQueue.enqueue('decision_tree'), 0)
+
+        first = ClassificationQueue.claim('worker-1', batch_size=2)
+        second = ClassificationQueue.claim('worker-2', batch_size=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.id for job in first} & {job.id for job in second})
+        self.assertEqual(ClassificationQueue.claim('worker-3'), [])
+        for job in first:
+            self.assertEqual(job.status, CCClassificationJob.STATUS_RUNNING)
+            self.assertEqual(job.worker_id, 'worker-1')
+            self.assertEqual(job.attempts, 1)
+
+    def test_expired_lease_is_reclaimed_by_another_worker(self):
+        ClassificationQueue.enqueue('decision_tree')
+        jobs = ClassificationQueue.claim('worker-1')
+        job_ids = [job.id for job in jobs]
+        self.expire_leases()
+
+        reclaimed = ClassificationQueue.claim('worker-2')
+
+        self.assertEqual(sorted(job.id for job in reclaimed), sorted(job_ids))
+        self.assertTrue(all(job.attempts == 2 for job in reclaimed))
+        self.assertEqual(ClassificationQueue.heartbeat('worker-1', job_ids), 0)
+        self.assertEqual(ClassificationQueue.lock_owned('worker-1', job_ids), [])
+        self.assertEqual(ClassificationQueue.complete('worker-1', job_ids), 0)
+        self.assertEqual(sorted(ClassificationQueue.lock_owned('worker-2', job_ids)), sorted(job_ids))
+
+    def test_expired_lease_at_max_attempts_fails(self):
+        with self.settings(CLASSIFY_QUEUE_MAX_ATTEMPTS=1):
+            ClassificationQueue.enqueue('decision_tree')
+        ClassificationQueue.claim('worker-1')
+        self.expire_leases()
+
+        self.assertEqual(ClassificationQueue.claim('worker-2'), [])
+        self.assertEqual(ClassificationQueue.stats()['failed'], 3)
+
+    def test_failed_job_is_retried_after_delay_until_max_attempts(self):
+        with self.settings(CLASSIFY_QUEUE_MAX_ATTEMPTS=2):
+            ClassificationQueue.enqueue('decision_tree', limit=1)
+
+        job = ClassificationQueue.claim('worker-1')[0]
+        self.assertEqual(ClassificationQueue.fail('worker-1', job, 'boom'), CCClassificationJob.STATUS_PENDING)
+        self.assertEqual(ClassificationQueue.claim('worker-1'), [])
+
+        CCClassificationJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        job = ClassificationQueue.claim('worker-1')[0]
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(ClassificationQueue.fail('worker-1', job, 'boom'), CCClassificationJob.STATUS_FAILED)
+        self.assertEqual(CCClassificationJob.objects.get(id=job.id).last_error, 'boom')
+
+    def test_reset_email_is_enqueued_again(self):
+        ClassificationQueue.enqueue('decision_tree')
+        jobs = ClassificationQueue.claim('worker-1')
+        ClassificationQueue.complete('worker-1', [job.id for job in jobs])
+        CCEmail.objects.filter(id=self.emails[0].id).update(categories='purchase')
+
+        # 其余两封邮件仍未分类（如被重置后等待重新分类），完成的任务重新进入队列
+        self.assertEqual(ClassificationQueue.enqueue('stepgo'), 2)
+
+        requeued = CCClassificationJob.objects.filter(status=CCClassificationJob.STATUS_PENDING)
+        self.assertEqual(sorted(requeued.values_list('email_id', flat=True)), [self.emails[1].id, self.emails[2].id])
+        self.assertTrue(all(job.attempts == 0 and job.method == 'stepgo' for job in requeued))
+
+
+class ClassifyWorkerLeaseTests(TestCase):
+    """classify_worker 只为仍持有租约的任务保存结果"""
+
+    def setUp(self):
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        self.email = CCEmail.objects.create(
+            user_mail=user_mail,
+            message_id='message-0',
+            subject='Order 0 shipped',
+            sender='shop@example.com',
+            received_time=timezone.now(),
+            content='<p>Your order has shipped</p>',
+        )
+        CCEmailClassifyRule.objects.create(
+            name='Orders', description='', sender_domains=['example.com'],
+            subject_keywords=[], body_keywords=[], classification='purchase',
+        )
+        ClassificationQueue.enqueue('decision_tree')
+        self.jobs = ClassificationQueue.claim('worker-1')
+
+    def test_owned_job_is_saved_and_completed(self):
+        self.assertEqual(ClassifyWorkerCommand(stdout=StringIO())._process_jobs('worker-1', self.jobs, False), (1, 0))
+
+        self.assertEqual(CCEmail.objects.get(id=self.email.id).categories, 'purchase')
+        self.assertEqual(CCClassificationJob.objects.get().status, CCClassificationJob.STATUS_DONE)
+
+    def test_results_of_lost_lease_are_discarded(self):
+        # 租约过期后任务已被另一个进程认领
+        CCClassificationJob.objects.update(worker_id='worker-2')
+
+        self.assertEqual(ClassifyWorkerCommand(stdout=StringIO())._process_jobs('worker-1', self.jobs, False), (0, 0))
+
+        self.assertEqual(CCEmail.objects.get(id=self.email.id).categories, '')
+        job = CCClassificationJob.objects.get()
+        self.assertEqual((job.status, job.worker_id), (CCClassificationJob.STATUS_RUNNING, 'worker-2'))
+
+
+class NearDuplicateScopeTests(SimpleTestCase):
+    """最近索引只在同一分类方法、模型版本和分类类别下继承结果"""
+
+    CATEGORIES = ('purchase', 'techsupport')
+    RESULT = {
+        'classification': 'purchase', 'confidence': 0.97, 'rule_name': 'FASTTEXT Classification', 'explanation': 'model',
+    }
+
+    def setUp(self):
+        NearDuplicateDetector.clear()
+        self.addCleanup(NearDuplicateDetector.clear)
+        body = 'Your order has been shipped and will arrive within three business days, track it online'
+        self.emails = [
+            CCEmail(
+                message_id=f'message-{i}', subject=f'Order {i} shipped', sender='shop@example.com', content=f'<p>{body}</p>'
+            )
+            for i in range(2)
+        ]
+
+    def inherited(self, remembered_scope, planned_scope):
+        NearDuplicateDetector.remember(
+            self.emails[0], NearDuplicateDetector.fingerprint(self.emails[0]), self.RESULT, remembered_scope
+        )
+        _, inherited, _ = NearDuplicateDetector.plan(self.emails, [1], planned_scope)
+        return inherited
+
+    def test_same_scope_inherits(self):
+        scope = NearDuplicateDetector.scope('fasttext', self.CATEGORIES)
+        inherited = self.inherited(scope, NearDuplicateDetector.scope('fasttext', reversed(self.CATEGORIES)))
+
+        self.assertEqual(inherited[1]['classification'], 'purchase')
+
+    def test_other_method_or_categories_do_not_inherit(self):
+        scope = NearDuplicateDetector.scope('fasttext', self.CATEGORIES)
+
+        self.assertEqual(self.inherited(scope, NearDuplicateDetector.scope('llm', self.CATEGORIES)), {})
+        self.assertEqual(self.inherited(scope, NearDuplicateDetector.scope('fasttext', ('purchase',))), {})
+
+    def test_model_version_change_invalidates(self):
+        with self.settings(CLASSIFICATION_MODEL_VERSIONS={'fasttext': '1', 'bert': '1', 'llm': '1'}):
+            scope = NearDuplicateDetector.scope('fasttext', self.CATEGORIES)
+        with self.settings(CLASSIFICATION_MODEL_VERSIONS={'fasttext': '2', 'bert': '1', 'llm': '1'}):
+            bumped = NearDuplicateDetector.scope('fasttext', self.CATEGORIES)
+
+        self.assertEqual(self.inherited(scope, bumped), {})
+
+
+class LogFilterTests(SimpleTestCase):
+    """采样和限速过滤器按模板计数，且记录的模板数有上限"""
+
+    @staticmethod
+    def record(msg, *args):
+        return logging.LogRecord('core.test', logging.INFO, __file__, 1, msg, args, None)
+
+    def test_sampling_groups_lazy_formatted_messages(self):
+        sampling = SamplingFilter(sample_rate=0.5)
+
+        kept = [sampling.filter(self.record("邮件 '%s' 分类完成", f'subject {i}')) for i in range(4)]
+
+        self.assertEqual(kept, [True, False, True, False])
+        self.assertEqual(len(sampling._counts), 1)
+
+    def test_rate_limit_groups_lazy_formatted_messages(self):
+        rate_limit = RateLimitFilter(rate=0.001, burst=2)
+
+        kept = [rate_limit.filter(self.record("邮件 '%s' 分类完成", f'subject {i}')) for i in range(4)]
+
+        self.assertEqual(kept, [True, True, False, False])
+        self.assertEqual(len(rate_limit._buckets), 1)
+
+    def test_template_count_is_bounded(self):
+        sampling = SamplingFilter(sample_rate=0.5, max_keys=10)
+        rate_limit = RateLimitFilter(rate=1, burst=1, max_keys=10)
+
+        for i in range(100):
+            record = self.record(f'message {i}')
+            sampling.filter(record)
+            rate_limit.filter(record)
+
+        self.assertEqual(len(sampling._counts), 10)
+        self.assertEqual(len(rate_limit._buckets), 10)
+        self.assertIn(('core.test', 'message 99'), rate_limit._buckets)
+
+
+WORDS = ['order', 'ord', 'der', 'invoice', 'voice', 'refund', 'ship', 'shipping', 'holiday', 'happy', 'error', 'crash',
+         '订单', '发票', 'a', 'aa']
+
+
+def random_text(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, words)))
+
+
+class KeywordAutomatonTests(SimpleTestCase):
+    """Aho-Corasick 扫描与逐个关键词的子串查找结果相同"""
+
+    def assert_equivalent(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            keywords = [(rng.choice(WORDS + [''])[:rng.randint(1, 8)], rng.randint(0, 9)) for _ in range(rng.randint(1, 12))]
+            automaton = KeywordAutomaton.from_keywords(keywords)
+            for _ in range(20):
+                text = random_text(rng).replace(' ', rng.choice(['', ' ']))
+                expected = {tag for keyword, tag in keywords if keyword in text}
+                self.assertEqual(automaton.search(text), expected, (keywords, text))
+
+    def test_matches_naive_substring_search(self):
+        self.assert_equivalent()
+
+    def test_pure_python_matches_naive_substring_search(self):
+        with mock.patch.object(keyword_matcher, 'ahocorasick', None):
+            self.assert_equivalent()
+
+    def test_overlapping_keywords_and_shared_tags(self):
+        automaton = KeywordAutomaton.from_keywords([('he', 1), ('she', 2), ('hers', 3), ('his', 1), ('', 4)])
+
+        self.assertEqual(automaton.search('ushers'), {1, 2, 3, 4})
+        self.assertEqual(automaton.search(''), {4})
+        self.assertEqual(KeywordAutomaton.from_keywords([]).search('anything'), set())
+
+
+DOMAINS = ['vendor.com', 'mail.vendor.com', 'a.mail.vendor.com', 'evilvendor.com', 'vendor.com.cn', 'com', 'shop.cn']
+
+
+def naive_domain_match(domain, rule_domain, include_subdomains):
+    return domain == rule_domain or (include_subdomains and domain.endswith('.' + rule_domain))
+
+
+class DomainIndexTests(SimpleTestCase):
+    """域名索引的查询结果与逐条规则比较域名（精确匹配和后缀匹配）相同"""
+
+    def test_matches_naive_suffix_comparison(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            rules = [
+                (rng.sample(DOMAINS, rng.randint(1, 3)), rng.random() < 0.5) for _ in range(rng.randint(1, 6))
+            ]
+            index = DomainIndex()
+            for rule_index, (domains, include_subdomains) in enumerate(rules):
+                for domain in domains:
+                    index.add(domain, rule_index, include_subdomains)
+            for domain in DOMAINS + ['x.evilvendor.com', 'x.shop.cn', '']:
+                expected = next((
+                    rule_index for rule_index, (domains, include_subdomains) in enumerate(rules)
+                    if any(naive_domain_match(domain, d, include_subdomains) for d in domains)
+                ), None)
+                self.assertEqual(index.lookup(domain), expected, (rules, domain))
+
+    def test_subdomain_matching_respects_label_boundaries(self):
+        index = DomainIndex()
+        index.add('vendor.com', 1, include_subdomains=True)
+        index.add('mail.vendor.com', 0)
+
+        self.assertEqual(index.lookup('mail.vendor.com'), 0)
+        self.assertEqual(index.lookup('x.mail.vendor.com'), 1)
+        self.assertEqual(index.lookup('vendor.com'), 1)
+        self.assertIsNone(index.lookup('evilvendor.com'))
+        self.assertIsNone(index.lookup('com'))
+
+    def test_compiled_rule_domain_check_matches_index(self):
+        rule_set = CompiledRuleSet([CCEmailClassifyRule(
+            id=1, name='vendor', description='', sender_domains=['Vendor.com'], subject_keywords=[],
+            body_keywords=[], classification='purchase', match_subdomains=True,
+        )])
+        for domain in DOMAINS:
+            self.assertEqual(rule_set.rules[0].matches_domain(domain), rule_set.domain_index.lookup(domain) == 0, domain)
+
+
+def naive_rule_matches(rule, email):
+    """逐条件检查规则（预编译之前的实现），任一条件满足即匹配"""
+    domain = (email.sender or '').split('@')[-1].lower()
+    domains = [d.lower() for d in rule.sender_domains or []]
+    if any(naive_domain_match(domain, d, rule.match_subdomains) for d in domains):
+        return True
+    if any(keyword.lower() in (email.subject or '').lower() for keyword in rule.subject_keywords or []):
+        return True
+    if any(keyword.lower() in (email.content or '').lower() for keyword in rule.body_keywords or []):
+        return True
+    for field, text in (('subject_patterns', email.subject), ('body_patterns', email.content),
+                        ('sender_patterns', email.sender)):
+        if any(re.search(pattern, text or '', re.IGNORECASE) for pattern in getattr(rule, field) or []):
+            return True
+    if rule.min_attachments or rule.max_attachments:
+        if email.attachment_count >= rule.min_attachments and not (
+                rule.max_attachments and email.attachment_count > rule.max_attachments):
+            return True
+    if rule.min_attachment_size or rule.max_attachment_size:
+        if email.total_attachment_size >= rule.min_attachment_size and not (
+                rule.max_attachment_size and email.total_attachment_size > rule.max_attachment_size):
+            return True
+    return False
+
+
+def random_rule(rng, rule_id):
+    rule = CCEmailClassifyRule(
+        id=rule_id, name=f'rule-{rule_id}', description='', classification=f'category-{rule_id}',
+        priority=rng.randint(0, 3), match_subdomains=rng.random() < 0.5,
+        sender_domains=rng.sample(DOMAINS, rng.randint(0, 2)) if rng.random() < 0.3 else [],
+        subject_keywords=rng.sample(WORDS, 1) if rng.random() < 0.3 else [],
+        body_keywords=[w.upper() for w in rng.sample(WORDS, 1)] if rng.random() < 0.3 else [],
+        subject_patterns=[rng.choice([r'^order', r'ship\w+', r'\d{3}'])] if rng.random() < 0.15 else [],
+        sender_patterns=[r'@mail\.'] if rng.random() < 0.1 else [],
+    )
+    if rng.random() < 0.2:
+        rule.min_attachments = rng.randint(0, 5)
+        rule.max_attachments = rng.choice([None, 0, rng.randint(1, 3)])
+    if rng.random() < 0.2:
+        rule.min_attachment_size = rng.choice([0, 50000, 150000])
+        rule.max_attachment_size = rng.choice([None, 0, 100000])
+    return rule
+
+
+def random_email(rng):
+    return CCEmail(
+        subject=random_text(rng, 3) + rng.choice(['', ' 123']),
+        sender=f"someone@{rng.choice(DOMAINS + ['x.evilvendor.com', 'other.org'])}",
+        content=f"<p>{random_text(rng, 4)}</p>",
+        attachment_count=rng.randint(0, 6),
+        total_attachment_size=rng.choice([0, 500, 5000, 80000, 200000]),
+    )
+
+
+class FirstMatchEquivalenceTests(SimpleTestCase):
+    """预编译规则集（逐封和批量）的匹配结果与按优先级逐条检查规则的结果相同"""
+
+    def test_first_match_and_batch_match_naive_rule_order(self):
+        rng = random.Random(4)
+        for _ in range(60):
+            rules = sorted((random_rule(rng, rule_id) for rule_id in range(1, rng.randint(2, 12))),
+                           key=lambda rule: (rule.priority, rule.id))
+            rule_set = CompiledRuleSet(rules)
+            emails = [random_email(rng) for _ in range(25)]
+
+            expected = [next((rule.id for rule in rules if naive_rule_matches(rule, email)), None) for email in emails]
+            single = [getattr(rule_set.first_match(email), 'id', None) for email in emails]
+            batch = [getattr(rule, 'id', None) for rule in rule_set.first_match_batch(emails)]
+
+            self.assertEqual(single, expected)
+            self.assertEqual(batch, expected)
+
+
+@skipUnless(connection.vendor == 'postgresql', '规则下推仅支持 PostgreSQL')
+class RulePushdownEquivalenceTests(TestCase):
+    """数据库内的规则下推与 Python 端逐封匹配的分类结果相同"""
+
+    def test_pushdown_matches_in_process_first_match(self):
+        rng = random.Random(5)
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        emails = []
+        for number in range(60):
+            email = random_email(rng)
+            email.user_mail = user_mail
+            email.message_id = f'msg-{number}'
+            email.received_time = timezone.now()
+            emails.append(email)
+        CCEmail.objects.bulk_create(emails)
+
+        for _ in range(15):
+            rules = sorted((random_rule(rng, rule_id) for rule_id in range(1, rng.randint(2, 10))),
+                           key=lambda rule: (rule.priority, rule.id))
+            rule_set = CompiledRuleSet(rules)
+            pushable = len(RulePushdownService.pushable_rules(rule_set))
+            CCEmail.objects.update(categories='', classification_method='')
+
+            RulePushdownService.classify_backlog(rule_set, 'decision_tree')
+
+            for email in CCEmail.objects.order_by('message_id'):
+                rule = rule_set.first_match(email)
+                pushed = rule is not None and rule_set.rules.index(rule) < pushable
+                self.assertEqual(email.categories, rule.classification if pushed else '', email.message_id)
+                self.assertEqual(email.classification_method, 'decision_tree' if pushed else '')
+
+
+SAFE_PATTERNS = [r'^order', r'ship\w+', r'\d{3}', r'(voice|refund)', r'err(or)?', r'(?=happy)h', r'a{2}', r'\bord\b',
+                 r'[a-c]+d', r'订单\s*\d*']
+
+
+class PatternMatcherTests(SimpleTestCase):
+    """模式校验拒绝有回溯风险的模式；合并匹配的结果与逐条规则执行正则相同"""
+
+    def test_rejects_catastrophic_and_unsupported_patterns(self):
+        for pattern in [r'(a+)+', r'(\w+\s?)*', r'(a|ab)*', r'(a|a)*', r'(.*a){2,}x', r'(a+){1,50}',
+                        r'(?:x\d*){2}', r'(\w)\1', r'(?P<name>a)',
+                        r'(a)?(?(1)b|c)', r'(?i)abc', r'(unclosed', 'a' * 501, '']:
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValueError):
+                    validate_pattern(pattern)
+
+    def test_accepts_safe_patterns(self):
+        for pattern in SAFE_PATTERNS + [r'(ab|cd)+', r'(a{3})+', r'(?:x\d)*', r'(?:ab){1,50}', r'(?:\d+)?x']:
+            validate_pattern(pattern)
+        validate_pattern('*@vendor.com', 'glob')
+
+    def test_rule_save_rejects_unsafe_pattern_and_engine_ignores_it(self):
+        rule = CCEmailClassifyRule(
+            id=1, name='unsafe', description='', sender_domains=[], subject_keywords=['invoice'], body_keywords=[],
+            classification='finance', subject_patterns=[r'(a+)+$'],
+        )
+        with self.assertRaises(ValidationError):
+            rule.save()
+
+        rule_set = CompiledRuleSet([rule])
+        self.assertEqual(rule_set.rules[0].subject_patterns, ())
+        self.assertIsNone(rule_set.first_match(CCEmail(subject='a' * 40 + '!', sender='x@y.com', content='')))
+
+    def test_first_matches_naive_per_tag_search(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            tagged = [(tag, rng.sample(SAFE_PATTERNS, rng.randint(1, 2))) for tag in range(rng.randint(1, 8))]
+            matcher = PatternMatcher.from_patterns(tagged)
+            for _ in range(10):
+                text = random_text(rng, 5) + rng.choice(['', ' 123', ' AA'])
+                hits = [tag for tag, patterns in tagged if any(re.search(p, text, re.IGNORECASE) for p in patterns)]
+                limit = rng.choice([None, rng.randint(0, 8)])
+                expected = min(hits) if hits and (limit is None or min(hits) < limit) else None
+                self.assertEqual(matcher.first(text, limit=limit), expected, (tagged, text, limit))
+                self.assertEqual(matcher.search_all(text), set(hits))
+
+    def test_glob_patterns_match_whole_field(self):
+        matcher = PatternMatcher.from_patterns([
+            (0, [translate_pattern('*@vendor.com', 'glob')]),
+            (1, [translate_pattern('billing@*', 'glob')]),
+        ])
+
+        self.assertEqual(matcher.first('Sales@Vendor.com'), 0)
+        self.assertEqual(matcher.first('billing@vendor.com'), 0)
+        self.assertEqual(matcher.first('billing@vendor.com.cn'), 1)
+        self.assertIsNone(matcher.first('sales@vendor.com.cn'))
+        self.assertIsNone(matcher.first('x billing@other.org'))
+
+
+def naive_extract_text(html_content):
+    """逐步替换的正则实现（单遍提取之前的实现），最后再合并一次空白字符"""
+    text = re.sub(r'<[^>]+>', ' ', html_content)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.replace('\\r', ' ').replace('\\n', ' ').replace('\\t', ' ')
+    text = text.replace('"', '').replace("'", "")
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def random_html(rng, parts):
+    pieces = ['<p>', '</p>', '<div class="x">', '</div>', '<br/>', "<a href='y'>", '</a>', '\n', '\\n', '"', "'"]
+    return ''.join(rng.choice(pieces) if rng.random() < 0.4 else rng.choice(WORDS) + ' ' for _ in range(parts))
+
+
+class ExtractTextFromHtmlTests(SimpleTestCase):
+    """单遍 HTML 文本提取"""
+
+    def test_matches_naive_extraction_on_plain_html(self):
+        rng = random.Random(16)
+        for parts in [0, 1, 5, 50, 30000]:
+            for _ in range(5):
+                html_content = random_html(rng, parts)
+                self.assertEqual(extract_text_from_html(html_content, max_chars=0), naive_extract_text(html_content))
+
+    def test_skips_non_body_elements_and_comments(self):
+        html_content = (
+            '<html><head><title>Title</title><STYLE type="text/css">p { color: red; }</STYLE></head>'
+            '<body><script>var a = "<p>x</p>";</script><!-- <p>hidden</p> -->'
+            '<p>Hello</p><svg/><p>world</p><noscript>enable js</noscript><template><p>t</p></template></body></html>'
+        )
+        self.assertEqual(extract_text_from_html(html_content, max_chars=0), 'Hello world')
+
+    def test_unclosed_skipped_element_skips_to_end(self):
+        self.assertEqual(extract_text_from_html('<p>kept</p><script>var a = 1; <p>lost</p>', max_chars=0), 'kept')
+        self.assertEqual(extract_text_from_html('<p>kept</p><!-- <p>lost</p>', max_chars=0), 'kept')
+
+    def test_decodes_entities_after_removing_tags(self):
+        html_content = '<p>Tom &amp; Jerry &lt;b&gt;&nbsp;&#8364;5 &quot;q&quot; &unknown;</p>'
+        self.assertEqual(extract_text_from_html(html_content, max_chars=0), 'Tom & Jerry <b> €5 q &unknown;')
+
+    def test_budget_truncates_to_prefix_of_full_text(self):
+        html_content = ''.join(f'<p>word{i}</p><style>s{i}</style>' for i in range(20000))
+        full = extract_text_from_html(html_content, max_chars=0)
+        for max_chars in [1, 7, 1000, 50000]:
+            self.assertEqual(extract_text_from_html(html_content, max_chars=max_chars), full[:max_chars])
+        with self.settings(EMAIL_TEXT_MAX_CHARS=12):
+            self.assertEqual(extract_text_from_html(html_content), full[:12])
+
+    def test_chunk_boundaries_do_not_split_tags_or_skipped_elements(self):
+        for offset in range(32 * 1024 - 40, 32 * 1024 + 5, 3):
+            html_content = 'a' * offset + '<div class="boundary">b</div><style>c { }</style><p>d</p>' + 'e' * 40000
+            expected = 'a' * offset + ' b d ' + 'e' * 40000
+            self.assertEqual(extract_text_from_html(html_content, max_chars=0), expected.replace('  ', ' '), offset)
+
+    def test_chunk_boundaries_do_not_split_entities(self):
+        for offset in range(32 * 1024 - 40, 32 * 1024 + 2):
+            for entity, char in [('&amp;', '&'), ('&#8364;', '€'), ('&CounterClockwiseContourIntegral;', '∳')]:
+                html_content = '<p>' + 'a' * offset + entity + 'b</p>' + 'c' * 40000
+                expected = 'a' * offset + char + 'b ' + 'c' * 40000
+                self.assertEqual(extract_text_from_html(html_content, max_chars=0), expected, (offset, entity))
+
+
+class NormalizedEmailTests(SimpleTestCase):
+    """邮件预处理结果与直接计算的特征相同，并随邮件内容变化重建"""
+
+    def test_features_match_direct_computation(self):
+        rng = random.Random(15)
+        for _ in range(50):
+            email = random_email(rng)
+            normalized = NormalizedEmail.of(email)
+
+            self.assertIs(NormalizedEmail.of(email), normalized)
+            self.assertEqual(normalized.subject_lower, email.subject.lower())
+            self.assertEqual(normalized.content_lower, email.content.lower())
+            self.assertEqual(normalized.sender_domain, email.sender.split('@')[-1].lower())
+            self.assertEqual(normalized.clean_text, extract_text_from_html(email.content))
+            self.assertEqual(normalized.word_count, len(normalized.clean_text.split()))
+
+    def test_rebuilt_after_content_change(self):
+        email = CCEmail(subject='Order', sender='a@Vendor.com', content='<p>old</p>')
+        self.assertEqual(NormalizedEmail.of(email).clean_text, 'old')
+
+        email.content = '<p>new</p>'
+        email.normalized_text = None
+        self.assertEqual(NormalizedEmail.of(email).clean_text, 'new')
+        self.assertEqual(NormalizedEmail.persist_fields(email), ['normalized_text'])
+
+    def test_stored_text_skips_html_parsing(self):
+        email = CCEmail(subject='Order', sender='a@vendor.com', content='<p>html</p>', normalized_text='stored')
+        normalized = NormalizedEmail.of(email)
+
+        self.assertEqual(normalized.clean_text, 'stored')
+        self.assertFalse(normalized.text_extracted)
+        self.assertEqual(NormalizedEmail.persist_fields(email), [])
+
+
+class MetricsViewTests(SimpleTestCase):
+    """指标端点的访问控制"""
+
+    def get(self, remote_addr, **headers):
+        return metrics_view(RequestFactory().get('/api/metrics', REMOTE_ADDR=remote_addr, **headers)).status_code
+
+    def test_without_token_only_allowed_networks(self):
+        with self.settings(METRICS_TOKEN='', METRICS_ALLOWED_NETWORKS=['127.0.0.0/8', '10.0.0.0/8']):
+            self.assertEqual(self.get('127.0.0.1'), 200)
+            self.assertEqual(self.get('10.1.2.3'), 200)
+            self.assertEqual(self.get('203.0.113.5'), 403)
+            self.assertEqual(self.get(''), 403)
+
+    def test_token_required_when_configured(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.get('203.0.113.5', HTTP_AUTHORIZATION='Bearer secret'), 200)
+            self.assertEqual(self.get('127.0.0.1'), 401)
+            self.assertEqual(self.get('127.0.0.1', HTTP_AUTHORIZATION='Bearer wrong'), 401)
+
+
+class DjangoCacheBackendTests(SimpleTestCase):
+    def test_clear_only_invalidates_classification_entries(self):
+        backend = DjangoCacheBackend('default', ttl=60)
+        backend.cache.set('session:abc', 'other data')
+        backend.set('key', 'llm', {'classification': 'purchase'})
+        self.assertEqual(backend.get('key'), {'classification': 'purchase'})
+
+        backend.clear()
+
+        self.assertIsNone(backend.get('key'))
+        self.assertEqual(backend.cache.get('session:abc'), 'other data')
+        backend.set('key', 'llm', {'classification': 'finance'})
+        backend.clear()
+        self.assertIsNone(backend.get('key'))
+
+
+class ForwardingLogSequenceTests(TestCase):
+    """以前显式指定主键插入的转发日志不影响之后的自增主键"""
+
+    def test_create_after_explicit_ids(self):
+        fields = dict(sender='a@vendor.com', received_time=timezone.now(), classification='purchase',
+                      email_type='order', forwarding_recipient='buyer@example.com')
+        for log_id in (1, 2, 3):
+            CCEmailForwardingLog.objects.create(id=log_id, title=f'old {log_id}', **fields)
+
+        migration = importlib.import_module('core.migrations.0015_reset_forwarding_log_sequence')
+        migration.reset_forwarding_log_sequence(apps, SimpleNamespace(connection=connection))
+
+        log = CCEmailForwardingLog.objects.create(title='new', **fields)
+        self.assertGreater(log.id, 3)
+
+
+class InvalidJsonLLMProvider:
+    """返回无法解析的回复的 LLM 提供者"""
+
+    def chat(self, messages):
+        return 'purchase, probably'
+
+
+class FallbackResultCacheTests(SimpleTestCase):
+    """模型输出无法解析时的回退结果不写入缓存"""
+
+    def setUp(self):
+        self.tool = LLMClassificationTool()
+        self.tool.llm_provider = InvalidJsonLLMProvider()
+        self.email = CCEmail(subject='Order', sender='a@vendor.com', content='<p>order 1</p>')
+        self.categories = ['purchase', 'finance']
+
+    def assert_not_cached(self, result):
+        self.assertTrue(result['error'])
+        self.assertTrue(ClassifierFactory._is_error(result))
+        self.assertFalse(ClassificationCache.is_cacheable(result))
+        self.assertIsNone(ClassificationCache.get(ClassificationCache.make_key(self.email, 'llm', self.categories), 'llm'))
+
+    def test_single_fallback_not_cached(self):
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='local'):
+            ClassificationCache.clear()
+            result = ClassifierFactory().classify_email(self.email, 'llm', self.categories, classifier=self.tool)
+            self.assertEqual(result['classification'], 'purchase')
+            self.assert_not_cached(result)
+
+    def test_batch_fallback_not_cached(self):
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='local'):
+            ClassificationCache.clear()
+            [result] = ClassifierFactory().classify_emails_batch([self.email], 'llm', self.categories, classifier=self.tool)
+            self.assert_not_cached(result)
+
+
+class ScriptedTool:
+    """按邮件主题返回预设结果的模型工具，记录每次调用处理的主题"""
+
+    def __init__(self, outcomes, default=('other', 0.1)):
+        self.outcomes = outcomes
+        self.default = default
+        self.calls = []
+
+    def classify(self, email, categories):
+        self.calls.append([email.subject])
+        return self._result(email)
+
+    def classify_batch(self, emails, categories):
+        self.calls.append([email.subject for email in emails])
+        return [self._result(email) for email in emails]
+
+    def _result(self, email):
+        classification, confidence = self.outcomes.get(email.subject, self.default)
+        return {'classification': classification, 'confidence': confidence, 'explanation': email.subject}
+
+
+class StepClassifyBatchEquivalenceTests(SimpleTestCase):
+    """分阶段批量 stepgo 与逐封级联的分类结果、方法和阶段相同"""
+
+    SUBJECTS = ['order 1', 'fast', 'bert', 'mixed', 'llm', 'none']
+
+    def make_context(self, **overrides):
+        tools = {
+            'fasttext': ScriptedTool({'fast': ('techsupport', 0.99), 'mixed': ('purchase', 0.5)}),
+            'bert': ScriptedTool({'bert': ('festival', 0.95), 'mixed': ('techsupport', 0.93)}),
+            'llm': ScriptedTool({'llm': ('other', 0.9), 'none': ('festival', 0.3)}),
+        }
+        context = stub_context([ORDER_RULE], tools, **overrides)
+        agent = EmailClassificationAgent(categories=list(context.categories), tools=tools)
+        return dataclasses.replace(context, agent=agent)
+
+    @staticmethod
+    def summary(result):
+        return (result['classification'], result.get('rule_name'), result.get('confidence'), result.get('stage'))
+
+    def assert_equivalent(self, **overrides):
+        emails = [CCEmail(subject=subject, sender='a@example.com', content='<p>text</p>') for subject in self.SUBJECTS]
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='none'):
+            expected = [EmailClassifier._step_classifier(email, self.make_context(**overrides)) for email in emails]
+            context = self.make_context(**overrides)
+            batch = EmailClassifier._step_classify_batch(emails, context)
+
+        self.assertEqual([self.summary(r) for r in batch], [self.summary(r) for r in expected])
+        return context, batch
+
+    def test_sequential_order(self):
+        context, batch = self.assert_equivalent()
+
+        self.assertEqual([r['stage'] for r in batch[:5]], ['rules', 'fasttext', 'bert', 'bert', 'llm'])
+        self.assertEqual(batch[3]['classification'], 'techsupport')
+        self.assertEqual(batch[5]['classification'], 'unclassified')
+        # 每个阶段只调用一次，只处理前面阶段未解决的邮件
+        self.assertEqual(context.tools['fasttext'].calls, [['fast', 'bert', 'mixed', 'llm', 'none']])
+        self.assertEqual(context.tools['bert'].calls, [['bert', 'mixed', 'llm', 'none']])
+        self.assertEqual(context.tools['llm'].calls, [['llm', 'none']])
+
+    def test_bert_before_fasttext(self):
+        self.assert_equivalent(model_order=('bert', 'fasttext'))
+
+    def test_single_model(self):
+        context, batch = self.assert_equivalent(strategy='single', single_model='fasttext')
+        self.assertEqual(context.tools['bert'].calls, [])
+
+
+class WordLengthTokenizer:
+    """每个词对应一个 token（id 为词长），pad 用 0 填充并生成 attention_mask"""
+
+    def __call__(self, texts, truncation, max_length, padding):
+        return {'input_ids': [[len(word) for word in text.split()][:max_length] for text in texts]}
+
+    def pad(self, encoded, padding, return_tensors):
+        rows = encoded['input_ids']
+        longest = max(len(row) for row in rows)
+        return {
+            'input_ids': torch.tensor([row + [0] * (longest - len(row)) for row in rows]),
+            'attention_mask': torch.tensor([[1] * len(row) + [0] * (longest - len(row)) for row in rows]),
+        }
+
+
+class MaskedSumModel:
+    """只根据未被遮盖的 token 计算 logits，填充不应改变结果；记录每次前向计算的输入形状"""
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, input_ids, attention_mask):
+        self.shapes.append(tuple(input_ids.shape))
+        total = (input_ids * attention_mask).sum(dim=1)
+        count = attention_mask.sum(dim=1).float()
+        return torch.stack([(total % 4 == k).float() * 3 + count * 0.01 * k for k in range(4)], dim=1)
+
+
+class BertPredictBatchTests(SimpleTestCase):
+    """按长度分桶的批量推理按输入顺序返回结果，填充不影响结果"""
+
+    def setUp(self):
+        self.provider = BertProvider({})
+        self.provider.tokenizer = WordLengthTokenizer()
+        self.provider.model = MaskedSumModel()
+        self.provider.labels_reverse = {0: 'purchase', 1: 'techsupport', 2: 'festival', 3: 'other'}
+
+    def test_results_follow_input_order_and_ignore_padding(self):
+        rng = random.Random(25)
+        texts = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))) for _ in range(23)]
+
+        with self.settings(BERT_LABEL_MAP={}):
+            results = self.provider.predict_batch(texts, batch_size=4, max_length=512)
+            shapes = list(self.provider.model.shapes)
+            single = [self.provider.predict_batch([text])[0] for text in texts]
+
+        self.assertEqual(len(shapes), 6)
+        self.assertEqual(sum(rows for rows, _ in shapes), len(texts))
+        for text, result, alone in zip(texts, results, single):
+            expected = ['purchase', 'techsupport', 'festival', 'other'][sum(len(word) for word in text.split()) % 4]
+            self.assertEqual(result['classification'], expected, text)
+            for batched, unpadded in zip(result['probabilities'], alone['probabilities']):
+                self.assertAlmostEqual(batched, unpadded, places=6)
+
+
+class ClassifyEmailsCheckpointTests(TestCase):
+    """classify_emails 按邮件 ID 分块处理，中断后从检查点继续"""
+
+    def setUp(self):
+        CCEmailClassifyRule.objects.create(**ORDER_RULE)
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        self.ids = [
+            CCEmail.objects.create(
+                user_mail=user_mail, message_id=f'message-{i}', subject=f'Order {i}', sender='shop@example.com',
+                received_time=timezone.now(), content='<p>order</p>',
+            ).id
+            for i in range(7)
+        ]
+
+    def run_command(self, **options):
+        chunks = []
+        original = ClassifyEmailsCommand._classify_chunk
+
+        def record(command, email_ids, command_options):
+            chunks.append(list(email_ids))
+            return original(command, email_ids, command_options)
+
+        with mock.patch.object(ClassifyEmailsCommand, '_classify_chunk', autospec=True, side_effect=record):
+            call_command('classify_emails', method='decision_tree', enable_forwarding=False, chunk_size=3,
+                         checkpoint='test', stdout=StringIO(), **options)
+        return chunks
+
+    def test_resume_after_interrupted_run(self):
+        self.assertEqual(self.run_command(max_emails=3), [self.ids[:3]])
+        checkpoint = CCClassificationCheckpoint.objects.get(name='test')
+        self.assertEqual((checkpoint.last_email_id, checkpoint.processed_count), (self.ids[2], 3))
+        self.assertFalse(checkpoint.completed)
+
+        # 已处理的邮件即使重新变为未分类，继续运行时也不会重复处理
+        CCEmail.objects.filter(id__in=self.ids[:3]).update(categories='')
+        self.assertEqual(self.run_command(), [self.ids[3:6], self.ids[6:]])
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.processed_count, 7)
+        self.assertTrue(checkpoint.completed)
+        self.assertEqual(CCEmail.objects.filter(id__in=self.ids[3:], categories='purchase').count(), 4)
+
+        self.assertEqual(self.run_command(reset_checkpoint=True), [self.ids[:3]])
+        self.assertFalse(CCEmail.objects.filter(categories='').exists())
+
+
+class DelayedTool:
+    """按预设延迟返回结果的模型工具，记录同时进行的调用数"""
+
+    def __init__(self, delays, classification='purchase', fail=()):
+        self.delays = delays
+        self.classification = classification
+        self.fail = set(fail)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def classify(self, email, categories):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(email.subject, 0))
+            if email.subject in self.fail:
+                raise RuntimeError(f'{email.subject} failed')
+            return {'classification': self.classification, 'confidence': 0.99, 'explanation': email.subject}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class AsyncClassifyTests(SimpleTestCase):
+    """异步分类按输入顺序返回结果，并发数受信号量限制，单封邮件出错不影响其他邮件"""
+
+    def test_input_order_concurrency_limit_and_failure_isolation(self):
+        subjects = [f'email {i}' for i in range(8)]
+        # 越靠前的邮件越晚完成
+        tool = DelayedTool({subject: 0.02 * (8 - i) for i, subject in enumerate(subjects)}, fail={'email 2'})
+        context = stub_context(tools={'llm': tool})
+        emails = [CCEmail(id=i, subject=subject, sender='a@example.com', content='') for i, subject in enumerate(subjects)]
+        original = ClassifierFactory.classify_email
+
+        def classify_email(factory, email, method, categories, classifier=None):
+            # 工厂会捕获分类器的异常；email 5 模拟工厂之外的错误，使对应的任务本身失败
+            if email.subject == 'email 5':
+                raise RuntimeError('unexpected')
+            return original(factory, email, method, categories, classifier)
+
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='none', NEAR_DUPLICATE_ENABLED=False), \
+                mock.patch.object(ClassificationContext, 'build', return_value=context), \
+                mock.patch.object(ClassifierFactory, 'classify_email', autospec=True, side_effect=classify_email):
+            result = asyncio.run(EmailClassifier.aclassify_emails(emails, method='llm', llm_concurrency=2))
+
+        self.assertEqual(tool.max_active, 2)
+        self.assertEqual([item['subject'] for item in result['purchase']],
+                         [subject for subject in subjects if subject not in ('email 2', 'email 5')])
+        self.assertEqual([item['subject'] for item in result['unclassified']], ['email 2'])
+        self.assertTrue(result['unclassified'][0]['explanation'].startswith('Error'))
+        self.assertEqual([item['subject'] for item in result['error']], ['email 5'])
+
+
+class RuleStatsTests(TestCase):
+    """规则命中统计的后缀和计算和写入数据库"""
+
+    def test_drain_derives_evaluations_from_first_match_index(self):
+        stats = RuleStats(3)
+        stats.record(0, 0.3)
+        stats.record(2, 0.3)
+        stats.record(None, 0.3)
+        stats.record_batch([1, None], 0.4)
+
+        evaluations, hits, eval_seconds = stats.drain()
+
+        # 下标为 b 的结果评估了规则 0..b，未匹配的结果评估了全部规则；耗时平均分摊给被评估的规则
+        self.assertEqual(evaluations.tolist(), [5, 4, 3])
+        self.assertEqual(hits.tolist(), [1, 1, 1])
+        for actual, expected in zip(eval_seconds.tolist(), [0.3 + 0.1 + 0.1 + 0.1 + 0.2 / 3,
+                                                            0.1 + 0.1 + 0.1 + 0.2 / 3,
+                                                            0.1 + 0.1 + 0.2 / 3]):
+            self.assertAlmostEqual(actual, expected)
+        self.assertEqual(stats.drain()[0].tolist(), [0, 0, 0])
+
+    def test_flush_accumulates_into_hit_stat_table(self):
+        first = CCEmailClassifyRule.objects.create(**ORDER_RULE, priority=0)
+        second = CCEmailClassifyRule.objects.create(
+            name='Vendor', description='', sender_domains=['vendor.com'], subject_keywords=[], body_keywords=[],
+            classification='techsupport', priority=1,
+        )
+        rule_set = CompiledRuleSet(CCEmailClassifyRule.objects.order_by('priority', 'id'))
+        emails = [CCEmail(subject=subject, sender=sender, content='')
+                  for subject, sender in [('order', 'a@x.com'), ('hi', 'b@vendor.com'), ('hi', 'c@x.com')]]
+
+        for _ in range(2):
+            for email in emails:
+                rule_set.first_match(email)
+            self.assertEqual(RuleStatsRecorder.flush(rule_set), 2)
+
+        stats = {stat.rule_id: stat for stat in CCRuleHitStat.objects.all()}
+        self.assertEqual((stats[first.id].evaluations, stats[first.id].hits), (6, 2))
+        self.assertEqual((stats[second.id].evaluations, stats[second.id].hits), (4, 2))
+        self.assertGreater(stats[first.id].total_eval_time_ms, 0)
+        self.assertIsNotNone(stats[first.id].last_hit_at)
+        self.assertEqual(RuleStatsRecorder.flush(rule_set), 0)
+
+
+class AdaptiveRuleOrderTests(SimpleTestCase):
+    """按命中率重排只改变同优先级规则之间的顺序，不会让低优先级规则胜过高优先级规则"""
+
+    def test_reordering_preserves_priority_semantics(self):
+        rng = random.Random(6)
+        for _ in range(60):
+            rules = sorted((random_rule(rng, rule_id) for rule_id in range(1, rng.randint(2, 12))),
+                           key=lambda rule: (rule.priority, rule.id))
+            hit_rates = {rule.id: rng.random() for rule in rules}
+            adaptive_order = sorted(rules, key=lambda rule: (rule.priority, -hit_rates[rule.id]))
+            rule_set = CompiledRuleSet(rules, hit_rates=hit_rates)
+            emails = [random_email(rng) for _ in range(25)]
+
+            batch = rule_set.first_match_batch(emails)
+            for email, batch_rule in zip(emails, batch):
+                matching = [rule for rule in rules if naive_rule_matches(rule, email)]
+                winner = rule_set.first_match(email)
+                self.assertEqual(getattr(winner, 'id', None), getattr(batch_rule, 'id', None))
+                expected = next((rule for rule in adaptive_order if rule in matching), None)
+                self.assertEqual(getattr(winner, 'id', None), getattr(expected, 'id', None))
+                if not matching:
+                    continue
+                # 胜出规则的优先级与按 (priority, id) 顺序的结果相同；同优先级只有一条匹配时结果完全相同
+                self.assertEqual(winner.priority, matching[0].priority)
+                if [rule.priority for rule in matching].count(matching[0].priority) == 1:
+                    self.assertEqual(winner.id, matching[0].id)
+
+
+class RuleSetCacheTests(TestCase):
+    """规则集缓存在规则变更（信号）或超过 CLASSIFY_RULES_CACHE_TTL 后重新编译"""
+
+    def setUp(self):
+        self.rule = CCEmailClassifyRule.objects.create(**ORDER_RULE)
+
+    def classify(self, subject):
+        rule = RuleSetCache.get_rule_set().first_match(CCEmail(subject=subject, sender='a@x.com', content=''))
+        return getattr(rule, 'name', None)
+
+    def test_cached_until_rule_changes(self):
+        rule_set = RuleSetCache.get_rule_set()
+        with self.assertNumQueries(0):
+            self.assertIs(RuleSetCache.get_rule_set(), rule_set)
+
+        self.rule.subject_keywords = ['invoice']
+        self.rule.save()
+        self.assertIsNot(RuleSetCache.get_rule_set(), rule_set)
+        self.assertEqual(self.classify('invoice 1'), 'Orders')
+        self.assertIsNone(self.classify('order 1'))
+
+        self.rule.delete()
+        self.assertEqual(len(RuleSetCache.get_rule_set()), 0)
+
+    def test_recompiled_after_ttl(self):
+        with self.settings(CLASSIFY_RULES_CACHE_TTL=300):
+            self.assertEqual(self.classify('order 1'), 'Orders')
+            # 其他进程的修改不会触发本进程的信号
+            CCEmailClassifyRule.objects.filter(id=self.rule.id).update(name='Renamed')
+            self.assertEqual(self.classify('order 1'), 'Orders')
+
+            RuleSetCache._built_at -= 301
+            self.assertEqual(self.classify('order 1'), 'Renamed')
+
+
+class ParallelModelClassificationTests(SimpleTestCase):
+    """并行模型分类在结果可以确定时立即返回，不等待较慢的模型"""
+
+    SLOW = 1.0
+
+    def make_context(self, fasttext, bert, **overrides):
+        tools = {'fasttext': fasttext, 'bert': bert, 'llm': ScriptedTool({}, default=('techsupport', 0.9))}
+        context = stub_context(tools=tools, **overrides)
+        agent = EmailClassificationAgent(categories=list(context.categories), tools=tools)
+        return dataclasses.replace(context, agent=agent)
+
+    def classify(self, context):
+        email = CCEmail(subject='parallel', sender='a@x.com', content='')
+        started = time.monotonic()
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='none'):
+            result = EmailClassifier._parallel_model_classification(email, context)
+        return result, time.monotonic() - started
+
+    def test_first_confident_model_returned_without_waiting(self):
+        slow = DelayedTool({'parallel': self.SLOW}, classification='festival')
+        context = self.make_context(DelayedTool({}, classification='purchase'), slow, require_both=False)
+
+        result, elapsed = self.classify(context)
+
+        self.assertEqual(result['classification'], 'purchase')
+        self.assertLess(elapsed, self.SLOW / 2)
+        # 较慢模型的结果被丢弃，也没有转入 LLM
+        self.assertEqual(context.tools['llm'].calls, [])
+
+    def test_failed_model_falls_back_to_llm_without_waiting(self):
+        slow = DelayedTool({'parallel': self.SLOW}, classification='festival')
+        context = self.make_context(slow, ScriptedTool({}), require_both=True)
+
+        result, elapsed = self.classify(context)
+
+        self.assertEqual(result['classification'], 'techsupport')
+        self.assertLess(elapsed, self.SLOW / 2)
+        self.assertEqual(context.tools['llm'].calls, [['parallel']])
+
+
+class RequestLoggingMiddlewareTests(SimpleTestCase):
+    """访问日志按模式和采样率输出结构化记录，正文按大小截断或跳过解析"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_request(self, request, response=None, random_value=0.99):
+        def view(request):
+            # 视图照常读取请求体
+            request.body
+            return response or JsonResponse({'emails': ['x' * 20] * 5})
+
+        with mock.patch('core.middleware.random.random', return_value=random_value):
+            return RequestLoggingMiddleware(view)(request)
+
+    def assert_logged(self, request, level='INFO', **kwargs):
+        with self.assertLogs('core.access', level='INFO') as logs:
+            self.run_request(request, **kwargs)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, level)
+        return logs.records[0].msg
+
+    def assert_not_logged(self, request, **kwargs):
+        with self.assertNoLogs('core.access', level='INFO'):
+            self.run_request(request, **kwargs)
+
+    def test_full_mode_record_fields(self):
+        request = self.factory.post('/api/emails/?page=2', data={'subject': 'order'}, content_type='application/json')
+        with self.settings(ACCESS_LOG_MODE='full', DEBUG=False):
+            record = self.assert_logged(request)
+
+        self.assertEqual(record['reason'], 'full')
+        self.assertEqual(record['request_method'], 'POST')
+        self.assertEqual(record['request_path'], '/api/emails/?page=2')
+        self.assertEqual(record['request_body'], {'subject': 'order'})
+        self.assertEqual(record['request_length'], len(b'{"subject": "order"}'))
+        self.assertEqual(record['response_status'], 200)
+        self.assertEqual(record['content_length'], len(json.dumps({'emails': ['x' * 20] * 5})))
+        self.assertIsInstance(record['duration_ms'], float)
+        self.assertNotIn('response_body', record)
+        self.assertNotIn('sample_rate', record)
+
+    def test_body_size_caps(self):
+        body = json.dumps({'content': 'x' * 100})
+        with self.settings(ACCESS_LOG_MODE='full', ACCESS_LOG_BODY_BYTES=16, ACCESS_LOG_PARSE_MAX_BYTES=1024, DEBUG=True):
+            record = self.assert_logged(self.factory.post('/api/', data=body, content_type='application/json'))
+        # 超过记录上限的正文截断为文本，不解析
+        self.assertEqual(record['request_body'], f'{body[:16]}...(truncated, {len(body)} bytes)')
+        self.assertTrue(record['response_body'].startswith('{"emails": ["xxx'))
+        self.assertTrue(record['response_body'].endswith(f'...(truncated, {record["content_length"]} bytes)'))
+
+        with self.settings(ACCESS_LOG_MODE='full', ACCESS_LOG_BODY_BYTES=16, ACCESS_LOG_PARSE_MAX_BYTES=64, DEBUG=True):
+            record = self.assert_logged(self.factory.post('/api/', data=body, content_type='application/json'))
+        # 超过解析阈值的正文不读取，只记录长度
+        self.assertIsNone(record['request_body'])
+        self.assertEqual(record['request_length'], len(body))
+        self.assertNotIn('response_body', record)
+
+    def test_sampling_and_modes(self):
+        request = self.factory.get('/api/')
+        with self.settings(ACCESS_LOG_MODE='sampled', ACCESS_LOG_SAMPLE_RATE=0.1, ACCESS_LOG_SLOW_MS=1000):
+            self.assert_not_logged(request, random_value=0.5)
+            record = self.assert_logged(request, random_value=0.05)
+            self.assertEqual((record['reason'], record['sample_rate']), ('sampled', 0.1))
+
+            # 错误总是输出，与采样无关
+            record = self.assert_logged(request, level='WARNING', response=HttpResponse(status=404))
+            self.assertEqual((record['reason'], record['response_status']), ('error', 404))
+            self.assert_logged(request, level='ERROR', response=HttpResponse(status=500))
+
+        with self.settings(ACCESS_LOG_MODE='errors', ACCESS_LOG_SLOW_MS=1000):
+            self.assert_not_logged(request, random_value=0.0)
+        with self.settings(ACCESS_LOG_MODE='errors', ACCESS_LOG_SLOW_MS=0):
+            self.assertEqual(self.assert_logged(request, level='WARNING')['reason'], 'slow')
+        with self.settings(ACCESS_LOG_MODE='off'):
+            self.assert_not_logged(request, response=HttpResponse(status=500))
+
+
+class IterClassifyEmailsTests(SimpleTestCase):
+    """流式分类按批次从输入中取邮件并逐批产出，拼接后的结果与 classify_emails 相同"""
+
+    SUBJECTS = ['order 1', 'fast', 'bert', 'order 2', 'llm', 'none', 'order 3']
+
+    def make_context(self):
+        tools = {
+            'fasttext': ScriptedTool({'fast': ('techsupport', 0.99)}),
+            'bert': ScriptedTool({'bert': ('festival', 0.95)}),
+            'llm': ScriptedTool({'llm': ('other', 0.9), 'none': ('festival', 0.3)}),
+        }
+        context = stub_context([ORDER_RULE], tools)
+        return dataclasses.replace(context, agent=EmailClassificationAgent(categories=list(context.categories), tools=tools))
+
+    def test_yields_per_chunk_and_matches_classify_emails(self):
+        emails = [CCEmail(id=i, subject=subject, sender='a@x.com', content='') for i, subject in enumerate(self.SUBJECTS)]
+        consumed = []
+
+        def lazy_emails():
+            for email in emails:
+                consumed.append(email.subject)
+                yield email
+
+        context = self.make_context()
+        with self.settings(CLASSIFICATION_CACHE_BACKEND='none', NEAR_DUPLICATE_ENABLED=False), \
+                mock.patch.object(ClassificationContext, 'build', return_value=context), \
+                mock.patch.object(RuleStatsRecorder, 'maybe_flush'):
+            stream = EmailClassifier.iter_classify_emails(lazy_emails(), 'stepgo', batch_size=3)
+            streamed = [next(stream)]
+            # 产出第一个结果时只取出了第一批
+            self.assertEqual(consumed, self.SUBJECTS[:3])
+            self.assertEqual(context.tools['fasttext'].calls, [['fast', 'bert']])
+            streamed.extend(stream)
+            # 第三批全部由规则解决，不调用模型
+            self.assertEqual(context.tools['fasttext'].calls, [['fast', 'bert'], ['llm', 'none']])
+
+            expected = EmailClassifier.classify_emails(emails, 'stepgo')
+
+        self.assertEqual([item['email'] for item in streamed], emails)
+        grouped = {}
+        for item in streamed:
+            grouped.setdefault(item['classification'], []).append(item)
+        self.assertEqual(grouped, expected)
+
+
+class BacktestRulesCommandTests(TestCase):
+    """backtest_rules 在已存储的邮件上对比当前规则集和候选规则集"""
+
+    # (主题, 当前 categories, classification_rule)
+    EMAILS = [
+        ('order 1', 'purchase', 'Orders'),
+        ('invoice 2', 'other', 'LLM Classification'),
+        ('order crash', 'purchase', 'Orders'),
+        ('hello', 'festival', 'LLM Classification'),
+        ('crash report', 'techsupport', 'bert'),
+    ]
+    CANDIDATE_RULES = [
+        {'name': 'Crashes', 'subject_keywords': ['crash'], 'classification': 'techsupport', 'priority': 1},
+        {'name': 'Invoices', 'subject_keywords': ['invoice'], 'classification': 'purchase', 'priority': 2},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        CCEmailClassifyRule.objects.create(**ORDER_RULE)
+        user_mail = CCUserMailInfo.objects.create(email='user@example.com', client_id='client', client_secret='secret')
+        CCEmail.objects.bulk_create([
+            CCEmail(user_mail=user_mail, message_id=f'message-{i}', subject=subject, sender='a@x.com',
+                    received_time=timezone.now(), content='', categories=categories, classification_rule=rule_name)
+            for i, (subject, categories, rule_name) in enumerate(cls.EMAILS)
+        ])
+
+    def backtest(self, *args):
+        out = StringIO()
+        call_command('backtest_rules', *args, '--workers', '1', '--chunk-size', '2', stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_report_counts(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            json.dump(self.CANDIDATE_RULES, f)
+        self.addCleanup(os.remove, f.name)
+
+        report = self.backtest('--rules-json', f.name)
+
+        self.assertEqual((report['emails'], report['current_rules'], report['candidate_rules']), (5, 1, 2))
+        self.assertEqual(report['rule_hits'], {'Crashes': 2, 'Invoices': 1})
+        self.assertEqual(report['reclassified'], 2)
+        self.assertEqual(report['category_shifts'], {'other -> purchase': 1, 'purchase -> techsupport': 1})
+        self.assertEqual(report['model_stage'], {'current': 3, 'candidate': 2, 'saved': 1, 'newly_resolved_by_rules': 2})
+        self.assertEqual(report['llm_calls'], {'observed_current': 2, 'saved': 1, 'llm_share_of_model_stage': 0.6667})
+
+    def test_inactive_rules_as_candidates(self):
+        CCEmailClassifyRule.objects.create(**dict(ORDER_RULE, name='Greetings', subject_keywords=['hello'],
+                                                  classification='festival', is_active=False))
+
+        report = self.backtest('--inactive', '--include-active')
+
+        self.assertEqual(report['rule_hits'], {'Orders': 2, 'Greetings': 1})
+        self.assertEqual(report['reclassified'], 0)
+        self.assertEqual(report['model_stage']['candidate'], 2)
@@ -15,7 +15,11 @@ from .views import (
     OutlookMailView,
     OutlookOAuthView,
     ChatView,
-    ClassifyEmailsView
+    ClassifyEmailsView,
+    RuleStatsView,
+    ClassificationCacheStatsView,
+    classify_stored_emails_async,
+    metrics_view
 )
 
 app_name = 'core'
@@ -50,6 +54,12 @@ urlpatterns = [
     
     # 邮件分类
     path('mail/classify/', ClassifyEmailsView.as_view(), name='classify_emails'),
+    path('mail/classify/rule-stats/', RuleStatsView.as_view(), name='classify_rule_stats'),
+    path('mail/classify/cache-stats/', ClassificationCacheStatsView.as_view(), name='classify_cache_stats'),
+    path('mail/classify/async/', classify_stored_emails_async, name='classify_emails_async'),
+
+    # Prometheus 指标
+    path('metrics', metrics_view, name='metrics'),
 
     # 聊天接口
     path('chat/', ChatView.as_view(), name='chat'),
@@ -29,6 +29,14 @@ from django.shortcuts import redirect
 from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import json
+import hmac
+import ipaddress
 
 # 获取logger
 logger = logging.getLogger('core')
@@ -41,12 +49,12 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
 
     def perform_create(self, serializer):
-        logger.info(f"Creating new user: {serializer.validated_data.get('username')}")
+        logger.info("Creating new user: %s", serializer.validated_data.get('username'))
         try:
             user = serializer.save()
-            logger.info(f"Successfully created user: {user.username}")
+            logger.info("Successfully created user: %s", user.username)
         except Exception as e:
-            logger.error(f"Error creating user: {str(e)}")
+            logger.error("Error creating user: %s", e)
             raise
 
 class UserDetailView(generics.RetrieveUpdateAPIView):
@@ -55,17 +63,17 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
-        logger.debug(f"Retrieving user details for: {self.request.user.username}")
+        logger.debug("Retrieving user details for: %s", self.request.user.username)
         return self.request.user
 
     def update(self, request, *args, **kwargs):
-        logger.info(f"Updating user details for: {request.user.username}")
+        logger.info("Updating user details for: %s", request.user.username)
         try:
             response = super().update(request, *args, **kwargs)
-            logger.info(f"Successfully updated user: {request.user.username}")
+            logger.info("Successfully updated user: %s", request.user.username)
             return response
         except Exception as e:
-            logger.error(f"Error updating user: {str(e)}")
+            logger.error("Error updating user: %s", e)
             raise
 
 class CCUserMailInfoViewSet(generics.GenericAPIView):
@@ -82,13 +90,13 @@ class CCUserMailInfoViewSet(generics.GenericAPIView):
 
     def post(self, request):
         """创建邮件信息"""
-        logger.info(f"Creating mail info with data: {request.data}")
+        logger.info("Creating mail info with data: %s", request.data)
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"Successfully created mail info for: {request.data.get('email')}")
+            logger.info("Successfully created mail info for: %s", request.data.get('email'))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        logger.error(f"Failed to create mail info: {serializer.errors}")
+        logger.error("Failed to create mail info: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class CCUserMailInfoDetailView(generics.GenericAPIView):
@@ -100,39 +108,39 @@ class CCUserMailInfoDetailView(generics.GenericAPIView):
         """获取单个邮件信息"""
         try:
             instance = self.get_queryset().get(pk=pk)
-            logger.debug(f"Retrieving mail info for id: {pk}")
+            logger.debug("Retrieving mail info for id: %s", pk)
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         except CCUserMailInfo.DoesNotExist:
-            logger.error(f"Mail info not found for id: {pk}")
+            logger.error("Mail info not found for id: %s", pk)
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
     def put(self, request, pk):
         """更新邮件信息"""
         try:
             instance = self.get_queryset().get(pk=pk)
-            logger.info(f"Updating mail info for id: {pk}")
+            logger.info("Updating mail info for id: %s", pk)
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
-                logger.info(f"Successfully updated mail info for id: {pk}")
+                logger.info("Successfully updated mail info for id: %s", pk)
                 return Response(serializer.data)
-            logger.error(f"Failed to update mail info: {serializer.errors}")
+            logger.error("Failed to update mail info: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except CCUserMailInfo.DoesNotExist:
-            logger.error(f"Mail info not found for id: {pk}")
+            logger.error("Mail info not found for id: %s", pk)
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
     def delete(self, request, pk):
         """删除邮件信息"""
         try:
             instance = self.get_queryset().get(pk=pk)
-            logger.info(f"Deleting mail info for id: {pk}")
+            logger.info("Deleting mail info for id: %s", pk)
             instance.delete()
-            logger.info(f"Successfully deleted mail info for id: {pk}")
+            logger.info("Successfully deleted mail info for id: %s", pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except CCUserMailInfo.DoesNotExist:
-            logger.error(f"Mail info not found for id: {pk}")
+            logger.error("Mail info not found for id: %s", pk)
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
 class LLMBaseView(generics.GenericAPIView):
@@ -174,7 +182,7 @@ class LLMCompletionView(LLMBaseView):
             response = llm.get_completion(prompt)
             return Response({'response': response})
         except Exception as e:
-            logger.error(f"Error getting completion: {str(e)}")
+            logger.error("Error getting completion: %s", e)
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -240,7 +248,7 @@ class OutlookMailView(APIView):
             return Response(serializer.data)
 
         except Exception as e:
-            logger.error(f"Error fetching emails: {str(e)}")
+            logger.error("Error fetching emails: %s", e)
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -308,13 +316,13 @@ class OutlookOAuthView(APIView):
                 f"{urlencode(auth_params)}"
             )
             
-            logger.info(f"生成授权 URL，参数: {auth_params}")
-            logger.debug(f"完整授权 URL: {auth_url}")
+            logger.info("生成授权 URL，参数: %s", auth_params)
+            logger.debug("完整授权 URL: %s", auth_url)
             
             return Response({'auth_url': auth_url})
             
         except Exception as e:
-            logger.error(f"生成授权 URL 时出错: {str(e)}", exc_info=True)
+            logger.error("生成授权 URL 时出错: %s", e, exc_info=True)
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -330,13 +338,13 @@ class OutlookOAuthView(APIView):
         """
         try:
             logger.info("收到 OAuth 回调")
-            logger.info(f"查询参数: {request.GET}")
+            logger.info("查询参数: %s", request.GET)
             
             # 检查是否有错误
             error = request.GET.get('error')
             error_description = request.GET.get('error_description')
             if error:
-                logger.error(f"OAuth 授权错误: {error} - {error_description}")
+                logger.error("OAuth 授权错误: %s - %s", error, error_description)
                 return Response({
                     'error': error,
                     'error_description': error_description
@@ -364,7 +372,7 @@ class OutlookOAuthView(APIView):
             try:
                 user_mail = CCUserMailInfo.objects.get(id=email_id)
             except CCUserMailInfo.DoesNotExist:
-                logger.error(f"未找到 ID 为 {email_id} 的邮箱配置")
+                logger.error("未找到 ID 为 %s 的邮箱配置", email_id)
                 return Response({
                     'error': 'email_not_found',
                     'error_description': '未找到邮箱配置'
@@ -394,12 +402,12 @@ class OutlookOAuthView(APIView):
             
             # 发送请求获取令牌
             token_response = requests.post(token_url, data=token_data)
-            logger.info(f"令牌响应状态: {token_response.status_code}")
+            logger.info("令牌响应状态: %s", token_response.status_code)
             
             if token_response.status_code == 200:
                 tokens = token_response.json()
                 logger.info("成功获取令牌")
-                logger.debug(f"令牌响应内容: {tokens.keys()}")  # 只记录键名，不记录敏感信息
+                logger.debug("令牌响应内容: %s", tokens.keys())  # 只记录键名，不记录敏感信息
                 
                 # 更新用户邮件配置
                 try:
@@ -409,9 +417,9 @@ class OutlookOAuthView(APIView):
                     user_mail.token_expires = timezone.now() + timedelta(seconds=tokens['expires_in'])
                     user_mail.save(update_fields=['access_token', 'refresh_token', 'token_expires'])
                     
-                    logger.info(f"成功更新 {user_mail.email} 的令牌")
+                    logger.info("成功更新 %s 的令牌", user_mail.email)
                 except Exception as e:
-                    logger.error(f"保存令牌时出错: {str(e)}")
+                    logger.error("保存令牌时出错: %s", e)
                     return Response({
                         'error': 'token_save_error',
                         'error_description': '保存令牌时出错'
@@ -422,11 +430,11 @@ class OutlookOAuthView(APIView):
                 if not redirect_url.endswith('/'):
                     redirect_url += '/'
                 redirect_url += "chat?menu=mail-config&auth_success=true"
-                logger.info(f"重定向到: {redirect_url}")
+                logger.info("重定向到: %s", redirect_url)
                 
                 return redirect(redirect_url)
             else:
-                logger.error(f"令牌请求失败: {token_response.text}")
+                logger.error("令牌请求失败: %s", token_response.text)
                 try:
                     error_data = token_response.json()
                     error_description = error_data.get('error_description', token_response.text)
@@ -439,7 +447,7 @@ class OutlookOAuthView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
         except Exception as e:
-            logger.error(f"处理 OAuth 回调时出错: {str(e)}", exc_info=True)
+            logger.error("处理 OAuth 回调时出错: %s", e, exc_info=True)
             return Response({
                 'error': 'server_error',
                 'error_description': str(e)
@@ -459,7 +467,7 @@ class OutlookOAuthView(APIView):
             )
             return response.json() if response.status_code == 200 else None
         except Exception as e:
-            logger.error(f"获取用户信息时出错: {str(e)}")
+            logger.error("获取用户信息时出错: %s", e)
             return None
 
 class ClassifyEmailsView(APIView):
@@ -482,22 +490,22 @@ class ClassifyEmailsView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
-            logger.info(f"开始处理邮件分类请求，邮箱: {email}, 方法: {method}, 时间范围: {hours}小时, 启用转发: {enable_forwarding}")
+            logger.info("开始处理邮件分类请求，邮箱: %s, 方法: %s, 时间范围: %s小时, 启用转发: %s", email, method, hours, enable_forwarding)
             
             # 获取用户邮件配置
             user_mail = CCUserMailInfo.objects.filter(email=email, is_active=True).first()
             if not user_mail:
-                logger.error(f"未找到邮箱配置: {email}")
+                logger.error("未找到邮箱配置: %s", email)
                 return Response(
                     {'error': 'Email configuration not found'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
             # 1. 从 Outlook 获取邮件
-            logger.info(f"开始从 Outlook 获取 {email} 的邮件")
+            logger.info("开始从 Outlook 获取 %s 的邮件", email)
             mail_service = OutlookMailService(user_mail)
             emails = mail_service.fetch_emails(hours=hours)
-            logger.info(f"成功获取 {len(emails)} 封邮件")
+            logger.info("成功获取 %s 封邮件", len(emails))
             
             if not emails:
                 logger.info("没有新邮件需要分类")
@@ -507,74 +515,53 @@ class ClassifyEmailsView(APIView):
                     'classified_count': 0
                 })
 
-            # 2. 对邮件进行分类
-            logger.info(f"开始使用 {method} 方法对邮件进行分类")
+            # 2. 对邮件进行分类：流式逐封产出结果，分批保存和转发
+            logger.info("开始使用 %s 方法对邮件进行分类", method)
             from core.services.email_classifier import EmailClassifier
-            results = EmailClassifier.classify_emails(emails, method=method)
             
-            # 3. 统计分类结果
-            total_classified = 0
-            classification_stats = {}
-            
-            for classification, emails_data in results.items():
-                classification_stats[classification] = len(emails_data)
-                total_classified += len(emails_data)
-                
-                # 更新邮件分类
-                for data in emails_data:
-                    # 获取邮件对象
-                    if 'email' in data:
-                        email_obj = data['email']
-                        email_obj.categories = classification
-                        
-                        # 保存分类详情
-                        email_obj.classification_method = method
-                        
-                        # 保存置信度（如果有）
-                        if 'confidence' in data:
-                            email_obj.classification_confidence = data['confidence']
-                        
-                        # 保存分类理由
-                        if 'explanation' in data:
-                            email_obj.classification_reason = data['explanation']
-                        
-                        # 保存匹配规则（如果有）
-                        if 'rule_name' in data:
-                            email_obj.classification_rule = data['rule_name']
-                        
-                        # 更新字段列表
-                        update_fields = [
-                            'categories', 
-                            'classification_method', 
-                            'classification_confidence', 
-                            'classification_reason', 
-                            'classification_rule'
-                        ]
-                        
-                        email_obj.save(update_fields=update_fields)
-                        logger.debug(f"邮件 '{email_obj.subject[:30]}...' 分类为 '{classification}'，方法: {method}")
-                    else:
-                        logger.warning(f"邮件数据中缺少 'email' 字段: {data}")
-            
-            logger.info(f"分类完成，共分类 {total_classified} 封邮件")
-            
-            # 4. 如果启用了转发，处理邮件转发
             forwarding_results = []
-            if enable_forwarding and total_classified > 0:
-                logger.info("开始处理邮件转发")
+            graph_service = None
+            if enable_forwarding:
+                logger.info("分类后逐封处理邮件转发")
                 from core.services.email_forwarding import EmailForwardingService
                 from core.services.graph_service import GraphService
                 
                 # 创建 Graph API 服务
                 graph_service = GraphService(user_mail)
+            
+            # 3. 统计分类结果，每 CLASSIFY_PERSIST_BATCH_SIZE 封邮件批量保存一次并转发
+            total_classified = 0
+            classification_stats = {}
+            batch_size = getattr(settings, 'CLASSIFY_PERSIST_BATCH_SIZE', 200)
+            
+            def flush(pending):
+                # 更新邮件分类
+                EmailClassifier.persist_results(pending, method, batch_size=batch_size)
                 
-                # 处理邮件转发
-                forwarding_results = EmailForwardingService.process_classified_emails(
-                    classification_results=results,
-                    graph_service=graph_service
-                )
+                # 4. 如果启用了转发，处理邮件转发
+                if graph_service is not None:
+                    for data in pending:
+                        forwarding_results.extend(
+                            EmailForwardingService.forward_classified_email(data['classification'], data, graph_service)
+                        )
+            
+            pending = []
+            for data in EmailClassifier.iter_classify_emails(emails, method=method):
+                classification = data['classification']
+                classification_stats[classification] = classification_stats.get(classification, 0) + 1
+                total_classified += 1
+                logger.debug("邮件 '%.30s...' 分类为 '%s'，方法: %s", data['subject'], classification, method)
                 
-                logger.info(f"邮件转发完成，共转发 {len(forwarding_results)} 封邮件")
+                pending.append(data)
+                if len(pending) >= batch_size:
+                    flush(pending)
+                    pending = []
+            if pending:
+                flush(pending)
+            
+            logger.info("分类完成，共分类 %s 封邮件", total_classified)
+            if graph_service is not None:
+                logger.info("邮件转发完成，共转发 %s 封邮件", len(forwarding_results))
             
             return Response({
                 'status': 'success',
@@ -586,12 +573,140 @@ class ClassifyEmailsView(APIView):
             })
 
         except Exception as e:
-            logger.error(f"邮件分类过程中出错: {str(e)}", exc_info=True)
+            logger.error("邮件分类过程中出错: %s", e, exc_info=True)
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class RuleStatsView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        """
+        获取分类规则的命中统计
+        """
+        try:
+            from core.models import CCEmailClassifyRule
+            from core.services.rule_engine import RuleSetCache
+            from core.services.rule_stats import RuleStatsRecorder
+
+            # 先写入内存中尚未刷新的统计
+            RuleStatsRecorder.flush(RuleSetCache.get_rule_set())
+
+            rules = CCEmailClassifyRule.objects.select_related('hit_stat').order_by('priority', 'id')
+            data = []
+            for rule in rules:
+                stat = getattr(rule, 'hit_stat', None)
+                evaluations = stat.evaluations if stat else 0
+                data.append({
+                    'id': rule.id,
+                    'name': rule.name,
+                    'classification': rule.classification,
+                    'priority': rule.priority,
+                    'is_active': rule.is_active,
+                    'evaluations': evaluations,
+                    'hits': stat.hits if stat else 0,
+                    'hit_rate': stat.hit_rate if stat else 0.0,
+                    'avg_eval_time_ms': stat.total_eval_time_ms / evaluations if evaluations else 0.0,
+                    'last_hit_at': stat.last_hit_at if stat else None,
+                })
+            return Response(data)
+
+        except Exception as e:
+            logger.error("获取规则命中统计时出错: %s", e, exc_info=True)
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class ClassificationCacheStatsView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        """
+        获取模型分类结果缓存的命中统计
+        """
+        from core.services.classification_cache import ClassificationCache
+        return Response(ClassificationCache.stats())
+
+def _metrics_client_allowed(remote_addr: str) -> bool:
+    """客户端地址是否属于 METRICS_ALLOWED_NETWORKS"""
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in getattr(settings, 'METRICS_ALLOWED_NETWORKS', ['127.0.0.0/8', '::1/128'])
+    )
+
+def metrics_view(request):
+    """
+    以 Prometheus 文本格式输出分类流水线的指标
+    
+    METRICS_ENABLED 为 False 时返回 404；配置了 METRICS_TOKEN 时要求 Authorization: Bearer <token>，
+    便于 Prometheus 抓取（不使用用户的 JWT）；未配置时只允许 METRICS_ALLOWED_NETWORKS 中的客户端地址。
+    """
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        return HttpResponse(status=404)
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return HttpResponse(status=401)
+    elif not _metrics_client_allowed(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponse(status=403)
+    
+    from core.metrics import REGISTRY
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@csrf_exempt
+@require_POST
+async def classify_stored_emails_async(request):
+    """
+    异步分类数据库中尚未分类的邮件（不从 Outlook 拉取，也不转发）
+    
+    DRF 的 APIView 不支持异步处理，因此这里是原生 Django 异步视图，手动进行 JWT 认证。
+    请求体: {"method": "stepgo", "hours": 2, "limit": 500}
+    """
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except Exception:
+        auth = None
+    if auth is None:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+        method = payload.get('method', 'stepgo')
+        hours = payload.get('hours')
+        limit = int(payload.get('limit', 500))
+
+        queryset = CCEmail.objects.filter(categories='').order_by('-received_time')
+        if hours:
+            queryset = queryset.filter(received_time__gte=timezone.now() - timedelta(hours=float(hours)))
+        emails = [email async for email in queryset[:limit]]
+        if not emails:
+            return JsonResponse({'status': 'success', 'message': '没有需要分类的邮件', 'classified_count': 0})
+
+        from core.services.email_classifier import EmailClassifier
+        results = await EmailClassifier.aclassify_emails(emails, method=method)
+
+        await sync_to_async(EmailClassifier.persist_results)(
+            [data for emails_data in results.values() for data in emails_data], method
+        )
+        classification_stats = {classification: len(items) for classification, items in results.items()}
+        return JsonResponse({
+            'status': 'success',
+            'message': f'成功分类 {len(emails)} 封邮件',
+            'classified_count': len(emails),
+            'classification_stats': classification_stats,
+        })
+
+    except Exception as e:
+        logger.error("异步邮件分类过程中出错: %s", e, exc_info=True)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class ChatView(APIView):
     """
     Chat API endpoint